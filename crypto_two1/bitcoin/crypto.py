@@ -10,6 +10,7 @@ from mnemonic.mnemonic import Mnemonic
 import random
 from crypto_two1.bitcoin.utils import bytes_to_str
 from crypto_two1.bitcoin.utils import address_to_key_hash
+from crypto_two1.bitcoin.utils import key_hash_to_address
 from crypto_two1.bitcoin.utils import rand_bytes
 from crypto_two1.crypto.ecdsa_base import Point
 from crypto_two1.crypto.ecdsa import ECPointAffine
@@ -724,8 +725,8 @@ class PublicKey(PublicKeyBase):
             bytes: Base58Check encoded string
         """
         # Put the version byte in front, 0x00 for Mainnet, 0x6F for testnet
-        version = bytes([self.TESTNET_VERSION]) if testnet else bytes([self.MAINNET_VERSION])
-        return base58.b58encode_check(version + self.hash160(compressed))
+        version = self.TESTNET_VERSION if testnet else self.MAINNET_VERSION
+        return key_hash_to_address(self.hash160(compressed), version)
 
     def verify(self, message, signature, do_hash=True):
         """ Verifies that message was appropriately signed.
@@ -3,7 +3,6 @@ Bitcoin opcodes. At the simplest level, it can read in the raw bytes of a
 Bitcoin script, parse it, and determine what type of script it is (P2PKH, P2SH,
 multi-sig, etc). It also provides capabilities for building more complex
 scripts programmatically."""
-import base58
 import copy
 import re
 import struct
@@ -396,8 +395,8 @@ class Script(object):
             bytes: Base58Check encoded string
         """
         rv = ""
-        prefix = bytes([self.P2SH_TESTNET_VERSION if testnet else self.P2SH_MAINNET_VERSION])
-        rv = base58.b58encode_check(prefix + self.hash160())
+        prefix = self.P2SH_TESTNET_VERSION if testnet else self.P2SH_MAINNET_VERSION
+        rv = key_hash_to_address(self.hash160(), prefix)
 
         return rv
 
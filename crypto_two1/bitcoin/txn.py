@@ -507,6 +507,69 @@ class Transaction(object):
 
         return sig, msg_to_sign
 
+    def get_sighashes(self, sub_scripts, hash_type=None):
+        """ Returns the messages to sign for several inputs at once.
+
+        For SIG_HASH_ALL the serialization of the transaction is built
+        once and only the script of the input being signed is swapped
+        in for each message, instead of deep-copying the transaction
+        for every input. Other hash types fall back to
+        get_signature_for_input()'s method. The results are identical
+        to those computed by get_signature_for_input().
+
+        Args:
+            sub_scripts (dict): Keys are input indices, values are the
+                sub_script (see sign_input()) of each input.
+            hash_type (int): What kind of signature hash to do.
+                Defaults to SIG_HASH_ALL.
+
+        Returns:
+            dict: Keys are input indices, values are the messages (bytes)
+                to sign.
+        """
+        if hash_type is None:
+            hash_type = self.SIG_HASH_ALL
+
+        for i in sub_scripts:
+            if i < 0 or i >= len(self.inputs):
+                raise ValueError("Invalid input index.")
+
+        if hash_type != self.SIG_HASH_ALL:
+            rv = {}
+            for i, sub_script in sub_scripts.items():
+                tmp_script = sub_script.remove_op("OP_CODESEPARATOR")
+                if hash_type & 0x1f == self.SIG_HASH_SINGLE and len(self.inputs) > len(self.outputs):
+                    rv[i] = 0x1.to_bytes(32, 'little')
+                else:
+                    txn_copy = self._copy_for_sig(i, hash_type, tmp_script)
+                    rv[i] = bytes(Hash.dhash(bytes(txn_copy) + pack_u32(hash_type)))
+            return rv
+
+        empty_script = pack_var_str(b'')
+        prefixes = []
+        blanks = []
+        for inp in self.inputs:
+            prefix = bytes(inp.outpoint) + pack_u32(inp.outpoint_index)
+            suffix = pack_u32(inp.sequence_num)
+            prefixes.append((prefix, suffix))
+            blanks.append(prefix + empty_script + suffix)
+
+        head = pack_u32(self.version) + pack_compact_int(self.num_inputs)
+        tail = pack_compact_int(self.num_outputs) + \
+            b''.join([bytes(o) for o in self.outputs]) + \
+            pack_u32(self.lock_time) + pack_u32(hash_type)
+
+        rv = {}
+        for i, sub_script in sub_scripts.items():
+            tmp_script = sub_script.remove_op("OP_CODESEPARATOR")
+            prefix, suffix = prefixes[i]
+            rv[i] = bytes(Hash.dhash(b''.join(
+                [head] + blanks[:i] +
+                [prefix + pack_var_str(bytes(tmp_script)) + suffix] +
+                blanks[i + 1:] + [tail])))
+
+        return rv
+
     def sign_input(self, input_index, hash_type, private_key, sub_script):
         """ Signs an input.
 
@@ -1,8 +1,8 @@
 """This submodule provides functions for accomplishing common tasks encountered
 in creating and parsing Bitcoin objects, like turning difficulties into targets
 or deserializing and serializing various kinds of packed byte formats."""
-import base58
 import codecs
+import functools
 import hashlib
 import random
 import struct
@@ -10,6 +10,17 @@ import os
 
 MAX_TARGET = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
 
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+B58_INDEX = {c: i for i, c in enumerate(B58_ALPHABET)}
+# All 2-digit base58 strings, so that digits can be produced in pairs.
+B58_PAIRS = [a + b for a in B58_ALPHABET for b in B58_ALPHABET]
+# Largest power of 58 that fits in 64 bits, used to peel off
+# 10 base58 digits per big-integer division.
+B58_CHUNK = 58 ** 10
+
+# Number of address <-> hash160 conversions memoized in each direction.
+ADDRESS_CACHE_SIZE = 65536
+
 
 def rand_bytes(n, secure=True):
     """ Returns n random bytes.
@@ -286,10 +297,84 @@ def difficulty_to_bits(difficulty):
     return target_to_bits(difficulty_to_target(difficulty))
 
 
+def b58encode_check(b):
+    """ Base58Check encodes bytes.
+
+    Args:
+        b (bytes): The payload, including any version prefix.
+
+    Returns:
+        str: The Base58Check encoded string.
+    """
+    data = b + hashlib.sha256(hashlib.sha256(b).digest()).digest()[:4]
+    n = int.from_bytes(data, 'big')
+
+    pairs = B58_PAIRS
+    chunks = []
+    while n:
+        n, c = divmod(n, B58_CHUNK)
+        c, r1 = divmod(c, 3364)
+        c, r2 = divmod(c, 3364)
+        c, r3 = divmod(c, 3364)
+        r5, r4 = divmod(c, 3364)
+        chunks.append(pairs[r5] + pairs[r4] + pairs[r3] + pairs[r2] + pairs[r1])
+    # The most significant chunk is zero-padded to 10 digits.
+    encoded = "".join(reversed(chunks)).lstrip("1")
+
+    pad = len(data) - len(data.lstrip(b'\x00'))
+    return "1" * pad + encoded
+
+
+def b58decode_check(s):
+    """ Decodes a Base58Check encoded string.
+
+    Args:
+        s (str or bytes): The Base58Check encoded string.
+
+    Returns:
+        bytes: The payload, including any version prefix.
+
+    Raises:
+        ValueError: If s contains invalid characters or the checksum
+            doesn't match.
+    """
+    if isinstance(s, bytes):
+        s = s.decode('ascii')
+
+    n = 0
+    try:
+        for c in s:
+            n = n * 58 + B58_INDEX[c]
+    except KeyError as e:
+        raise ValueError("Invalid base58 character: %r" % e.args[0])
+
+    pad = len(s) - len(s.lstrip("1"))
+    data = b'\x00' * pad + n.to_bytes((n.bit_length() + 7) // 8, 'big')
+    payload, checksum = data[:-4], data[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise ValueError("Invalid checksum")
+
+    return payload
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _decode_address(s):
+    n = b58decode_check(s)
+    return n[0], n[1:]
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _encode_address(payload):
+    return b58encode_check(payload)
+
+
 def address_to_key_hash(s):
     """ Given a Bitcoin address decodes the version and
     RIPEMD-160 hash of the public key.
 
+    Results are memoized, so repeated conversions of the same address
+    are cheap.
+
     Args:
         s (bytes): The Bitcoin address to decode
 
@@ -297,10 +382,9 @@ def address_to_key_hash(s):
         (version, h160) (tuple): A tuple containing the version and
         RIPEMD-160 hash of the public key.
     """
-    n = base58.b58decode_check(s)
-    version = n[0]
-    h160 = n[1:]
-    return version, h160
+    if isinstance(s, bytes):
+        s = s.decode('ascii')
+    return _decode_address(s)
 
 
 def key_hash_to_address(hash160, version=0x0):
@@ -312,6 +396,10 @@ def key_hash_to_address(hash160, version=0x0):
 
     Returns:
         (bitcoin address): base58 encoded bitcoin address
+
+    Note:
+        Results are memoized, so repeated conversions of the same
+        hash160 are cheap.
     """
     if isinstance(hash160, str):
         # if 0x in string, strip it
@@ -322,7 +410,7 @@ def key_hash_to_address(hash160, version=0x0):
     elif isinstance(hash160, bytes):
         h160 = hash160
 
-    address = base58.b58encode_check(bytes([version]) + h160)
+    address = _encode_address(bytes([version]) + h160)
     return address
 
 
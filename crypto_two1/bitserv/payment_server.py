@@ -437,23 +437,30 @@ class PaymentServer:
         if not payment_channels:
             return
 
+        # Skip sync if channel is closed
+        payment_channels = [pc for pc in payment_channels if pc.state != ChannelSQLite3.CLOSED]
+
+        # Look up deposit confirmations and spends in batches
+        deposit_txids = [pc.deposit_txid for pc in payment_channels if pc.state == ChannelSQLite3.CONFIRMING]
+        confirmed = self._check_confirmed_many(deposit_txids) if deposit_txids else {}
+
+        outpoints = {}
         for pc in payment_channels:
+            if pc.state in (ChannelSQLite3.CONFIRMING, ChannelSQLite3.READY) and pc.payment_tx:
+                redeem_script = PaymentChannelRedeemScript.from_bytes(pc.payment_tx.inputs[0].script[-1])
+                deposit_tx_utxo_index = pc.deposit_tx.output_index_for_address(redeem_script.hash160())
+                outpoints[pc.deposit_txid] = (pc.deposit_txid, deposit_tx_utxo_index)
+        spend_txids = self._lookup_spend_txids(list(outpoints.values())) if outpoints else {}
 
-            # Skip sync if channel is closed
-            if pc.state == ChannelSQLite3.CLOSED:
-                continue
+        for pc in payment_channels:
 
             # Check for deposit confirmation
-            if pc.state == ChannelSQLite3.CONFIRMING and self._blockchain.check_confirmed(pc.deposit_txid):
+            if pc.state == ChannelSQLite3.CONFIRMING and confirmed[pc.deposit_txid]:
                 self._db.pc.update_state(pc.deposit_txid, ChannelSQLite3.READY)
 
             # Check if channel got closed
-            if pc.state in (ChannelSQLite3.CONFIRMING, ChannelSQLite3.READY) and pc.payment_tx:
-                redeem_script = PaymentChannelRedeemScript.from_bytes(pc.payment_tx.inputs[0].script[-1])
-                deposit_tx_utxo_index = pc.deposit_tx.output_index_for_address(redeem_script.hash160())
-                spend_txid = self._blockchain.lookup_spend_txid(pc.deposit_txid, deposit_tx_utxo_index)
-                if spend_txid:
-                    self._db.pc.update_state(pc.deposit_txid, ChannelSQLite3.CLOSED)
+            if pc.deposit_txid in outpoints and spend_txids[outpoints[pc.deposit_txid]]:
+                self._db.pc.update_state(pc.deposit_txid, ChannelSQLite3.CLOSED)
 
             # Check for channel expiration
             if pc.state != ChannelSQLite3.CLOSED:
@@ -464,6 +471,20 @@ class PaymentServer:
                     self._db.pc.update_payment(pc.deposit_txid, pc.payment_tx, pc.last_payment_amount)
                     self._db.pc.update_state(pc.deposit_txid, ChannelSQLite3.CLOSED)
 
+    def _check_confirmed_many(self, txids):
+        """Check which transactions are confirmed, in one batch if the
+        blockchain supports it and one at a time otherwise."""
+        if hasattr(self._blockchain, 'check_confirmed_many'):
+            return self._blockchain.check_confirmed_many(txids)
+        return {txid: self._blockchain.check_confirmed(txid) for txid in txids}
+
+    def _lookup_spend_txids(self, outpoints):
+        """Look up the transactions that spent outputs, in one batch if the
+        blockchain supports it and one at a time otherwise."""
+        if hasattr(self._blockchain, 'lookup_spend_txids'):
+            return self._blockchain.lookup_spend_txids(outpoints)
+        return {outpoint: self._blockchain.lookup_spend_txid(*outpoint) for outpoint in outpoints}
+
     def _auto_sync(self, timeout, stop_event):
         """Lightweight thread for automatic channel syncs."""
         while not stop_event.is_set():
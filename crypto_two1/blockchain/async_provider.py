@@ -0,0 +1,249 @@
+"""This submodule provides an abstract base class for providers with an
+asyncio interface, along with adapters that turn a synchronous provider
+into an asynchronous one and vice versa."""
+import asyncio
+import concurrent.futures
+import threading
+
+from crypto_two1.blockchain.base_provider import BaseProvider
+
+
+class AsyncBaseProvider(object):
+    """ Abstract base class for any providers of blockchain data with
+        an asyncio interface. The methods are coroutine versions of
+        those of BaseProvider, so many lookups can be in flight on a
+        single event loop.
+    """
+
+    def __init__(self):
+        self.can_limit_by_height = False
+
+    async def get_balance(self, address_list):
+        """ Provides the balance for each address.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+
+        Returns:
+            dict: A dict keyed by address with each value being a
+                dict containing the confirmed and total balances.
+        """
+        raise NotImplementedError
+
+    async def get_transactions(self, address_list, limit=100):
+        """ Provides transactions associated with each address in address_list.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+            limit (int): Maximum number of transactions to return.
+
+        Returns:
+            dict: A dict keyed by address with each value being a list
+                of Transaction objects.
+        """
+        raise NotImplementedError
+
+    async def get_transactions_by_id(self, ids):
+        """ Gets transactions by their IDs.
+
+        Args:
+            ids (list(str)): List of TXIDs to retrieve.
+
+        Returns:
+            dict: A dict keyed by TXID of Transaction objects.
+        """
+        raise NotImplementedError
+
+    async def get_utxos(self, address_list):
+        """ Provides all unspent transactions associated with each
+        address in address_list.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+
+        Returns:
+            dict: A dict keyed by address with each value being a list
+                of UnspentTransactionOutput objects.
+        """
+        raise NotImplementedError
+
+    async def broadcast_transaction(self, transaction):
+        """ Broadcasts a transaction to the Bitcoin network
+
+        Args:
+            transaction (bytes or str): serialized, signed transaction
+
+        Returns:
+            str: The transaction ID
+        """
+        raise NotImplementedError
+
+    async def get_block_height(self):
+        """ Returns the latest block height
+
+        Returns:
+            int: Block height
+        """
+        raise NotImplementedError
+
+
+class SyncToAsyncProvider(AsyncBaseProvider):
+    """ Makes a synchronous provider asynchronous by running its
+        methods in a pool of threads.
+
+    Args:
+        provider (BaseProvider): The provider to wrap.
+        max_workers (int): Maximum number of calls to the provider
+            running at once. Further calls wait for a free thread.
+    """
+    DEFAULT_MAX_WORKERS = 8
+
+    def __init__(self, provider, max_workers=DEFAULT_MAX_WORKERS):
+        self.provider = provider
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    @property
+    def can_limit_by_height(self):
+        # Taken from the wrapped provider, which is why __init__()
+        # doesn't call the base class.
+        return self.provider.can_limit_by_height
+
+    @property
+    def testnet(self):
+        """ Returns whether or not the data provider is on testnet."""
+        return self.provider.testnet
+
+    @testnet.setter
+    def testnet(self, v):
+        self.provider.testnet = v
+
+    async def _call(self, method, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: getattr(self.provider, method)(*args, **kwargs))
+
+    async def get_balance(self, *args, **kwargs):
+        return await self._call("get_balance", *args, **kwargs)
+
+    async def get_transactions(self, *args, **kwargs):
+        return await self._call("get_transactions", *args, **kwargs)
+
+    async def get_transactions_by_id(self, *args, **kwargs):
+        return await self._call("get_transactions_by_id", *args, **kwargs)
+
+    async def get_utxos(self, *args, **kwargs):
+        return await self._call("get_utxos", *args, **kwargs)
+
+    async def broadcast_transaction(self, *args, **kwargs):
+        return await self._call("broadcast_transaction", *args, **kwargs)
+
+    async def get_block_height(self):
+        return await self._call("get_block_height")
+
+    def close(self):
+        """ Shuts down the thread pool.
+        """
+        self._executor.shutdown(wait=True)
+
+
+class AsyncToSyncProvider(BaseProvider):
+    """ Makes an asynchronous provider synchronous by running its
+        coroutines on an event loop in a background thread.
+
+        The methods can be called from any thread, including one that
+        runs an event loop of its own, and from several threads at
+        once: the lookups all run concurrently on the one background
+        loop.
+
+    Args:
+        provider (AsyncBaseProvider): The provider to wrap.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def can_limit_by_height(self):
+        # Taken from the wrapped provider, which is why __init__()
+        # doesn't call the base class.
+        return self.provider.can_limit_by_height
+
+    @property
+    def testnet(self):
+        """ Returns whether or not the data provider is on testnet."""
+        return self.provider.testnet
+
+    @testnet.setter
+    def testnet(self, v):
+        self.provider.testnet = v
+
+    def _call(self, method, *args, **kwargs):
+        coro = getattr(self.provider, method)(*args, **kwargs)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def get_balance(self, *args, **kwargs):
+        return self._call("get_balance", *args, **kwargs)
+
+    def get_transactions(self, *args, **kwargs):
+        return self._call("get_transactions", *args, **kwargs)
+
+    def get_transactions_by_id(self, *args, **kwargs):
+        return self._call("get_transactions_by_id", *args, **kwargs)
+
+    def get_utxos(self, *args, **kwargs):
+        return self._call("get_utxos", *args, **kwargs)
+
+    def broadcast_transaction(self, *args, **kwargs):
+        return self._call("broadcast_transaction", *args, **kwargs)
+
+    def get_block_height(self):
+        return self._call("get_block_height")
+
+    def close(self):
+        """ Stops the background event loop.
+        """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def to_async(provider, **kwargs):
+    """ Returns an asynchronous version of a provider.
+
+    Args:
+        provider (BaseProvider or AsyncBaseProvider): The provider.
+        kwargs: Passed on to SyncToAsyncProvider.
+
+    Returns:
+        AsyncBaseProvider: provider itself if it is already
+            asynchronous, otherwise an adapter for it.
+    """
+    if isinstance(provider, AsyncBaseProvider):
+        return provider
+    if isinstance(provider, AsyncToSyncProvider):
+        return provider.provider
+    return SyncToAsyncProvider(provider, **kwargs)
+
+
+def to_sync(provider):
+    """ Returns a synchronous version of a provider.
+
+    Args:
+        provider (BaseProvider or AsyncBaseProvider): The provider.
+
+    Returns:
+        BaseProvider: provider itself if it is already synchronous,
+            otherwise an adapter for it.
+    """
+    if isinstance(provider, SyncToAsyncProvider):
+        return provider.provider
+    if isinstance(provider, AsyncBaseProvider):
+        return AsyncToSyncProvider(provider)
+    return provider
@@ -2,16 +2,50 @@
 provides information about the blockchain and broadcasts transactions by
 contacting a server. It is possible to put this "server" on the same local
 machine if desired or to keep it remote to save space."""
+import concurrent.futures
 
 
 class BaseProvider(object):
     """ Abstract base class for any providers of blockchain
         data.
     """
+    # Maximum number of concurrent requests made by _map()
+    max_workers = 1
 
     def __init__(self):
         self.can_limit_by_height = False
 
+    def _map(self, func, items):
+        """ Calls func on each item, concurrently if there are several.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            func (callable): Function taking a single item.
+            items (list): Items to call func on.
+
+        Returns:
+            list: The results, in the same order as items.
+
+        Raises:
+            Exception: The first exception raised by func, in the
+                order of items. Calls that haven't started are
+                cancelled.
+        """
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [func(i) for i in items]
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(items))) as executor:
+            futures = [executor.submit(func, i) for i in items]
+            try:
+                return [f.result() for f in futures]
+            except:
+                for f in futures:
+                    f.cancel()
+                raise
+
     def get_balance(self, address_list):
         """ Provides the balance for each address.
 
@@ -44,6 +78,56 @@ class BaseProvider(object):
         """
         raise NotImplementedError
 
+    def iter_wallet_transactions(self, address_list, limit=100, min_block=None):
+        """ Yields the transactions associated with the addresses in
+        address_list as WalletTransaction objects with their metadata
+        set, so that they can be handed to a wallet's cache as they
+        arrive.
+
+        Providers that can decode their responses incrementally
+        override this. By default, all the transactions are looked up
+        with get_transactions() first.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+            limit (int): Maximum number of transactions to return.
+            min_block (int): Block height from which to start getting
+                transactions. Ignored if the provider can't limit by
+                height.
+
+        Yields:
+            tuple: A WalletTransaction and the set of addresses in
+                address_list it is associated with. The same
+                transaction may be yielded more than once, for
+                different addresses.
+        """
+        # Imported here since the wallet package imports the providers
+        from crypto_two1.wallet.wallet_txn import WalletTransaction
+
+        if self.can_limit_by_height:
+            txns = self.get_transactions(address_list, limit=limit, min_block=min_block)
+        else:
+            txns = self.get_transactions(address_list, limit=limit)
+
+        wallet_txns = {}
+        for addr in address_list:
+            if addr not in txns:
+                continue
+            for t in txns[addr]:
+                txid = str(t['transaction'].hash)
+                if txid not in wallet_txns:
+                    wt = WalletTransaction.from_transaction(t['transaction'])
+                    wt.block = t['metadata']['block']
+                    wt.block_hash = t['metadata']['block_hash']
+                    wt.confirmations = t['metadata']['confirmations']
+                    if 'network_time' in t['metadata']:
+                        wt.network_time = t['metadata']['network_time']
+                    wallet_txns[txid] = (wt, set())
+                wallet_txns[txid][1].add(addr)
+
+        yield from wallet_txns.values()
+
     def get_transactions_by_id(self, ids):
         """ Gets transactions by their IDs.
 
@@ -0,0 +1,318 @@
+"""This submodule provides a `CachingProvider` class that keeps the
+results of another provider in a local sqlite3 database so they don't
+have to be fetched again."""
+import json
+from collections import defaultdict
+import os
+import sqlite3
+import threading
+import time
+
+from crypto_two1.blockchain.base_provider import BaseProvider
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.txn import Transaction
+
+
+class CachingProvider(BaseProvider):
+    """ Caches the results of another provider.
+
+        Transactions with at least min_confirmations confirmations
+        can't change any more, so they are kept until the cache is
+        full, with their number of confirmations worked out from the
+        block height. Less confirmed transactions and the transactions
+        of each address are kept for ttl seconds, and the block height
+        for block_height_ttl seconds. When there are more than max_txns
+        transactions, the least recently used ones are evicted.
+
+        The cache is stored in a sqlite3 database so it can be kept
+        across runs and shared by several providers, e.g. a wallet's
+        and the payment channels'.
+
+    Args:
+        provider (BaseProvider): The provider to cache.
+        db_path (str): Path to the database file. It is created if it
+            does not exist. ":memory:" keeps the cache in memory.
+        min_confirmations (int): Number of confirmations after which
+            a transaction is kept without expiring.
+        ttl (float): Seconds to keep other results for.
+        block_height_ttl (float): Seconds to keep the block height for.
+        max_txns (int): Maximum number of transactions to keep.
+    """
+    DEFAULT_MIN_CONFIRMATIONS = 6
+    DEFAULT_TTL = 60
+    DEFAULT_BLOCK_HEIGHT_TTL = 10
+    DEFAULT_MAX_TXNS = 100000
+
+    def __init__(self, provider, db_path=":memory:",
+                 min_confirmations=DEFAULT_MIN_CONFIRMATIONS,
+                 ttl=DEFAULT_TTL,
+                 block_height_ttl=DEFAULT_BLOCK_HEIGHT_TTL,
+                 max_txns=DEFAULT_MAX_TXNS):
+        self.provider = provider
+        self.db_path = db_path
+        self.min_confirmations = min_confirmations
+        self.ttl = ttl
+        self.block_height_ttl = block_height_ttl
+        self.max_txns = max_txns
+
+        self._block_height = None
+        self._block_height_time = 0
+        self._lock = threading.RLock()
+
+        if db_path != ":memory:" and not os.path.exists(db_path):
+            os.close(os.open(db_path, flags=os.O_WRONLY | os.O_CREAT,
+                             mode=0o700))
+
+        self._conn = sqlite3.connect(db_path, timeout=30,
+                                     check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "txns ("
+                               "txid VARCHAR(64) NOT NULL PRIMARY KEY, "
+                               "txn BLOB NOT NULL, "
+                               "block INTEGER, "
+                               "block_hash BLOB, "
+                               "confirmations INTEGER, "
+                               "network_time INTEGER, "
+                               "fetched FLOAT NOT NULL, "
+                               "permanent INTEGER NOT NULL, "
+                               "used FLOAT NOT NULL"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "address_txns ("
+                               "address VARCHAR NOT NULL, "
+                               "lim INTEGER NOT NULL, "
+                               "min_block INTEGER NOT NULL, "
+                               "txids VARCHAR NOT NULL, "
+                               "fetched FLOAT NOT NULL, "
+                               "PRIMARY KEY (address, lim, min_block)"
+                               ");")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS "
+                               "txns_used ON txns (used);")
+
+    @property
+    def testnet(self):
+        """ Returns whether or not the data provider is on testnet."""
+        return self.provider.testnet
+
+    @testnet.setter
+    def testnet(self, v):
+        self.provider.testnet = v
+
+    @property
+    def can_limit_by_height(self):
+        return self.provider.can_limit_by_height
+
+    def _read_txns(self, txids):
+        """ Returns the unexpired cached transactions among txids.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Returns:
+            dict: A dict keyed by txid of dicts with 'metadata' and
+                'transaction' keys, as returned by
+                get_transactions_by_id().
+        """
+        now = time.time()
+        rows = []
+        for i in range(0, len(txids), 500):
+            chunk = txids[i:i + 500]
+            cur = self._conn.execute(
+                "SELECT txid, txn, block, block_hash, confirmations, network_time, "
+                "fetched, permanent FROM txns WHERE txid IN (%s)" % ",".join("?" * len(chunk)),
+                chunk)
+            rows += cur.fetchall()
+
+        rows = [r for r in rows if r[7] or now - r[6] < self.ttl]
+        if not rows:
+            return {}
+
+        height = None
+        if any(r[7] for r in rows):
+            height = self.get_block_height()
+
+        ret = {}
+        for txid, txn, block, block_hash, confirmations, network_time, _, permanent in rows:
+            if permanent and height is not None:
+                confirmations = max(confirmations, height - block + 1)
+            txn, _ = Transaction.from_bytes(txn)
+            metadata = dict(block=block,
+                            block_hash=Hash(block_hash) if block_hash is not None else None,
+                            network_time=network_time,
+                            confirmations=confirmations)
+            ret[txid] = dict(metadata=metadata, transaction=txn)
+
+        with self._conn:
+            self._conn.executemany("UPDATE txns SET used=? WHERE txid=?",
+                                   [(now, txid) for txid in ret])
+
+        return ret
+
+    def _write_txns(self, txns):
+        """ Stores transactions and evicts the least recently used ones
+            if there are too many.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txns (dict): A dict keyed by txid of dicts with 'metadata'
+                and 'transaction' keys.
+        """
+        now = time.time()
+        rows = []
+        for txid, t in txns.items():
+            m = t['metadata']
+            block_hash = bytes(m['block_hash']) if m['block_hash'] is not None else None
+            permanent = m['block'] is not None and \
+                (m['confirmations'] or 0) >= self.min_confirmations
+            rows.append((txid, bytes(t['transaction']), m['block'], block_hash,
+                         m['confirmations'], m['network_time'], now, int(permanent), now))
+
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO txns VALUES (?,?,?,?,?,?,?,?,?)",
+                                   rows)
+            self._conn.execute("DELETE FROM txns WHERE permanent=0 AND fetched<?",
+                               (now - self.ttl,))
+            self._conn.execute("DELETE FROM address_txns WHERE fetched<?",
+                               (now - self.ttl,))
+
+            num_txns = self._conn.execute("SELECT COUNT(*) FROM txns").fetchone()[0]
+            if num_txns > self.max_txns:
+                self._conn.execute("DELETE FROM txns WHERE txid IN "
+                                   "(SELECT txid FROM txns ORDER BY used LIMIT ?)",
+                                   (num_txns - self.max_txns,))
+
+    def get_transactions(self, address_list, limit=100, min_block=None):
+        """ Provides transactions associated with each address in address_list.
+
+            The transactions of addresses looked up less than ttl
+            seconds ago with the same limit and min_block are returned
+            from the cache. The rest are fetched from the provider in a
+            single call.
+
+        Args:
+            address_list (list): List of Base58Check encoded Bitcoin
+                addresses.
+            limit (int): Maximum number of transactions to return.
+            min_block (int): Block height from which to start getting
+                transactions. If None, will get transactions from the
+                entire blockchain.
+
+        Returns:
+            dict: A dict keyed by address with each value being a list of
+            Transaction objects.
+        """
+        min_block = min_block or 0
+        now = time.time()
+        ret = {}
+        with self._lock:
+            cached = {}
+            for i in range(0, len(address_list), 500):
+                chunk = address_list[i:i + 500]
+                cur = self._conn.execute(
+                    "SELECT address, txids FROM address_txns "
+                    "WHERE lim=? AND min_block=? AND fetched>=? AND address IN (%s)" %
+                    ",".join("?" * len(chunk)),
+                    [limit, min_block, now - self.ttl] + chunk)
+                cached.update((a, json.loads(txids)) for a, txids in cur.fetchall())
+
+            txns = self._read_txns(list(set(txid for txids in cached.values() for txid in txids)))
+            for addr, txids in cached.items():
+                # Some of the transactions may have been evicted
+                if all(txid in txns for txid in txids):
+                    ret[addr] = [txns[txid] for txid in txids]
+
+        missing = [a for a in address_list if a not in ret]
+        if missing:
+            fetched = self.provider.get_transactions(missing, limit, min_block or None)
+            with self._lock:
+                self._write_txns({str(t['transaction'].hash): t
+                                  for txns in fetched.values()
+                                  for t in txns})
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO address_txns VALUES (?,?,?,?,?)",
+                        [(a, limit, min_block,
+                          json.dumps([str(t['transaction'].hash) for t in fetched.get(a, [])]),
+                          time.time())
+                         for a in missing])
+            for a in missing:
+                if fetched.get(a):
+                    ret[a] = fetched[a]
+
+        return defaultdict(list, {a: ret[a] for a in address_list if ret.get(a)})
+
+    def get_transactions_by_id(self, ids):
+        """ Gets transactions by their IDs. Only the ones that aren't
+            cached are fetched from the provider.
+
+        Args:
+            ids (list): List of TXIDs to retrieve.
+
+        Returns:
+            dict: A dict keyed by TXID of Transaction objects.
+        """
+        ids = list(ids)
+        with self._lock:
+            ret = self._read_txns(ids)
+
+        missing = [txid for txid in ids if txid not in ret]
+        if missing:
+            fetched = self.provider.get_transactions_by_id(missing)
+            with self._lock:
+                self._write_txns(fetched)
+            ret.update(fetched)
+
+        return {txid: ret[txid] for txid in ids if txid in ret}
+
+    def get_block_height(self):
+        """ Returns the latest block height. The height is cached for
+            block_height_ttl seconds.
+
+        Returns:
+            int: Block height
+        """
+        with self._lock:
+            if self._block_height is None or \
+               time.time() - self._block_height_time >= self.block_height_ttl:
+                self._block_height = self.provider.get_block_height()
+                self._block_height_time = time.time()
+
+            return self._block_height
+
+    def get_balance(self, address_list):
+        """ Provides the balance for each address. This is not cached.
+        """
+        return self.provider.get_balance(address_list)
+
+    def get_utxos(self, address_list):
+        """ Provides all unspent transactions associated with each
+            address in address_list. This is not cached.
+        """
+        return self.provider.get_utxos(address_list)
+
+    def broadcast_transaction(self, transaction):
+        """ Broadcasts a transaction to the Bitcoin network
+
+            The cached transactions of all addresses are dropped since
+            the transaction may involve any of them.
+
+        Args:
+            transaction (bytes or str): serialized, signed transaction
+
+        Returns:
+            str: The transaction ID
+        """
+        txid = self.provider.broadcast_transaction(transaction)
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM address_txns")
+
+        return txid
+
+    def close(self):
+        """ Closes the underlying database connection.
+        """
+        self._conn.close()
@@ -7,5 +7,13 @@ class DataProviderUnavailableError(requests.ConnectionError):
 
 
 class DataProviderError(Exception):
-    """Raised when a data provider encounters an exception."""
-    pass
+    """Raised when a data provider encounters an exception.
+
+    Args:
+        status_code (int): The HTTP status code of the response that
+            caused the error, if any.
+    """
+
+    def __init__(self, *args, status_code=None):
+        super().__init__(*args)
+        self.status_code = status_code
@@ -1,6 +1,8 @@
 """This submodule provides a concrete `InsightProvider` class that provides
 information about a blockchain by contacting a server."""
 import decimal
+import threading
+import time
 
 from urllib.parse import urljoin
 
@@ -25,12 +27,24 @@ class InsightProvider(BaseProvider):
             testnet (bool, optional): True for testnet, False for
             mainnet (default)
             connection_pool_size (int): Number of connections to pool.
+                If 0, one per worker.
+            max_workers (int): Maximum number of concurrent requests.
+            block_height_ttl (float): Seconds the block height is
+                cached for.
     """
     DEFAULT_HOST = "https://insight.bitpay.com"
+    DEFAULT_MAX_WORKERS = 8
+    DEFAULT_BLOCK_HEIGHT_TTL = 10
+    # Maximum number of addresses in one request
+    ADDRESS_CHUNK_SIZE = 199
+    # Number of transactions in one page of results
+    PAGE_SIZE = 100
 
     def __init__(self, insight_host_name=DEFAULT_HOST, insight_api_path="api",
                  testnet=False,
-                 connection_pool_size=0):
+                 connection_pool_size=0,
+                 max_workers=DEFAULT_MAX_WORKERS,
+                 block_height_ttl=DEFAULT_BLOCK_HEIGHT_TTL):
         if insight_host_name is None:
             insight_host_name = self.DEFAULT_HOST
         if insight_api_path is None:
@@ -40,7 +54,13 @@ class InsightProvider(BaseProvider):
         self.testnet = testnet
         self.auth = None
         self._session = None
+        self._session_lock = threading.Lock()
         self._pool_size = connection_pool_size
+        self.max_workers = max_workers
+        self.block_height_ttl = block_height_ttl
+        self._block_height = None
+        self._block_height_time = 0
+        self._block_height_lock = threading.Lock()
         self.can_limit_by_height = True
 
     @property
@@ -59,13 +79,15 @@ class InsightProvider(BaseProvider):
 
     def _create_session(self):
         import requests
-        self._session = requests.Session()
-        if self._pool_size > 0:
-            adapter = requests.adapters.HTTPAdapter(pool_connections=self._pool_size,
-                                                    pool_maxsize=self._pool_size)
-            self._session.mount('http://', adapter)
-            self._session.mount('https://', adapter)
-        self._session.auth = self.auth
+        session = requests.Session()
+        # Each concurrent request needs its own pooled connection
+        pool_size = self._pool_size or max(self.max_workers, 1)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.auth = self.auth
+        self._session = session
 
     @staticmethod
     def txn_from_json(txn_json):
@@ -166,8 +188,9 @@ class InsightProvider(BaseProvider):
 
     def _request(self, method, path, **kwargs):
         import requests
-        if self._session is None:
-            self._create_session()
+        with self._session_lock:
+            if self._session is None:
+                self._create_session()
 
         url = self.server_url + path
         result = None
@@ -221,40 +244,41 @@ class InsightProvider(BaseProvider):
             dict: A dict keyed by address with each value being a list of
             Transaction objects.
         """
-        last_block_index = self.get_block_height()
-        ret = defaultdict(list)
-        total_items = limit
-        for addresses in self._list_chunks(address_list, 199):
-            fr = 0
-            to = min(100, limit)
-
-            while fr < total_items:
-                req = "addrs/" + ",".join(addresses) + \
-                      "/txs?from=%d&to=%d" % (fr, to)
+        def get_page(args):
+            addresses, fr = args
+            to = fr + self.PAGE_SIZE if fr else min(self.PAGE_SIZE, limit)
+            req = "addrs/" + ",".join(addresses) + \
+                  "/txs?from=%d&to=%d" % (fr, to)
+            return self._request("GET", req).json()
 
-                r = self._request("GET", req)
-                txn_data = r.json()
-
-                if "totalItems" in txn_data:
-                    total_items = txn_data["totalItems"]
+        last_block_index = self.get_block_height()
+        chunks = list(self._list_chunks(address_list, self.ADDRESS_CHUNK_SIZE))
+
+        # The first page of each chunk gives the total number of
+        # transactions, after which all remaining pages can be
+        # requested at once.
+        first_pages = self._map(get_page, [(addresses, 0) for addresses in chunks])
+        rest = []
+        for addresses, page in zip(chunks, first_pages):
+            total_items = page.get("totalItems", limit)
+            rest += [(addresses, fr)
+                     for fr in range(page["to"], total_items, self.PAGE_SIZE)]
+        rest_pages = iter(self._map(get_page, rest))
 
-                fr = txn_data["to"]
-                to = fr + 100
+        ret = defaultdict(list)
+        for addresses, page in zip(chunks, first_pages):
+            pages = [page]
+            total_items = page.get("totalItems", limit)
+            pages += [next(rest_pages)
+                      for _ in range(page["to"], total_items, self.PAGE_SIZE)]
 
+            for txn_data in pages:
                 for data in txn_data['items']:
                     if "vin" not in data or "vout" not in data:
                         continue
-                    block_hash = None
-                    block = None
-                    if data['confirmations'] > 0:
-                        block = last_block_index - data['confirmations'] + 1
-                        block_hash = Hash(data['blockhash'])
-
-                    metadata = dict(block=block,
-                                    block_hash=block_hash,
-                                    network_time=data.get("time", None),
-                                    confirmations=data['confirmations'])
+                    metadata = self._txn_metadata(data, last_block_index)
 
+                    block = metadata['block']
                     if min_block and block:
                         if block < min_block:
                             continue
@@ -276,34 +300,47 @@ class InsightProvider(BaseProvider):
         Returns:
             dict: A dict keyed by TXID of Transaction objects.
         """
-        last_block_index = self.get_block_height()
-        ret = {}
-        for txid in ids:
+        def get_txn(txid):
             r = self._request("GET", "tx/%s" % txid)
             data = r.json()
 
-            if r.status_code == 200:
-                if "vin" not in data or "vout" not in data:
-                    continue
-                block_hash = None
-                block = None
-                if data['confirmations'] > 0:
-                    block = last_block_index - data['confirmations'] + 1
-                    block_hash = Hash(data['blockhash'])
+            if "vin" not in data or "vout" not in data:
+                return None
 
-                metadata = dict(block=block,
-                                block_hash=block_hash,
-                                network_time=data['time'],
-                                confirmations=data['confirmations'])
+            metadata = self._txn_metadata(data, last_block_index)
+            txn, _ = self.txn_from_json(data)
+            assert str(txn.hash) == txid
 
-                txn, _ = self.txn_from_json(data)
-                assert str(txn.hash) == txid
+            return dict(metadata=metadata,
+                        transaction=txn)
 
-                ret[txid] = dict(metadata=metadata,
-                                 transaction=txn)
+        last_block_index = self.get_block_height()
+        ids = list(ids)
+        ret = {}
+        for txid, txn in zip(ids, self._map(get_txn, ids)):
+            if txn is not None:
+                ret[txid] = txn
 
         return ret
 
+    @staticmethod
+    def _txn_metadata(data, last_block_index):
+        """ Returns the metadata of a transaction returned by the server.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        block_hash = None
+        block = None
+        if data['confirmations'] > 0:
+            block = last_block_index - data['confirmations'] + 1
+            block_hash = Hash(data['blockhash'])
+
+        return dict(block=block,
+                    block_hash=block_hash,
+                    network_time=data.get("time", None),
+                    confirmations=data['confirmations'])
+
     def broadcast_transaction(self, transaction):
         """ Broadcasts a transaction to the Bitcoin network
 
@@ -340,16 +377,24 @@ class InsightProvider(BaseProvider):
                 "Unexpected response: %r" % r.status_code)
 
     def get_block_height(self):
-        """ Returns the latest block height
+        """ Returns the latest block height. The height is cached for
+            block_height_ttl seconds.
 
         Returns:
             int: Block height
         """
-        r = self._request("GET", "status")
+        with self._block_height_lock:
+            if self._block_height is not None and \
+               time.time() - self._block_height_time < self.block_height_ttl:
+                return self._block_height
 
-        ret = None
-        if r.status_code == 200:
-            data = r.json()
-            ret = data['info']['blocks']
+            r = self._request("GET", "status")
 
-        return ret
+            ret = None
+            if r.status_code == 200:
+                data = r.json()
+                ret = data['info']['blocks']
+                self._block_height = ret
+                self._block_height_time = time.time()
+
+            return ret
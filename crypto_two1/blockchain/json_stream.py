@@ -0,0 +1,123 @@
+"""This submodule provides `iter_json_array()`, which decodes a JSON
+array one element at a time as its text arrives, e.g. from a streamed
+HTTP response, instead of reading and decoding the whole document at
+once."""
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters that can end a number
+_NUMBER_DELIMITERS = " \t\n\r,]"
+
+_decoder = json.JSONDecoder()
+
+# Parser states
+_START = 0
+_FIRST_VALUE = 1
+_VALUE = 2
+_SEPARATOR = 3
+_END = 4
+
+
+def iter_json_array(chunks):
+    """ Decodes a JSON array incrementally, yielding each element as
+        soon as all of its text has been read.
+
+        Only the text of the element being decoded is buffered, so the
+        memory needed doesn't depend on the number of elements.
+
+    Args:
+        chunks (iterable): The JSON document in pieces of bytes
+            (UTF-8 encoded) or str, split anywhere.
+
+    Yields:
+        The decoded elements, in order.
+
+    Raises:
+        ValueError: If the document isn't a JSON array or is
+            truncated. Elements before the error are still yielded.
+    """
+    chunks = iter(chunks)
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    eof = False
+    state = _START
+
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                break
+            buf, pos = "", 0
+            buf, eof = _read(chunks, utf8, buf, 1)
+            continue
+
+        if state == _START:
+            if buf[pos] != "[":
+                raise ValueError("Expecting a JSON array at position %d" % pos)
+            pos += 1
+            state = _FIRST_VALUE
+        elif state == _SEPARATOR or (state == _FIRST_VALUE and buf[pos] == "]"):
+            if buf[pos] == "]":
+                state = _END
+            elif buf[pos] == ",":
+                state = _VALUE
+            else:
+                raise ValueError("Expecting ',' or ']' at position %d" % pos)
+            pos += 1
+        elif state == _END:
+            raise ValueError("Extra data after the JSON array at position %d" % pos)
+        else:
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                value, end = None, None
+
+            # A value that reaches the end of what has been read, or
+            # a number followed by something other than a delimiter,
+            # may go on in the next chunk.
+            if not eof and (end is None or end == len(buf) or
+                            (isinstance(value, (int, float)) and
+                             not isinstance(value, bool) and
+                             buf[end] not in _NUMBER_DELIMITERS)):
+                # Read until the buffer doubles so that a long value
+                # isn't decoded again for every chunk.
+                buf, pos = buf[pos:], 0
+                buf, eof = _read(chunks, utf8, buf, len(buf))
+                continue
+
+            yield value
+            pos = end
+            state = _SEPARATOR
+
+    if state != _END:
+        raise ValueError("Truncated JSON array")
+
+
+def _read(chunks, utf8, buf, size):
+    """ Appends chunks to buf until at least size characters have been
+        added or there are no more.
+
+    Note:
+        THIS IS NOT A PUBLIC API.
+
+    Returns:
+        tuple: The new buffer and whether all chunks have been read.
+    """
+    target = len(buf) + size
+    pieces = [buf]
+    length = len(buf)
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk)
+        pieces.append(chunk)
+        length += len(chunk)
+        if length >= target:
+            return "".join(pieces), False
+
+    pieces.append(utf8.decode(b"", final=True))
+    return "".join(pieces), True
@@ -0,0 +1,512 @@
+"""This submodule provides a `LocalIndexProvider` class that answers
+queries from blocks stored on the local machine instead of contacting a
+server."""
+import os
+from collections import defaultdict
+from collections import OrderedDict
+import sqlite3
+import struct
+import threading
+
+from crypto_two1.blockchain.base_provider import BaseProvider
+from crypto_two1.bitcoin.block import Block
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import CoinbaseInput
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import UnspentTransactionOutput
+
+
+class LocalIndexProvider(BaseProvider):
+    """ Transaction data provider using an index of local block data.
+
+        Blocks are ingested from bitcoind-style blk*.dat files (each
+        block preceded by the network magic and its size) or from a
+        directory of files that each hold one serialized block. The
+        index is a sqlite3 database mapping addresses to txids and
+        outpoints to the transactions spending them, so queries run at
+        disk speed.
+
+        The index follows the longest chain of the blocks ingested,
+        by number of blocks: blocks on a fork are held, and the indexed
+        chain is switched to the fork if it becomes longer. Blocks
+        whose parent hasn't been seen yet wait for it. Mempool
+        transactions aren't known, so nothing is ever unconfirmed and
+        transactions can't be broadcast.
+
+    Args:
+        index_path (str): Path to the index database. It is created if
+            it does not exist.
+        testnet (bool): Whether the blocks are testnet blocks. This
+            determines how addresses are encoded in the index.
+    """
+    MAINNET_MAGIC = b"\xf9\xbe\xb4\xd9"
+    TESTNET_MAGIC = b"\x0b\x11\x09\x07"
+    # Number of most recently indexed blocks kept by ingest_blocks()
+    # so that they can be indexed again if the chain switches to a
+    # fork and back
+    MAX_REORG_DEPTH = 100
+
+    def __init__(self, index_path, testnet=False):
+        super().__init__()
+        self.index_path = index_path
+        self.testnet = testnet
+        self.can_limit_by_height = True
+        self._lock = threading.Lock()
+
+        if index_path != ":memory:" and not os.path.exists(index_path):
+            os.close(os.open(index_path, flags=os.O_WRONLY | os.O_CREAT,
+                             mode=0o700))
+
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "blocks ("
+                               "height INTEGER NOT NULL PRIMARY KEY, "
+                               "hash BLOB NOT NULL UNIQUE, "
+                               "time INTEGER NOT NULL"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "txns ("
+                               "txid VARCHAR(64) NOT NULL PRIMARY KEY, "
+                               "height INTEGER NOT NULL, "
+                               "txn BLOB NOT NULL"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "outputs ("
+                               "txid VARCHAR(64) NOT NULL, "
+                               "idx INTEGER NOT NULL, "
+                               "address VARCHAR, "
+                               "value INTEGER NOT NULL, "
+                               "script BLOB NOT NULL, "
+                               "height INTEGER NOT NULL, "
+                               "PRIMARY KEY (txid, idx)"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "spends ("
+                               "prev_txid VARCHAR(64) NOT NULL, "
+                               "prev_idx INTEGER NOT NULL, "
+                               "txid VARCHAR(64) NOT NULL, "
+                               "PRIMARY KEY (prev_txid, prev_idx)"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "address_txns ("
+                               "address VARCHAR NOT NULL, "
+                               "txid VARCHAR(64) NOT NULL, "
+                               "height INTEGER NOT NULL, "
+                               "PRIMARY KEY (address, txid)"
+                               ");")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS "
+                               "outputs_address ON outputs (address);")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS "
+                               "address_txns_height ON address_txns (address, height);")
+
+    @staticmethod
+    def read_block_file(path, magic=None):
+        """ Returns a generator over the serialized blocks in a blk*.dat
+            file.
+
+        Args:
+            path (str): Path to the file.
+            magic (bytes): The network magic. If None, either the
+                mainnet or testnet magic is accepted.
+
+        Yields:
+            bytes: A serialized block.
+        """
+        magics = [magic] if magic is not None else \
+            [LocalIndexProvider.MAINNET_MAGIC, LocalIndexProvider.TESTNET_MAGIC]
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        pos = 0
+        while pos + 8 <= len(data):
+            m = data[pos:pos + 4]
+            if m == b"\x00\x00\x00\x00":
+                # The rest of the file is preallocated space
+                break
+            if m not in magics:
+                raise ValueError("Bad magic %s at offset %d of %s" % (m.hex(), pos, path))
+            size, = struct.unpack("<I", data[pos + 4:pos + 8])
+            yield data[pos + 8:pos + 8 + size]
+            pos += 8 + size
+
+    def ingest(self, path, start_height=None):
+        """ Indexes blocks from a blk*.dat file or a directory.
+
+            A directory may hold blk*.dat files and/or files that each
+            hold one serialized block. Files are read in name order.
+
+        Args:
+            path (str): Path to the file or directory.
+            start_height (int): Height of the first block if the index
+                is empty and that block isn't the genesis block.
+
+        Returns:
+            int: The number of blocks indexed.
+        """
+        if os.path.isdir(path):
+            blocks = self._iter_directory(path)
+        else:
+            blocks = self.read_block_file(path)
+
+        return self.ingest_blocks(blocks, start_height)
+
+    def _iter_directory(self, path):
+        for name in sorted(os.listdir(path)):
+            p = os.path.join(path, name)
+            if not os.path.isfile(p):
+                continue
+            if name.startswith("blk") and name.endswith(".dat"):
+                yield from self.read_block_file(p)
+            else:
+                with open(p, 'rb') as f:
+                    yield f.read()
+
+    def ingest_blocks(self, blocks, start_height=None):
+        """ Indexes blocks.
+
+            Since block files aren't in chain order, a block whose
+            parent hasn't been indexed yet is held until the parent
+            turns up later in blocks. A block on a fork of the indexed
+            chain is held as well, and once the fork is longer than the
+            indexed chain, the blocks after the fork point are removed
+            from the index and the fork is indexed instead. Between
+            branches of equal length, the first one seen is kept.
+            Blocks whose parent never turns up are ignored.
+
+            Blocks removed from the index are held to be indexed again
+            if they were among the last MAX_REORG_DEPTH blocks indexed
+            by the same call. Otherwise they have to be passed again.
+
+        Args:
+            blocks (iterable): Serialized blocks (bytes) or Block
+                objects.
+            start_height (int): Height of the first block if the index
+                is empty and that block isn't the genesis block.
+
+        Returns:
+            int: The number of blocks indexed, including blocks indexed
+                again after a switch back to their branch.
+        """
+        num_indexed = 0
+        # Blocks that aren't indexed, keyed by their hash, and the
+        # hashes of their children, keyed by the parent's hash
+        pending = {}
+        children = defaultdict(list)
+        # Recently indexed blocks, in case they are removed again
+        recent = OrderedDict()
+        with self._lock:
+            with self._conn:
+                tip = self._conn.execute(
+                    "SELECT height, hash FROM blocks ORDER BY height DESC LIMIT 1").fetchone()
+
+                for b in blocks:
+                    block = Block.from_bytes(b)[0] if isinstance(b, bytes) else b
+                    block_hash = bytes(block.hash)
+                    prev_hash = bytes(block.block_header.prev_block_hash)
+
+                    if tip is None:
+                        if start_height is None and prev_hash != bytes(32):
+                            raise ValueError(
+                                "start_height is needed to index from a block other than genesis.")
+                        fork_height = (start_height or 0) - 1
+                        branch = [block_hash]
+                        pending[block_hash] = block
+                    else:
+                        if block_hash in pending or self._block_height(block_hash) is not None:
+                            continue
+                        pending[block_hash] = block
+                        children[prev_hash].append(block_hash)
+
+                        # Find where the branch ending with this block
+                        # joins the indexed chain, if it does.
+                        branch = [block_hash]
+                        h = prev_hash
+                        while h in pending:
+                            branch.append(h)
+                            h = bytes(pending[h].block_header.prev_block_hash)
+                        fork_height = self._block_height(h)
+                        if fork_height is None:
+                            continue
+                        branch.reverse()
+                        branch += self._longest_branch(block_hash, pending, children)
+
+                        if fork_height + len(branch) <= tip[0]:
+                            continue
+
+                        # Switch to the longer branch
+                        if fork_height < tip[0]:
+                            removed = self._conn.execute(
+                                "SELECT hash FROM blocks WHERE height > ? ORDER BY height",
+                                (fork_height,)).fetchall()
+                            for (h,) in removed:
+                                if h in recent:
+                                    pending[h] = recent.pop(h)
+                                    children[bytes(pending[h].block_header.prev_block_hash)].append(h)
+                            self._unindex_blocks(fork_height)
+
+                    for height, h in enumerate(branch, fork_height + 1):
+                        recent[h] = pending.pop(h)
+                        self._index_block(recent[h], height)
+                        num_indexed += 1
+                        if len(recent) > self.MAX_REORG_DEPTH:
+                            recent.popitem(last=False)
+                    tip = (fork_height + len(branch), branch[-1])
+
+        return num_indexed
+
+    def _block_height(self, block_hash):
+        # Private, returns the height of an indexed block or None
+        row = self._conn.execute("SELECT height FROM blocks WHERE hash=?",
+                                 (block_hash,)).fetchone()
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def _longest_branch(block_hash, pending, children):
+        """ Returns the hashes of the longest chain of held blocks
+            descending from a block, in order. Between chains of equal
+            length, the one whose blocks were seen first is returned.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        parents = {}
+        level = [block_hash]
+        while True:
+            next_level = []
+            for h in level:
+                for c in children.get(h, ()):
+                    if c in pending and c not in parents:
+                        parents[c] = h
+                        next_level.append(c)
+            if not next_level:
+                break
+            level = next_level
+
+        branch = []
+        h = level[0]
+        while h != block_hash:
+            branch.append(h)
+            h = parents[h]
+        branch.reverse()
+        return branch
+
+    def _unindex_blocks(self, height):
+        """ Removes the blocks above height from the index.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        self._conn.execute("DELETE FROM spends WHERE txid IN "
+                           "(SELECT txid FROM txns WHERE height > ?)", (height,))
+        for table in ("blocks", "txns", "outputs", "address_txns"):
+            self._conn.execute("DELETE FROM %s WHERE height > ?" % table, (height,))
+
+    def _index_block(self, block, height):
+        """ Adds a block's transactions to the index.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        self._conn.execute("INSERT INTO blocks VALUES (?,?,?)",
+                           (height, bytes(block.hash), block.block_header.time))
+
+        for txn in block.txns:
+            txid = str(txn.hash)
+            addresses = set()
+
+            outputs = []
+            for i, o in enumerate(txn.outputs):
+                addr = self._first_address(o.script)
+                if addr is not None:
+                    addresses.add(addr)
+                outputs.append((txid, i, addr, o.value, bytes(o.script), height))
+            self._conn.executemany("INSERT OR REPLACE INTO outputs VALUES (?,?,?,?,?,?)",
+                                   outputs)
+
+            spends = []
+            for inp in txn.inputs:
+                if isinstance(inp, CoinbaseInput):
+                    continue
+                prev_txid = str(inp.outpoint)
+                spends.append((prev_txid, inp.outpoint_index, txid))
+
+                row = self._conn.execute("SELECT address FROM outputs WHERE txid=? AND idx=?",
+                                         (prev_txid, inp.outpoint_index)).fetchone()
+                addr = row[0] if row is not None else self._first_address(inp.script)
+                if addr is not None:
+                    addresses.add(addr)
+            self._conn.executemany("INSERT OR REPLACE INTO spends VALUES (?,?,?)", spends)
+
+            self._conn.execute("INSERT OR REPLACE INTO txns VALUES (?,?,?)",
+                               (txid, height, bytes(txn)))
+            self._conn.executemany("INSERT OR REPLACE INTO address_txns VALUES (?,?,?)",
+                                   [(a, txid, height) for a in addresses])
+
+    def _first_address(self, script):
+        # Private, returns the first address in a script or None for
+        # non-standard scripts.
+        try:
+            addrs = script.get_addresses(self.testnet)
+        except Exception:
+            return None
+        return addrs[0] if addrs else None
+
+    def _metadata(self, height, tip):
+        # Private, builds the metadata dict returned with transactions
+        block_hash, block_time = self._conn.execute(
+            "SELECT hash, time FROM blocks WHERE height=?", (height,)).fetchone()
+        return dict(block=height,
+                    block_hash=Hash(block_hash),
+                    network_time=block_time,
+                    confirmations=tip - height + 1)
+
+    def get_block_height(self):
+        """ Returns the height of the last indexed block.
+
+        Returns:
+            int: Block height, or None if the index is empty.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT MAX(height) FROM blocks").fetchone()[0]
+
+    def get_transactions(self, address_list, limit=100, min_block=None):
+        """ Provides transactions associated with each address in address_list.
+
+        Args:
+            address_list (list): List of Base58Check encoded Bitcoin
+                addresses.
+            limit (int): Maximum number of transactions to return for
+                each address. The most recent ones are returned.
+            min_block (int): Block height from which to start getting
+                transactions. If None, will get transactions from the
+                entire blockchain.
+
+        Returns:
+            dict: A dict keyed by address with each value being a list of
+            Transaction objects.
+        """
+        tip = self.get_block_height()
+        ret = defaultdict(list)
+        txns = {}
+        with self._lock:
+            for addr in address_list:
+                cur = self._conn.execute(
+                    "SELECT txns.txid, txns.height, txns.txn FROM address_txns "
+                    "JOIN txns USING (txid) "
+                    "WHERE address_txns.address=? AND address_txns.height>=? "
+                    "ORDER BY address_txns.height DESC LIMIT ?",
+                    (addr, min_block or 0, limit))
+                rows = cur.fetchall()
+                if not rows:
+                    continue
+
+                for txid, height, txn in rows:
+                    if txid not in txns:
+                        txns[txid] = dict(metadata=self._metadata(height, tip),
+                                          transaction=Transaction.from_bytes(txn)[0])
+                    ret[addr].append(txns[txid])
+
+        return ret
+
+    def get_transactions_by_id(self, ids):
+        """ Gets transactions by their IDs.
+
+        Args:
+            ids (list): List of TXIDs to retrieve.
+
+        Returns:
+            dict: A dict keyed by TXID of Transaction objects. Unknown
+                TXIDs are left out.
+        """
+        tip = self.get_block_height()
+        ret = {}
+        with self._lock:
+            for txid in ids:
+                row = self._conn.execute("SELECT height, txn FROM txns WHERE txid=?",
+                                         (txid,)).fetchone()
+                if row is not None:
+                    ret[txid] = dict(metadata=self._metadata(row[0], tip),
+                                     transaction=Transaction.from_bytes(row[1])[0])
+
+        return ret
+
+    def get_spending_txids(self, outpoints):
+        """ Returns the transactions spending outpoints.
+
+        Args:
+            outpoints (list(tuple)): (txid, index) tuples.
+
+        Returns:
+            dict: A dict keyed by (txid, index) of the txids spending
+                them. Unspent outpoints are left out.
+        """
+        ret = {}
+        with self._lock:
+            for txid, index in outpoints:
+                row = self._conn.execute("SELECT txid FROM spends WHERE prev_txid=? AND prev_idx=?",
+                                         (txid, index)).fetchone()
+                if row is not None:
+                    ret[(txid, index)] = row[0]
+
+        return ret
+
+    def get_utxos(self, address_list):
+        """ Provides all unspent transactions associated with each
+        address in address_list.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+
+        Returns:
+            dict: A dict keyed by address with each value being a list
+                of UnspentTransactionOutput objects.
+        """
+        tip = self.get_block_height()
+        ret = {}
+        with self._lock:
+            for addr in address_list:
+                cur = self._conn.execute(
+                    "SELECT outputs.txid, outputs.idx, outputs.value, outputs.script, "
+                    "outputs.height FROM outputs "
+                    "LEFT JOIN spends ON spends.prev_txid=outputs.txid AND "
+                    "spends.prev_idx=outputs.idx "
+                    "WHERE outputs.address=? AND spends.txid IS NULL "
+                    "ORDER BY outputs.height, outputs.txid, outputs.idx",
+                    (addr,))
+                utxos = [UnspentTransactionOutput(transaction_hash=Hash(txid),
+                                                  outpoint_index=idx,
+                                                  value=value,
+                                                  scr=Script(script),
+                                                  confirmations=tip - height + 1)
+                         for txid, idx, value, script, height in cur.fetchall()]
+                if utxos:
+                    ret[addr] = utxos
+
+        return ret
+
+    def get_balance(self, address_list):
+        """ Provides the balance for each address.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+
+        Returns:
+            dict: A dict keyed by address with each value being a
+                dict containing the confirmed and total balances.
+                These are the same since only blocks are indexed.
+        """
+        ret = {}
+        for addr in address_list:
+            total = sum(u.value for u in self.get_utxos([addr]).get(addr, []))
+            ret[addr] = dict(confirmed=total, total=total)
+
+        return ret
+
+    def close(self):
+        """ Closes the underlying database connection.
+        """
+        self._conn.close()
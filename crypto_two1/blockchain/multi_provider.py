@@ -0,0 +1,375 @@
+"""This submodule provides a `MultiProvider` class that spreads calls over
+several providers so that one slow or failing provider doesn't hold up
+the others."""
+import collections
+import concurrent.futures
+import threading
+import time
+
+from crypto_two1.blockchain.base_provider import BaseProvider
+from crypto_two1.bitcoin.txn import Transaction
+
+
+class _ProviderStats(object):
+    """ Health and latency of one provider.
+
+    Note:
+        THIS IS NOT A PUBLIC API.
+    """
+
+    def __init__(self, latency_window):
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.failures = 0
+        self.down_until = 0
+        self.calls = 0
+        self.errors = 0
+
+    def latency_percentile(self, percentile):
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[int(round(percentile * (len(latencies) - 1)))]
+
+
+class MultiProvider(BaseProvider):
+    """ Sends calls to the first of several providers that is up and
+        fails over to the next one when it raises.
+
+        A provider that fails max_failures times in a row is considered
+        down for retry_after seconds, during which it is only used if
+        all the others fail too. After that, it is tried again.
+
+        If hedge_percentile is set, a call that takes longer than that
+        percentile of the provider's recent latencies is also sent to
+        the next provider, and whichever answers first wins. This cuts
+        the tail latency of a slow provider at the cost of a few extra
+        requests.
+
+        Results are reconciled across providers: the block height never
+        goes backwards because a lagging provider answered, and
+        transactions one provider doesn't know about are looked up with
+        the others.
+
+    Args:
+        providers (list(BaseProvider)): Providers in order of
+            preference.
+        max_failures (int): Number of consecutive failures after which
+            a provider is considered down.
+        retry_after (float): Seconds a provider is considered down for.
+        hedge_percentile (float): Latency percentile, between 0 and 1,
+            after which a call is hedged. None disables hedging.
+        min_hedge_samples (int): Number of latency samples a provider
+            needs before its calls are hedged.
+        latency_window (int): Number of recent latencies kept for each
+            provider.
+        max_workers (int): Maximum number of calls to the providers
+            running at once.
+    """
+    DEFAULT_MAX_FAILURES = 3
+    DEFAULT_RETRY_AFTER = 30
+    DEFAULT_MIN_HEDGE_SAMPLES = 10
+    DEFAULT_LATENCY_WINDOW = 100
+    DEFAULT_MAX_WORKERS = 16
+
+    def __init__(self, providers,
+                 max_failures=DEFAULT_MAX_FAILURES,
+                 retry_after=DEFAULT_RETRY_AFTER,
+                 hedge_percentile=None,
+                 min_hedge_samples=DEFAULT_MIN_HEDGE_SAMPLES,
+                 latency_window=DEFAULT_LATENCY_WINDOW,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        if not providers:
+            raise ValueError("At least one provider is needed.")
+
+        self.providers = list(providers)
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_samples = min_hedge_samples
+
+        self._stats = {id(p): _ProviderStats(latency_window) for p in self.providers}
+        self._stats_lock = threading.Lock()
+        self._block_height = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    @property
+    def testnet(self):
+        """ Returns whether or not the data providers are on testnet."""
+        return self.providers[0].testnet
+
+    @testnet.setter
+    def testnet(self, v):
+        for p in self.providers:
+            p.testnet = v
+        with self._stats_lock:
+            self._block_height = None
+
+    @property
+    def can_limit_by_height(self):
+        # Any provider may answer, so they all have to support it.
+        return all(p.can_limit_by_height for p in self.providers)
+
+    def provider_stats(self):
+        """ Returns the health and latency of each provider.
+
+        Returns:
+            list(dict): One dict per provider, in order of preference,
+                with the provider, whether it is up, its number of
+                consecutive failures, its numbers of calls and errors
+                and its median latency in seconds (None if it hasn't
+                answered yet).
+        """
+        now = time.time()
+        with self._stats_lock:
+            return [dict(provider=p,
+                         up=self._stats[id(p)].down_until <= now,
+                         failures=self._stats[id(p)].failures,
+                         calls=self._stats[id(p)].calls,
+                         errors=self._stats[id(p)].errors,
+                         latency=self._stats[id(p)].latency_percentile(0.5))
+                    for p in self.providers]
+
+    def _ordered_providers(self, exclude=()):
+        """ Returns the providers that are up, in order of preference,
+            followed by those that are down, soonest back up first.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        now = time.time()
+        with self._stats_lock:
+            providers = [p for p in self.providers if p not in exclude]
+            up = [p for p in providers if self._stats[id(p)].down_until <= now]
+            down = sorted((p for p in providers if self._stats[id(p)].down_until > now),
+                          key=lambda p: self._stats[id(p)].down_until)
+        return up + down
+
+    def _hedge_delay(self, provider):
+        """ Returns how long to wait for provider before hedging, or
+            None not to hedge.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        if self.hedge_percentile is None:
+            return None
+        with self._stats_lock:
+            stats = self._stats[id(provider)]
+            if len(stats.latencies) < self.min_hedge_samples:
+                return None
+            return stats.latency_percentile(self.hedge_percentile)
+
+    def _timed_call(self, provider, method, args, kwargs):
+        """ Calls a provider method and records how it went.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        start = time.time()
+        try:
+            ret = getattr(provider, method)(*args, **kwargs)
+        except:
+            with self._stats_lock:
+                stats = self._stats[id(provider)]
+                stats.calls += 1
+                stats.errors += 1
+                stats.failures += 1
+                if stats.failures >= self.max_failures:
+                    stats.down_until = time.time() + self.retry_after
+            raise
+
+        with self._stats_lock:
+            stats = self._stats[id(provider)]
+            stats.calls += 1
+            stats.failures = 0
+            stats.down_until = 0
+            stats.latencies.append(time.time() - start)
+
+        return ret
+
+    def _call(self, method, *args, exclude=(), **kwargs):
+        """ Calls a method on the providers until one succeeds.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            method (str): Name of the method.
+            exclude (iterable): Providers not to call.
+
+        Returns:
+            tuple: The provider that answered and its result.
+
+        Raises:
+            Exception: The last error if every provider failed.
+        """
+        providers = self._ordered_providers(exclude)
+        if not providers:
+            raise ValueError("No provider left to call.")
+
+        pending = {}
+        last_error = None
+        next_index = 0
+        hedge = False
+        while True:
+            if not pending or hedge:
+                if next_index >= len(providers):
+                    if not pending:
+                        raise last_error
+                else:
+                    p = providers[next_index]
+                    next_index += 1
+                    f = self._executor.submit(self._timed_call, p, method, args, kwargs)
+                    pending[f] = p
+
+            # Hedge on the provider called last, if there is one left
+            # to hedge with.
+            timeout = None
+            if next_index < len(providers):
+                timeout = self._hedge_delay(providers[next_index - 1])
+
+            done, _ = concurrent.futures.wait(
+                pending, timeout=timeout,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            hedge = not done
+
+            for f in done:
+                p = pending.pop(f)
+                try:
+                    ret = f.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+
+                # Slower calls are left to finish so their latencies
+                # are recorded.
+                for other in pending:
+                    other.cancel()
+                return p, ret
+
+    def get_balance(self, address_list):
+        """ Provides the balance for each address.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+
+        Returns:
+            dict: A dict keyed by address with each value being a
+                dict containing the confirmed and total balances.
+        """
+        return self._call("get_balance", address_list)[1]
+
+    def get_transactions(self, *args, **kwargs):
+        """ Provides transactions associated with each address in address_list.
+
+            See BaseProvider.get_transactions().
+        """
+        return self._call("get_transactions", *args, **kwargs)[1]
+
+    def get_transactions_by_id(self, ids):
+        """ Gets transactions by their IDs. Transactions the answering
+            provider doesn't know about are looked up with the others.
+
+        Args:
+            ids (list): List of TXIDs to retrieve.
+
+        Returns:
+            dict: A dict keyed by TXID of Transaction objects.
+        """
+        ids = list(ids)
+        called = []
+        ret = {}
+        while True:
+            missing = [txid for txid in ids if txid not in ret]
+            if not missing or len(called) == len(self.providers):
+                break
+            try:
+                p, txns = self._call("get_transactions_by_id", missing, exclude=called)
+            except Exception:
+                # Some were found, the others don't exist
+                if ret:
+                    break
+                raise
+            called.append(p)
+            ret.update(txns)
+
+        return {txid: ret[txid] for txid in ids if txid in ret}
+
+    def get_utxos(self, address_list):
+        """ Provides all unspent transactions associated with each
+        address in address_list.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+
+        Returns:
+            dict: A dict keyed by address with each value being a list
+                of UnspentTransactionOutput objects.
+        """
+        return self._call("get_utxos", address_list)[1]
+
+    def broadcast_transaction(self, transaction):
+        """ Broadcasts a transaction to the Bitcoin network
+
+            The transaction is sent to one provider at a time, without
+            hedging. A provider that fails may have relayed it anyway,
+            so before failing over, the next provider is asked whether
+            it already has the transaction.
+
+        Args:
+            transaction (bytes or str): serialized, signed transaction
+
+        Returns:
+            str: The transaction ID
+        """
+        if isinstance(transaction, Transaction):
+            txid = str(transaction.hash)
+        elif isinstance(transaction, bytes):
+            txid = str(Transaction.from_bytes(transaction)[0].hash)
+        else:
+            txid = str(Transaction.from_hex(transaction).hash)
+
+        last_error = None
+        for p in self._ordered_providers():
+            if last_error is not None and self._has_transaction(p, txid):
+                return txid
+            try:
+                return self._timed_call(p, "broadcast_transaction", (transaction,), {})
+            except Exception as e:
+                last_error = e
+
+        raise last_error
+
+    @staticmethod
+    def _has_transaction(provider, txid):
+        """ Returns whether a provider knows about a transaction.
+            Errors count as not knowing.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        try:
+            return txid in provider.get_transactions_by_id([txid])
+        except Exception:
+            return False
+
+    def get_block_height(self):
+        """ Returns the latest block height, or the highest one seen so
+            far if the answering provider is behind.
+
+        Returns:
+            int: Block height
+        """
+        height = self._call("get_block_height")[1]
+        with self._stats_lock:
+            if height is not None and \
+               (self._block_height is None or height > self._block_height):
+                self._block_height = height
+            return self._block_height
+
+    def close(self):
+        """ Shuts down the thread pool. The providers aren't closed.
+        """
+        self._executor.shutdown(wait=False)
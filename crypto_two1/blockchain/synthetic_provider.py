@@ -0,0 +1,438 @@
+"""This submodule provides a `SyntheticProvider` class that serves a
+generated blockchain with simulated latency and errors, so that wallet
+and payment channel code can be benchmarked and load tested without a
+network. `SyntheticBlockchain` serves the same chain through the
+payment channel blockchain interface."""
+import collections
+import random
+import threading
+import time
+
+from crypto_two1.bitcoin.crypto import HDKey
+from crypto_two1.bitcoin.crypto import HDPrivateKey
+from crypto_two1.bitcoin.crypto import HDPublicKey
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import TransactionInput
+from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.bitcoin.txn import UnspentTransactionOutput
+from crypto_two1.bitcoin.utils import address_to_key_hash
+from crypto_two1.blockchain.base_provider import BaseProvider
+from crypto_two1.blockchain.exceptions import DataProviderUnavailableError
+from crypto_two1.channels.blockchain import BlockchainBase
+from crypto_two1.wallet.account_types import account_types
+
+
+def hd_addresses(hd_master_key, account_type="BIP44BitcoinMainnet",
+                 num_accounts=1, num_addresses=20):
+    """ Derives the addresses of an HD wallet, to generate a chain for.
+
+    Args:
+        hd_master_key (HDPrivateKey): The wallet's master key.
+        account_type (str): One of the keys of account_types.
+        num_accounts (int): Number of accounts.
+        num_addresses (int): Number of payout and of change addresses
+            per account.
+
+    Returns:
+        list(str): The payout then change addresses of each account.
+    """
+    keys = HDKey.from_path(hd_master_key,
+                           account_types[account_type].account_derivation_prefix)
+    addresses = []
+    for i in range(num_accounts):
+        acct_key = HDPrivateKey.from_parent(keys[-1], 0x80000000 | i)
+        for chain in (0, 1):
+            chain_key = HDPrivateKey.from_parent(acct_key, chain).public_key
+            addresses += [HDPublicKey.from_parent(chain_key, j).address()
+                          for j in range(num_addresses)]
+
+    return addresses
+
+
+class SyntheticProvider(BaseProvider):
+    """ Serves a generated blockchain.
+
+        Every address receives txns_per_address transactions. The
+        outputs of all but the last utxos_per_address of them are
+        spent by a later transaction, which also involves the address.
+        Transactions are spread over the blocks_per_chain blocks below
+        block_height. The chain only depends on the addresses and seed.
+
+        Every call sleeps for latency seconds plus a uniformly random
+        jitter of up to jitter seconds, then fails with probability
+        error_rate by raising error_class. latency, jitter and
+        error_rate are either numbers applying to all calls or dicts
+        keyed by method name. The number of calls and of simulated
+        errors of each method are recorded in call_counts and
+        error_counts.
+
+    Args:
+        addresses (list(str)): Base58Check encoded addresses to
+            generate transactions for, e.g. from hd_addresses().
+        txns_per_address (int): Number of transactions paying to each
+            address.
+        utxos_per_address (int): Number of those transactions whose
+            output is left unspent.
+        value (int): Value in satoshis of each output to an address.
+        block_height (int): Height of the last block.
+        blocks_per_chain (int): Number of blocks the transactions are
+            spread over.
+        latency (float or dict): Seconds each call takes.
+        jitter (float or dict): Maximum random seconds added to each
+            call.
+        error_rate (float or dict): Probability for a call to fail.
+        error_class (type): Exception raised by failing calls.
+        seed (int): Seed of the chain, latency and error generators.
+        testnet (bool): Whether the addresses are testnet addresses.
+    """
+    DEFAULT_BLOCK_HEIGHT = 400000
+
+    def __init__(self, addresses, txns_per_address=2, utxos_per_address=1,
+                 value=100000, block_height=DEFAULT_BLOCK_HEIGHT,
+                 blocks_per_chain=1000, latency=0, jitter=0, error_rate=0,
+                 error_class=DataProviderUnavailableError, seed=0,
+                 testnet=False):
+        super().__init__()
+        if utxos_per_address > txns_per_address:
+            raise ValueError("utxos_per_address can't be more than txns_per_address.")
+
+        self.testnet = testnet
+        self.can_limit_by_height = True
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_class = error_class
+
+        self.call_counts = collections.Counter()
+        self.error_counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+        self._block_height = block_height
+        # txid -> dict(transaction, block)
+        self._txns = {}
+        # address -> txids
+        self._address_txids = collections.defaultdict(list)
+        # address -> {(txid, index): value}
+        self._unspent = collections.defaultdict(dict)
+        # (txid, index) -> spending txid
+        self._spends = {}
+        # (txid, index) -> address
+        self._output_addresses = {}
+
+        self._generate(addresses, txns_per_address, utxos_per_address,
+                       value, blocks_per_chain, random.Random(seed))
+
+    def _generate(self, addresses, txns_per_address, utxos_per_address,
+                  value, blocks_per_chain, rand):
+        """ Generates the transactions of each address.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        first_block = self._block_height - blocks_per_chain + 1
+        for addr in addresses:
+            script = Script.build_p2pkh(address_to_key_hash(addr)[1])
+            for i in range(txns_per_address):
+                block = rand.randint(first_block, self._block_height)
+                receive = Transaction(
+                    Transaction.DEFAULT_TRANSACTION_VERSION,
+                    [TransactionInput(Hash(bytes(rand.getrandbits(8) for _ in range(32))),
+                                      0, Script(bytes(72)), 0xffffffff)],
+                    [TransactionOutput(value, script),
+                     TransactionOutput(value, Script.build_p2pkh(
+                         bytes(rand.getrandbits(8) for _ in range(20))))],
+                    0)
+                self._add_txn(receive, block)
+
+                if i < txns_per_address - utxos_per_address:
+                    spend = Transaction(
+                        Transaction.DEFAULT_TRANSACTION_VERSION,
+                        [TransactionInput(receive.hash, 0, Script(bytes(72)), 0xffffffff)],
+                        [TransactionOutput(value - 1000, Script.build_p2pkh(
+                            bytes(rand.getrandbits(8) for _ in range(20))))],
+                        0)
+                    self._add_txn(spend, rand.randint(block, self._block_height))
+
+    def _add_txn(self, txn, block):
+        """ Adds a transaction to the chain. block is None for
+            unconfirmed transactions.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        txid = str(txn.hash)
+        self._txns[txid] = dict(transaction=txn, block=block)
+
+        addresses = set()
+        for inp in txn.inputs:
+            outpoint = (str(inp.outpoint), inp.outpoint_index)
+            addr = self._output_addresses.get(outpoint)
+            if addr is not None:
+                addresses.add(addr)
+                self._unspent[addr].pop(outpoint, None)
+            self._spends[outpoint] = txid
+
+        for i, out in enumerate(txn.outputs):
+            for addr in out.script.get_addresses(self.testnet):
+                addresses.add(addr)
+                self._output_addresses[(txid, i)] = addr
+                if (txid, i) not in self._spends:
+                    self._unspent[addr][(txid, i)] = out.value
+
+        for addr in addresses:
+            self._address_txids[addr].append(txid)
+
+    def _param(self, value, method):
+        # Private, returns a per-call parameter for a method
+        if isinstance(value, dict):
+            return value.get(method, 0)
+        return value
+
+    def _simulate_call(self, method):
+        """ Records a call, sleeps for its latency and raises if it
+            fails.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        with self._lock:
+            self.call_counts[method] += 1
+            delay = self._param(self.latency, method) + \
+                self._random.uniform(0, self._param(self.jitter, method))
+            fail = self._random.random() < self._param(self.error_rate, method)
+            if fail:
+                self.error_counts[method] += 1
+
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise self.error_class("Simulated %s error" % method)
+
+    def reset_counts(self):
+        """ Resets call_counts and error_counts.
+        """
+        with self._lock:
+            self.call_counts.clear()
+            self.error_counts.clear()
+
+    def _txn_with_metadata(self, txid):
+        # Private, returns the transaction dict of txid
+        t = self._txns[txid]
+        block = t['block']
+        confirmed = block is not None
+        metadata = dict(block=block,
+                        block_hash=Hash(block.to_bytes(32, 'big')) if confirmed else None,
+                        network_time=1400000000 + 600 * block if confirmed else None,
+                        confirmations=self._block_height - block + 1 if confirmed else 0)
+        return dict(metadata=metadata, transaction=t['transaction'])
+
+    def get_balance(self, address_list):
+        """ Provides the balance for each address.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+
+        Returns:
+            dict: A dict keyed by address with each value being a
+                dict containing the confirmed and total balances.
+        """
+        self._simulate_call("get_balance")
+        ret = {}
+        with self._lock:
+            for addr in address_list:
+                total = confirmed = 0
+                for (txid, _), value in self._unspent.get(addr, {}).items():
+                    total += value
+                    if self._txns[txid]['block'] is not None:
+                        confirmed += value
+                ret[addr] = dict(confirmed=confirmed, total=total)
+
+        return ret
+
+    def get_transactions(self, address_list, limit=100, min_block=None):
+        """ Provides transactions associated with each address in address_list.
+
+        Args:
+            address_list (list): List of Base58Check encoded Bitcoin
+                addresses.
+            limit (int): Maximum number of transactions to return for
+                each address. The most recent ones are returned.
+            min_block (int): Block height from which to start getting
+                transactions. If None, will get transactions from the
+                entire blockchain.
+
+        Returns:
+            dict: A dict keyed by address with each value being a list of
+            Transaction objects.
+        """
+        self._simulate_call("get_transactions")
+        ret = collections.defaultdict(list)
+        with self._lock:
+            for addr in address_list:
+                txids = [txid for txid in self._address_txids.get(addr, [])
+                         if min_block is None or self._txns[txid]['block'] is None or
+                         self._txns[txid]['block'] >= min_block]
+                # Most recent first
+                txids.sort(key=lambda txid: self._txns[txid]['block'] or float('inf'),
+                           reverse=True)
+                if txids:
+                    ret[addr] = [self._txn_with_metadata(txid) for txid in txids[:limit]]
+
+        return ret
+
+    def get_transactions_by_id(self, ids):
+        """ Gets transactions by their IDs.
+
+        Args:
+            ids (list): List of TXIDs to retrieve.
+
+        Returns:
+            dict: A dict keyed by TXID of Transaction objects. Unknown
+                TXIDs are left out.
+        """
+        self._simulate_call("get_transactions_by_id")
+        with self._lock:
+            return {txid: self._txn_with_metadata(txid)
+                    for txid in ids if txid in self._txns}
+
+    def get_utxos(self, address_list):
+        """ Provides all unspent transactions associated with each
+        address in address_list.
+
+        Args:
+            address_list (list(str)): List of Base58Check encoded
+                Bitcoin addresses.
+
+        Returns:
+            dict: A dict keyed by address with each value being a list
+                of UnspentTransactionOutput objects.
+        """
+        self._simulate_call("get_utxos")
+        ret = {}
+        with self._lock:
+            for addr in address_list:
+                utxos = []
+                for (txid, index), value in self._unspent.get(addr, {}).items():
+                    t = self._txns[txid]
+                    confirmations = self._block_height - t['block'] + 1 \
+                        if t['block'] is not None else 0
+                    utxos.append(UnspentTransactionOutput(
+                        transaction_hash=Hash(txid),
+                        outpoint_index=index,
+                        value=value,
+                        scr=t['transaction'].outputs[index].script,
+                        confirmations=confirmations))
+                if utxos:
+                    ret[addr] = utxos
+
+        return ret
+
+    def get_spending_txids(self, outpoints):
+        """ Returns the transactions spending outpoints.
+
+        Args:
+            outpoints (list(tuple)): (txid, index) tuples.
+
+        Returns:
+            dict: A dict keyed by (txid, index) of the txids spending
+                them. Unspent outpoints are left out.
+        """
+        self._simulate_call("get_spending_txids")
+        with self._lock:
+            return {tuple(o): self._spends[tuple(o)] for o in outpoints
+                    if tuple(o) in self._spends}
+
+    def broadcast_transaction(self, transaction):
+        """ Adds a transaction to the chain, unconfirmed.
+
+        Args:
+            transaction (bytes or str): serialized, signed transaction
+
+        Returns:
+            str: The transaction ID
+        """
+        self._simulate_call("broadcast_transaction")
+        if isinstance(transaction, str):
+            transaction = bytes.fromhex(transaction)
+        txn, _ = Transaction.from_bytes(transaction)
+        with self._lock:
+            if str(txn.hash) not in self._txns:
+                self._add_txn(txn, None)
+
+        return str(txn.hash)
+
+    def mine_block(self):
+        """ Adds a block confirming all unconfirmed transactions.
+
+        Returns:
+            int: The new block height.
+        """
+        with self._lock:
+            self._block_height += 1
+            for t in self._txns.values():
+                if t['block'] is None:
+                    t['block'] = self._block_height
+
+            return self._block_height
+
+    def get_block_height(self):
+        """ Returns the latest block height
+
+        Returns:
+            int: Block height
+        """
+        self._simulate_call("get_block_height")
+        return self._block_height
+
+
+class SyntheticBlockchain(BlockchainBase):
+    """Payment channel blockchain interface to a SyntheticProvider.
+
+    Batched lookups take one or two calls to the provider however many
+    transactions they cover.
+    """
+
+    def __init__(self, provider):
+        """Instantiate a blockchain interface to a synthetic chain.
+
+        Args:
+            provider (SyntheticProvider): Provider serving the chain.
+
+        Returns:
+            SyntheticBlockchain: instance of SyntheticBlockchain.
+
+        """
+        super().__init__()
+        self._provider = provider
+
+    def check_confirmed(self, txid, num_confirmations=1):
+        return self.check_confirmed_many([txid], num_confirmations)[txid]
+
+    def check_confirmed_many(self, txids, num_confirmations=1):
+        txns = self._provider.get_transactions_by_id(txids)
+        return {txid: txid in txns and txns[txid]['metadata']['confirmations'] >= num_confirmations
+                for txid in txids}
+
+    def lookup_spend_txid(self, txid, output_index):
+        return self.lookup_spend_txids([(txid, output_index)])[(txid, output_index)]
+
+    def lookup_spend_txids(self, outpoints):
+        outpoints = [tuple(o) for o in outpoints]
+        txns = self._provider.get_transactions_by_id(list(set(txid for txid, _ in outpoints)))
+        for txid, output_index in outpoints:
+            if txid in txns and len(txns[txid]['transaction'].outputs) <= output_index:
+                raise IndexError("Output index out of bounds.")
+
+        spends = self._provider.get_spending_txids(outpoints)
+        return {o: spends.get(o) for o in outpoints}
+
+    def lookup_tx(self, txid):
+        txns = self._provider.get_transactions_by_id([txid])
+        return txns[txid]['transaction'].to_hex() if txid in txns else None
+
+    def broadcast_tx(self, tx):
+        return self._provider.broadcast_transaction(tx)
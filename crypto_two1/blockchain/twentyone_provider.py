@@ -1,31 +1,73 @@
 """This submodule provides a concrete `TwentyOneProvider` class that provides
 information about a blockchain by contacting a server."""
 from calendar import timegm
+import collections
 from collections import defaultdict
-import arrow
+import concurrent.futures
+import itertools
 import os
+import re
+import threading
+import time
 
 from urllib.parse import urljoin
 
 from crypto_two1.blockchain import exceptions
 from crypto_two1.blockchain.base_provider import BaseProvider
+from crypto_two1.blockchain.json_stream import iter_json_array
 from crypto_two1.bitcoin.hash import Hash
 from crypto_two1.bitcoin.txn import CoinbaseInput
 from crypto_two1.bitcoin.txn import TransactionInput
 from crypto_two1.bitcoin.txn import TransactionOutput
 from crypto_two1.bitcoin.txn import Transaction
 from crypto_two1.bitcoin.utils import bytes_to_str
-from crypto_two1.bitcoin.utils import pack_var_str
 from crypto_two1.bitcoin.script import Script
 
+# Date and time of an ISO 8601 timestamp, e.g. "2015-08-13T10:52:21.718Z"
+_TIMESTAMP_RE = re.compile(r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)")
+
 
 class TwentyOneProvider(BaseProvider):
     """ Transaction data provider using the TwentyOne API
+
+        Requests for many addresses or transactions are split into
+        chunks that are sent concurrently, at most max_workers at a
+        time, over a single pooled session. Requests that fail because
+        the server can't be reached, times out or is temporarily
+        unavailable are retried with exponential backoff. Only GET
+        requests are sent again as they are; a transaction is only
+        broadcast again if the server doesn't already have it.
+
+    Args:
+        twentyone_host_name (str): URL of the server.
+        testnet (bool): Whether or not to use testnet.
+        connection_pool_size (int): Number of pooled connections. If 0,
+            one per worker.
+        max_workers (int): Maximum number of concurrent requests.
+        timeout (float): Seconds to wait for the server to respond to
+            a request.
+        max_retries (int): Number of times a request is retried.
+        retry_backoff (float): Seconds to wait before the first retry.
+            The wait doubles with each retry.
     """
     DEFAULT_HOST = os.environ.get("TWO1_PROVIDER_HOST", "https://blockchain.21.co")
+    DEFAULT_MAX_WORKERS = 8
+    DEFAULT_TIMEOUT = 30
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_RETRY_BACKOFF = 0.5
+    # Server responses worth retrying
+    RETRY_STATUS_CODES = (429, 502, 503, 504)
+    # Maximum number of addresses in one request
+    ADDRESS_CHUNK_SIZE = 199
+    # Bytes read at a time from streamed responses
+    STREAM_CHUNK_SIZE = 64 * 1024
 
     def __init__(self, twentyone_host_name=DEFAULT_HOST, testnet=False,
-                 connection_pool_size=0):
+                 connection_pool_size=0,
+                 max_workers=DEFAULT_MAX_WORKERS,
+                 timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 retry_backoff=DEFAULT_RETRY_BACKOFF):
         self.host_name = twentyone_host_name
 
         super().__init__()
@@ -33,7 +75,12 @@ class TwentyOneProvider(BaseProvider):
         self.auth = None
         self._set_url()
         self._session = None
+        self._session_lock = threading.Lock()
         self._pool_size = connection_pool_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
         self.can_limit_by_height = True
 
     @property
@@ -52,13 +99,15 @@ class TwentyOneProvider(BaseProvider):
 
     def _create_session(self):
         import requests
-        self._session = requests.Session()
-        if self._pool_size > 0:
-            adapter = requests.adapters.HTTPAdapter(pool_connections=self._pool_size,
-                                                    pool_maxsize=self._pool_size)
-            self._session.mount('http://', adapter)
-            self._session.mount('https://', adapter)
-        self._session.auth = self.auth
+        session = requests.Session()
+        # Each concurrent request needs its own pooled connection
+        pool_size = self._pool_size or max(self.max_workers, 1)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.auth = self.auth
+        self._session = session
 
     @staticmethod
     def txn_from_json(txn_json):
@@ -117,6 +166,60 @@ class TwentyOneProvider(BaseProvider):
                 from the provided json.
 
         """
+        inputs, outputs, addr_keys = TwentyOneProvider._txn_fields_from_json(txn_json)
+        txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                          inputs,
+                          outputs,
+                          txn_json["lock_time"])
+
+        return txn, addr_keys
+
+    @staticmethod
+    def wallet_txn_from_json(txn_json):
+        """ Returns a new WalletTransaction from a JSON-serialized
+            transaction, with its block, block hash, confirmations and
+            network time set from the JSON.
+
+            This is the transaction txn_from_json() returns, with the
+            metadata returned alongside it by get_transactions(), built
+            directly rather than through
+            WalletTransaction.from_transaction(), which copies it.
+
+        Args:
+            txn_json: JSON in the format described in txn_from_json().
+
+        Returns:
+            tuple: The WalletTransaction and the set of addresses
+                found in the inputs and outputs.
+        """
+        # Imported here since the wallet package imports this module
+        from crypto_two1.wallet.wallet_txn import WalletTransaction
+
+        inputs, outputs, addr_keys = TwentyOneProvider._txn_fields_from_json(txn_json)
+        metadata = TwentyOneProvider._metadata_from_json(txn_json)
+        wt = WalletTransaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                               inputs,
+                               outputs,
+                               txn_json["lock_time"],
+                               block=metadata['block'],
+                               block_hash=metadata['block_hash'],
+                               confirmations=metadata['confirmations'],
+                               network_time=metadata['network_time'])
+
+        return wt, addr_keys
+
+    @staticmethod
+    def _txn_fields_from_json(txn_json):
+        """ Builds the inputs and outputs of a transaction straight from
+            the JSON fields: scripts are created from the raw bytes
+            rather than length-prefixed and parsed again.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Returns:
+            tuple: (inputs, outputs, addr_keys)
+        """
         inputs = []
         outputs = []
         addr_keys = set()
@@ -129,31 +232,48 @@ class TwentyOneProvider(BaseProvider):
                         sequence=i['sequence'],
                         block_version=1))
             else:
-                # Script length etc. are not returned so we need to
-                # prepend that.
-                script, _ = Script.from_bytes(
-                    pack_var_str(bytes.fromhex(i["script_signature_hex"])))
                 inputs.append(TransactionInput(Hash(i["output_hash"]),
                                                i["output_index"],
-                                               script,
+                                               Script(bytes.fromhex(i["script_signature_hex"])),
                                                i["sequence"]))
             if "addresses" in i:
                 addr_keys.add(i["addresses"][0])
 
         for i in txn_json["outputs"]:
-            script, _ = Script.from_bytes(
-                pack_var_str(bytes.fromhex(i["script_hex"])))
             outputs.append(TransactionOutput(i["value"],
-                                             script))
+                                             Script(bytes.fromhex(i["script_hex"]))))
             if "addresses" in i:
                 addr_keys.add(i["addresses"][0])
 
-        txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
-                          inputs,
-                          outputs,
-                          txn_json["lock_time"])
+        return inputs, outputs, addr_keys
 
-        return txn, addr_keys
+    @staticmethod
+    def _parse_time(t):
+        """ Converts a timestamp returned by the server to seconds since
+            the epoch. ISO 8601 strings are truncated to the second and
+            numbers are taken as seconds already.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        if isinstance(t, (int, float)):
+            return int(t)
+        return timegm(tuple(int(x) for x in _TIMESTAMP_RE.match(t).groups()))
+
+    @staticmethod
+    def _metadata_from_json(data):
+        """ Returns the metadata of a JSON-serialized transaction.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        block_hash = None
+        if data['block_hash']:
+            block_hash = Hash(data['block_hash'])
+        return dict(block=data['block_height'],
+                    block_hash=block_hash,
+                    network_time=TwentyOneProvider._parse_time(data['chain_received_at']),
+                    confirmations=data['confirmations'])
 
     @staticmethod
     def _list_chunks(lst, chunk_size):
@@ -161,10 +281,41 @@ class TwentyOneProvider(BaseProvider):
             yield lst[i:i + chunk_size]
 
     def _request(self, method, path, **kwargs):
-        import requests
-        if self._session is None:
-            self._create_session()
+        """ Sends a request to the server. GET requests are retried with
+            exponential backoff if the server can't be reached, times
+            out or is temporarily unavailable. Other requests aren't, as
+            the server may have acted on them before failing.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        with self._session_lock:
+            if self._session is None:
+                self._create_session()
+
+        kwargs.setdefault("timeout", self.timeout)
+        max_retries = self.max_retries if method == "GET" else 0
+        for attempt in range(max_retries + 1):
+            try:
+                return self._request_once(method, path, **kwargs)
+            except (exceptions.DataProviderUnavailableError,
+                    exceptions.DataProviderError) as e:
+                if not self._is_temporary(e) or attempt == max_retries:
+                    raise
+            time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def _is_temporary(self, e):
+        """ Returns whether a request that failed with e is worth
+            retrying.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        return isinstance(e, exceptions.DataProviderUnavailableError) or \
+            e.status_code in self.RETRY_STATUS_CODES
 
+    def _request_once(self, method, path, **kwargs):
+        import requests
         url = self.server_url + path
         result = None
         try:
@@ -177,9 +328,11 @@ class TwentyOneProvider(BaseProvider):
             if result.status_code != 200:
                 try:
                     data = result.json()
-                    raise exceptions.DataProviderError(data.get('message', str(data)))
+                    message = data.get('message', str(data))
                 except ValueError:
-                    raise exceptions.DataProviderError(result.reason)
+                    message = result.reason
+                raise exceptions.DataProviderError(message,
+                                                   status_code=result.status_code)
 
             return result
 
@@ -198,6 +351,58 @@ class TwentyOneProvider(BaseProvider):
             else:
                 raise
 
+    def _iter_array(self, response):
+        """ Decodes the JSON array in the body of a streamed response
+            one element at a time, as it is read.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        import requests
+        try:
+            yield from iter_json_array(response.iter_content(self.STREAM_CHUNK_SIZE))
+        except requests.exceptions.RequestException:
+            raise exceptions.DataProviderUnavailableError("Connection lost while reading the response.")
+        except ValueError:
+            # Older versions of urllib3 don't check the length of the
+            # body, so a response cut off early just looks invalid.
+            length = response.headers.get("Content-Length")
+            if length is not None and response.raw.tell() < int(length):
+                raise exceptions.DataProviderUnavailableError("Connection lost while reading the response.")
+            raise exceptions.DataProviderError("Invalid response from the server.")
+        finally:
+            response.close()
+
+    def _get_array(self, path, func):
+        """ Gets a JSON array from the server and calls func on each
+            element as soon as it has been decoded, so the whole
+            response is never held in memory as JSON. The request is
+            sent again if the connection is lost while the response is
+            being read.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Returns:
+            list: The results of func, in order.
+        """
+        for attempt in range(self.max_retries + 1):
+            r = self._request("GET", path, stream=True)
+            try:
+                return [func(data) for data in self._iter_array(r)]
+            except exceptions.DataProviderUnavailableError:
+                if attempt == self.max_retries:
+                    raise
+            time.sleep(self.retry_backoff * 2 ** attempt)
+
+    @staticmethod
+    def _transactions_path(addresses, limit, min_block):
+        path = "addresses/" + ",".join(addresses) \
+               + "/transactions?limit={}".format(limit)
+        if min_block:
+            path += "&min_block={}".format(min_block)
+        return path
+
     def get_transactions(self, address_list, limit=100, min_block=None):
         """ Provides transactions associated with each address in address_list.
 
@@ -213,27 +418,15 @@ class TwentyOneProvider(BaseProvider):
             dict: A dict keyed by address with each value being a list of
             Transaction objects.
         """
+        def get_chunk(addresses):
+            return self._get_array(self._transactions_path(addresses, limit, min_block),
+                                   self._txn_with_metadata)
+
+        chunks = list(self._list_chunks(address_list, self.ADDRESS_CHUNK_SIZE))
         ret = defaultdict(list)
-        for addresses in self._list_chunks(address_list, 199):
-            path = "addresses/" + ",".join(addresses) \
-                   + "/transactions?limit={}".format(limit)
-            if min_block:
-                path += "&min_block={}".format(min_block)
-
-            r = self._request("GET", path)
-            txn_data = r.json()
-
-            for data in txn_data:
-                block_hash = None
-                if data['block_hash']:
-                    block_hash = Hash(data['block_hash'])
-                metadata = dict(block=data['block_height'],
-                                block_hash=block_hash,
-                                network_time=timegm(arrow.get(
-                                    data['chain_received_at']).datetime.timetuple()),
-                                confirmations=data['confirmations'])
-
-                txn, addr_keys = self.txn_from_json(data)
+        for addresses, txns in zip(chunks, self._map(get_chunk, chunks)):
+            addresses = set(addresses)
+            for metadata, txn, addr_keys in txns:
                 for addr in addr_keys:
                     if addr in addresses:
                         ret[addr].append(dict(metadata=metadata,
@@ -241,6 +434,69 @@ class TwentyOneProvider(BaseProvider):
 
         return ret
 
+    def iter_wallet_transactions(self, address_list, limit=100, min_block=None):
+        """ Yields the transactions associated with the addresses in
+            address_list as WalletTransaction objects.
+
+            Each response is decoded as it is read, so the first
+            transactions are yielded before the rest have arrived and
+            the JSON of a response is never held in memory as a whole.
+            Up to max_workers chunks of addresses are requested ahead
+            of the one being read.
+
+            If the connection is lost while a chunk is being read, the
+            chunk is requested again and the transactions already
+            yielded from it are skipped.
+
+            See BaseProvider.iter_wallet_transactions().
+        """
+        chunks = list(self._list_chunks(address_list, self.ADDRESS_CHUNK_SIZE))
+        if not chunks:
+            return
+
+        def open_chunk(addresses):
+            return self._request("GET", self._transactions_path(addresses, limit, min_block),
+                                 stream=True)
+
+        chunks = iter(chunks)
+        pending = collections.deque()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(self.max_workers, 1))
+        try:
+            for addresses in itertools.islice(chunks, max(self.max_workers, 1)):
+                pending.append((addresses, executor.submit(open_chunk, addresses)))
+
+            while pending:
+                addresses, f = pending.popleft()
+                r = f.result()
+                for next_addresses in itertools.islice(chunks, 1):
+                    pending.append((next_addresses,
+                                    executor.submit(open_chunk, next_addresses)))
+
+                address_set = set(addresses)
+                yielded = set()
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        for data in self._iter_array(r):
+                            wt, addr_keys = self.wallet_txn_from_json(data)
+                            txid = str(wt.hash)
+                            if txid not in yielded:
+                                yielded.add(txid)
+                                yield wt, addr_keys & address_set
+                        break
+                    except exceptions.DataProviderUnavailableError:
+                        if attempt == self.max_retries:
+                            raise
+                    time.sleep(self.retry_backoff * 2 ** attempt)
+                    r = open_chunk(addresses)
+        finally:
+            # Responses that were opened but won't be read
+            for _, f in pending:
+                f.cancel()
+            executor.shutdown(wait=True)
+            for _, f in pending:
+                if not f.cancelled() and f.exception() is None:
+                    f.result().close()
+
     def get_transactions_by_id(self, ids):
         """ Gets transactions by their IDs.
 
@@ -250,26 +506,28 @@ class TwentyOneProvider(BaseProvider):
         Returns:
             dict: A dict keyed by TXID of Transaction objects.
         """
-        ret = {}
-        for txid in ids:
+        def get_txn(txid):
             response = self._request("GET", "transactions/%s" % txid)
-            data = response.json()
-
-            block_hash = None
-            if data['block_hash']:
-                block_hash = Hash(data['block_hash'])
-            metadata = dict(block=data['block_height'],
-                            block_hash=block_hash,
-                            network_time=timegm(arrow.get(
-                                data['chain_received_at']).datetime.timetuple()),
-                            confirmations=data['confirmations'])
-            txn, _ = self.txn_from_json(data)
+            metadata, txn, _ = self._txn_with_metadata(response.json())
             assert str(txn.hash) == txid
+            return txid, dict(metadata=metadata, transaction=txn)
 
-            ret[txid] = dict(metadata=metadata,
-                             transaction=txn)
+        ids = list(ids)
+        return dict(self._map(get_txn, ids))
 
-        return ret
+    def _txn_with_metadata(self, data):
+        """ Deserializes a transaction and its metadata from the JSON
+            returned by the server.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Returns:
+            tuple: (metadata, txn, addr_keys)
+        """
+        metadata = self._metadata_from_json(data)
+        txn, addr_keys = self.txn_from_json(data)
+        return metadata, txn, addr_keys
 
     def broadcast_transaction(self, transaction):
         """ Broadcasts a transaction to the Bitcoin network
@@ -291,8 +549,36 @@ class TwentyOneProvider(BaseProvider):
                 "transaction must be one of: bytes, str, Transaction.")
 
         data = {"signed_hex": signed_hex}
-        response_body = self._request("POST", "transactions/send", data=data).json()
-        return response_body["transaction_hash"]
+        txid = str(Transaction.from_hex(signed_hex).hash)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response_body = self._request("POST", "transactions/send", data=data).json()
+                return response_body["transaction_hash"]
+            except (exceptions.DataProviderUnavailableError,
+                    exceptions.DataProviderError) as e:
+                if not self._is_temporary(e) or attempt == self.max_retries:
+                    raise
+            time.sleep(self.retry_backoff * 2 ** attempt)
+
+            # The server may have received the transaction even though
+            # the response was lost, so it's only sent again if the
+            # server doesn't have it.
+            if self._has_transaction(txid):
+                return txid
+
+    def _has_transaction(self, txid):
+        """ Returns whether the server knows about a transaction.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        try:
+            self._request("GET", "transactions/%s" % txid)
+        except exceptions.DataProviderError as e:
+            if e.status_code == 404:
+                return False
+            raise
+        return True
 
     def get_block_height(self):
         """ Returns the latest block height
@@ -1,5 +1,8 @@
 """Wraps various blockchain data sources to provide convenience methods for
 payment channel management."""
+import concurrent.futures
+import threading
+
 import requests
 
 import crypto_two1.bitcoin as bitcoin
@@ -55,6 +58,48 @@ class BlockchainBase:
         """
         raise NotImplementedError()
 
+    def check_confirmed_many(self, txids, num_confirmations=1):
+        """Check which of transactions txids have num_confirmations
+        confirmations.
+
+        The default implementation calls check_confirmed() for each
+        transaction.
+
+        Args:
+            txids (list(str)): Transaction IDs (RPC byte order).
+            num_confirmations (int): Number of confirmations.
+
+        Returns:
+            dict: A dict keyed by transaction ID, True if confirmed, False if
+                not confirmed.
+
+        Raises:
+            BlockchainServerError: if an unexpected server error occurred.
+
+        """
+        return {txid: self.check_confirmed(txid, num_confirmations) for txid in txids}
+
+    def lookup_spend_txids(self, outpoints):
+        """Look up the transactions that spent several outputs.
+
+        The default implementation calls lookup_spend_txid() for each output.
+
+        Args:
+            outpoints (list(tuple)): (txid, output_index) tuples of the
+                outputs.
+
+        Returns:
+            dict: A dict keyed by (txid, output_index) of the spending
+                transaction IDs (RPC byte order) or None.
+
+        Raises:
+            IndexError: if an output index is out of bounds.
+            BlockchainServerError: if an unexpected server error occurred.
+
+        """
+        return {(txid, output_index): self.lookup_spend_txid(txid, output_index)
+                for txid, output_index in outpoints}
+
     def lookup_tx(self, txid):
         """Look up a raw transaction by transaction txid.
 
@@ -86,56 +131,165 @@ class BlockchainBase:
         raise NotImplementedError()
 
 
-class InsightBlockchain(BlockchainBase):
-    """Blockchain interface to an Insight API."""
+class HTTPBlockchainBase(BlockchainBase):
+    """Base class for a Blockchain interface to an HTTP API.
 
-    def __init__(self, base_url):
-        """Instantiate a Insight blockchain interface with specified URL.
+    Requests share a pooled session and time out after timeout seconds. The
+    transactions of check_confirmed_many() and lookup_spend_txids() are
+    looked up concurrently, and final results are cached so they are only
+    looked up once: confirmations, and spends by a transaction that
+    check_confirmed_many() has seen confirmed. Other spends can be dropped or
+    replaced, so they are looked up every time.
+    """
 
-        Args:
-            base_url (str): Insight API URL.
+    TX_INFO_PATH = None
+    """Path of the transaction info resource, followed by the txid."""
 
-        Returns:
-            InsightBlockchain: instance of InsightBlockchain.
+    OUTPUTS_KEY = None
+    """Key of the outputs in the transaction info."""
+
+    SPEND_TXID_KEY = None
+    """Key of the spending transaction ID in a transaction info output."""
+
+    DEFAULT_TIMEOUT = 30
+    DEFAULT_MAX_WORKERS = 8
+
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT, max_workers=DEFAULT_MAX_WORKERS):
+        """Instantiate a blockchain interface with specified URL.
+
+        Args:
+            base_url (str): API URL.
+            timeout (float): Request timeout in seconds.
+            max_workers (int): Maximum number of concurrent requests.
 
         """
         super().__init__()
         self._base_url = base_url
+        self._timeout = timeout
+        self._max_workers = max_workers
+
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        # Highest number of confirmations seen, keyed by txid
+        self._confirmations = {}
+        # Spending txids of confirmed spends, keyed by (txid, output_index)
+        self._spend_txids = {}
+
+    def _request(self, method, path, **kwargs):
+        try:
+            return self._session.request(method, self._base_url + path, timeout=self._timeout, **kwargs)
+        except requests.RequestException as e:
+            raise BlockchainServerError("Requesting {}: {}".format(path, e))
+
+    def _lookup_tx_infos(self, txids):
+        """Look up the info of several transactions concurrently.
+
+        Args:
+            txids (list(str)): Transaction IDs (RPC byte order).
+
+        Returns:
+            dict: A dict keyed by transaction ID of the transaction info, or
+                None if the transaction was not found.
+
+        """
+        def lookup(txid):
+            r = self._request("GET", self.TX_INFO_PATH + txid)
+            if r.status_code == 404:
+                return None
+            elif r.status_code != 200:
+                raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(
+                    r.status_code, r.text))
+            return r.json()
+
+        txids = list(dict.fromkeys(txids))
+        if len(txids) <= 1 or self._max_workers <= 1:
+            return {txid: lookup(txid) for txid in txids}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self._max_workers, len(txids))) as executor:
+            futures = [executor.submit(lookup, txid) for txid in txids]
+            try:
+                return {txid: f.result() for txid, f in zip(txids, futures)}
+            except:
+                for f in futures:
+                    f.cancel()
+                raise
 
     def check_confirmed(self, txid, num_confirmations=1):
-        # Get transaction info
-        r = requests.get(self._base_url + "/tx/" + txid)
-        if r.status_code == 404:
-            return False
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
+        return self.check_confirmed_many([txid], num_confirmations)[txid]
+
+    def check_confirmed_many(self, txids, num_confirmations=1):
+        with self._lock:
+            ret = {txid: True for txid in txids if self._confirmations.get(txid, 0) >= num_confirmations}
+
+        tx_infos = self._lookup_tx_infos([txid for txid in txids if txid not in ret])
+        for txid, tx_info in tx_infos.items():
+            confirmations = (tx_info or {}).get("confirmations") or 0
+            ret[txid] = confirmations >= num_confirmations
+            if confirmations:
+                with self._lock:
+                    self._confirmations[txid] = max(confirmations, self._confirmations.get(txid, 0))
 
-        # Check confirmation
-        tx_info = r.json()
-        return "confirmations" in tx_info and tx_info["confirmations"] >= num_confirmations
+        return {txid: ret[txid] for txid in txids}
 
     def lookup_spend_txid(self, txid, output_index):
-        # Get transaction info
-        r = requests.get(self._base_url + "/tx/" + txid)
-        if r.status_code == 404:
-            return None
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
+        return self.lookup_spend_txids([(txid, output_index)])[(txid, output_index)]
+
+    def lookup_spend_txids(self, outpoints):
+        outpoints = [tuple(o) for o in outpoints]
+        with self._lock:
+            ret = {o: self._spend_txids[o] for o in outpoints if o in self._spend_txids}
+
+        missing = [o for o in outpoints if o not in ret]
+        tx_infos = self._lookup_tx_infos([txid for txid, _ in missing])
+        for txid, output_index in missing:
+            tx_info = tx_infos[txid]
+            if tx_info is None:
+                ret[(txid, output_index)] = None
+                continue
+
+            # Validate utxo index is in bounds
+            outputs = tx_info[self.OUTPUTS_KEY]
+            if len(outputs) <= output_index:
+                raise IndexError("Output index out of bounds.")
+
+            spend_txid = outputs[output_index].get(self.SPEND_TXID_KEY)
+            ret[(txid, output_index)] = spend_txid
+            with self._lock:
+                if spend_txid and self._confirmations.get(spend_txid, 0) >= 1:
+                    self._spend_txids[(txid, output_index)] = spend_txid
+
+        return {o: ret[o] for o in outpoints}
+
 
-        # Validate utxo index is in bounds
-        tx_info = r.json()
-        if len(tx_info['vout']) <= output_index:
-            raise IndexError("Output index out of bounds.")
+class InsightBlockchain(HTTPBlockchainBase):
+    """Blockchain interface to an Insight API."""
 
-        # If spent transaction exists
-        if "spentTxId" in tx_info['vout'][output_index]:
-            return tx_info['vout'][output_index]['spentTxId']
+    TX_INFO_PATH = "/tx/"
+    OUTPUTS_KEY = "vout"
+    SPEND_TXID_KEY = "spentTxId"
 
-        return None
+    def __init__(self, base_url, timeout=HTTPBlockchainBase.DEFAULT_TIMEOUT,
+                 max_workers=HTTPBlockchainBase.DEFAULT_MAX_WORKERS):
+        """Instantiate a Insight blockchain interface with specified URL.
+
+        Args:
+            base_url (str): Insight API URL.
+            timeout (float): Request timeout in seconds.
+            max_workers (int): Maximum number of concurrent requests.
+
+        Returns:
+            InsightBlockchain: instance of InsightBlockchain.
+
+        """
+        super().__init__(base_url, timeout, max_workers)
 
     def lookup_tx(self, txid):
         # Get raw transaction
-        r = requests.get(self._base_url + "/rawtx/" + txid)
+        r = self._request("GET", "/rawtx/" + txid)
         if r.status_code == 404:
             return None
         elif r.status_code != 200:
@@ -148,68 +302,43 @@ class InsightBlockchain(BlockchainBase):
         # already been broadcast, so we check if it exists first.
 
         # Get transaction info
-        r = requests.get(self._base_url + "/tx/" + str(bitcoin.Transaction.from_hex(tx).hash))
+        r = self._request("GET", "/tx/" + str(bitcoin.Transaction.from_hex(tx).hash))
         if r.status_code == 200:
             return r.json()['txid']
 
         # Broadcast transaction
-        r = requests.post(self._base_url + "/tx/send", data={'rawtx': tx})
+        r = self._request("POST", "/tx/send", data={'rawtx': tx})
         if r.status_code != 200:
             raise BlockchainServerError("Broadcasting transaction: Status Code {}, {}".format(r.status_code, r.text))
 
         return r.json()['txid']
 
 
-class BlockCypherBlockchain(BlockchainBase):
+class BlockCypherBlockchain(HTTPBlockchainBase):
     """Blockchain interface to a BlockCypher API."""
 
-    def __init__(self, base_url):
+    TX_INFO_PATH = "/txs/"
+    OUTPUTS_KEY = "outputs"
+    SPEND_TXID_KEY = "spent_by"
+
+    def __init__(self, base_url, timeout=HTTPBlockchainBase.DEFAULT_TIMEOUT,
+                 max_workers=HTTPBlockchainBase.DEFAULT_MAX_WORKERS):
         """Instantiate a BlockCypher blockchain interface with specified URL.
 
         Args:
             base_url (str): BlockCypher API URL.
+            timeout (float): Request timeout in seconds.
+            max_workers (int): Maximum number of concurrent requests.
 
         Returns:
             BlockCypherBlockchain: instance of BlockCypherBlockchain.
 
         """
-        super().__init__()
-        self._base_url = base_url
-
-    def check_confirmed(self, txid, num_confirmations=1):
-        # Get transaction info
-        r = requests.get(self._base_url + "/txs/" + txid)
-        if r.status_code == 404:
-            return False
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
-
-        # Check confirmation
-        tx_info = r.json()
-        return "confirmations" in tx_info and tx_info["confirmations"] >= num_confirmations
-
-    def lookup_spend_txid(self, txid, output_index):
-        # Get transaction info
-        r = requests.get(self._base_url + "/txs/" + txid)
-        if r.status_code == 404:
-            return None
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
-
-        # Validate utxo index is in bounds
-        tx_info = r.json()
-        if len(tx_info['outputs']) <= output_index:
-            raise IndexError("Output index out of bounds.")
-
-        # If spent transaction exists
-        if "spent_by" in tx_info['outputs'][output_index]:
-            return tx_info['outputs'][output_index]['spent_by']
-
-        return None
+        super().__init__(base_url, timeout, max_workers)
 
     def lookup_tx(self, txid):
         # Get raw transaction
-        r = requests.get(self._base_url + "/txs/" + txid, params={'includeHex': 'true'})
+        r = self._request("GET", "/txs/" + txid, params={'includeHex': 'true'})
         if r.status_code == 404:
             return None
         elif r.status_code != 200:
@@ -222,68 +351,43 @@ class BlockCypherBlockchain(BlockchainBase):
         # been broadcast, so we check if it exists first.
 
         # Get transaction info
-        r = requests.get(self._base_url + "/txs/" + str(bitcoin.Transaction.from_hex(tx).hash))
+        r = self._request("GET", "/txs/" + str(bitcoin.Transaction.from_hex(tx).hash))
         if r.status_code == 200:
             return r.json()['hash']
 
         # Broadcast transaction
-        r = requests.post(self._base_url + "/txs/push", json={'tx': tx})
+        r = self._request("POST", "/txs/push", json={'tx': tx})
         if r.status_code != 201:
             raise BlockchainServerError("Broadcasting transaction: Status Code {}, {}".format(r.status_code, r.text))
 
         return r.json()['tx']['hash']
 
 
-class TwentyOneBlockchain(BlockchainBase):
+class TwentyOneBlockchain(HTTPBlockchainBase):
     """Blockchain interface to a TwentyOne Chain-like API."""
 
-    def __init__(self, base_url):
+    TX_INFO_PATH = "/transactions/"
+    OUTPUTS_KEY = "outputs"
+    SPEND_TXID_KEY = "spending_transaction"
+
+    def __init__(self, base_url, timeout=HTTPBlockchainBase.DEFAULT_TIMEOUT,
+                 max_workers=HTTPBlockchainBase.DEFAULT_MAX_WORKERS):
         """Instantiate a TwentyOne blockchain interface with specified URL.
 
         Args:
             base_url (str): TwentyOne API URL.
+            timeout (float): Request timeout in seconds.
+            max_workers (int): Maximum number of concurrent requests.
 
         Returns:
             TwentyOneBlockchain: instance of TwentyOneBlockchain.
 
         """
-        super().__init__()
-        self._base_url = base_url
-
-    def check_confirmed(self, txid, num_confirmations=1):
-        # Get transaction info
-        r = requests.get(self._base_url + "/transactions/" + txid)
-        if r.status_code == 404:
-            return False
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
-
-        # Check confirmation
-        tx_info = r.json()
-        return "confirmations" in tx_info and tx_info["confirmations"] >= num_confirmations
-
-    def lookup_spend_txid(self, txid, output_index):
-        # Get transaction info
-        r = requests.get(self._base_url + "/transactions/" + txid)
-        if r.status_code == 404:
-            return None
-        elif r.status_code != 200:
-            raise BlockchainServerError("Getting transaction info: Status Code {}, {}".format(r.status_code, r.text))
-
-        # Validate utxo index is in bounds
-        tx_info = r.json()
-        if len(tx_info['outputs']) <= output_index:
-            raise IndexError("Output index out of bounds.")
-
-        # If spent transaction exists
-        if "spending_transaction" in tx_info['outputs'][output_index]:
-            return tx_info['outputs'][output_index]['spending_transaction']
-
-        return None
+        super().__init__(base_url, timeout, max_workers)
 
     def lookup_tx(self, txid):
         # Get raw transaction
-        r = requests.get(self._base_url + "/transactions/" + txid)
+        r = self._request("GET", "/transactions/" + txid)
         if r.status_code == 404:
             return None
         elif r.status_code != 200:
@@ -296,12 +400,12 @@ class TwentyOneBlockchain(BlockchainBase):
         # been broadcast, so we check if it exists first.
 
         # Get transaction info
-        r = requests.get(self._base_url + "/transactions/" + str(bitcoin.Transaction.from_hex(tx).hash))
+        r = self._request("GET", "/transactions/" + str(bitcoin.Transaction.from_hex(tx).hash))
         if r.status_code == 200:
             return r.json()['hash']
 
         # Broadcast transaction
-        r = requests.post(self._base_url + "/transactions/send", json={'signed_hex': tx})
+        r = self._request("POST", "/transactions/send", json={'signed_hex': tx})
         if r.status_code != 200:
             raise BlockchainServerError("Broadcasting transaction: Status Code {}, {}".format(r.status_code, r.text))
 
@@ -42,6 +42,20 @@ class DatabaseBase:
         """
         raise NotImplementedError()
 
+    def read_version(self, url):
+        """Read the version of a payment channel, which changes whenever the
+        channel is updated by any process.
+
+        Args:
+            url (str): Channel URL (primary key).
+
+        Returns:
+            int or None: Channel version, or None if the database doesn't keep
+                versions, in which case read models can't be cached.
+
+        """
+        return None
+
     def list(self):
         """List all payment channels urls in database.
 
@@ -97,6 +111,28 @@ class Sqlite3Database(DatabaseBase):
                                "CONSTRAINT state CHECK (state IN ('OPENING', 'CONFIRMING_DEPOSIT', 'READY', 'OUTSTANDING', 'CONFIRMING_SPEND', 'CLOSED'))"  # nopep8
                                ");")
 
+            # Channel versions are bumped by triggers, so that cached models
+            # can be checked even against writers that don't know about them
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "channel_versions ("
+                               "url VARCHAR NOT NULL PRIMARY KEY, "
+                               "version INTEGER NOT NULL"
+                               ");")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS channels_insert_version "
+                               "AFTER INSERT ON channels BEGIN "
+                               "INSERT OR REPLACE INTO channel_versions VALUES (NEW.url, 0); "
+                               "END;")
+            self._conn.execute("CREATE TRIGGER IF NOT EXISTS channels_update_version "
+                               "AFTER UPDATE ON channels BEGIN "
+                               "UPDATE channel_versions SET version=version+1 WHERE url=NEW.url; "
+                               "END;")
+            self._conn.execute("INSERT OR IGNORE INTO channel_versions SELECT url, 0 FROM channels")
+
+        # Versions read since another connection last committed, keyed by url
+        self._versions = {}
+        self._data_version = None
+        self._versions_lock = threading.Lock()
+
         if db_path == ":memory:":
             self._lock = threading.Lock()
         else:
@@ -161,6 +197,8 @@ class Sqlite3Database(DatabaseBase):
     def create(self, model):
         values = self._model_to_sqlite(model)
         self._conn.execute("INSERT INTO channels VALUES (?,?,?,?,?,?,?,?,?)", values)
+        with self._versions_lock:
+            self._versions.pop(model.url, None)
 
     def read(self, url):
         cur = self._conn.execute("SELECT * FROM channels WHERE url=? LIMIT 1", (url,))
@@ -169,6 +207,25 @@ class Sqlite3Database(DatabaseBase):
     def update(self, model):
         values = self._model_to_sqlite(model)
         self._conn.execute("UPDATE channels SET state=?, creation_time=?, deposit_tx=?, refund_tx=?, payment_tx=?, spend_tx=?, spend_txid=?, min_output_amount=? WHERE url=?", values[1:] + (values[0],))  # nopep8
+        with self._versions_lock:
+            self._versions.pop(model.url, None)
+
+    def read_version(self, url):
+        with self._versions_lock:
+            # The data version only changes when another connection commits,
+            # so versions read since then are still current, apart from those
+            # of the channels written through this connection.
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._versions.clear()
+                self._data_version = data_version
+
+            if url not in self._versions:
+                cur = self._conn.execute("SELECT version FROM channel_versions WHERE url=?", (url,))
+                row = cur.fetchone()
+                self._versions[url] = row[0] if row else None
+
+            return self._versions[url]
 
     def list(self):
         cur = self._conn.execute("SELECT url FROM channels")
@@ -186,6 +243,9 @@ class Sqlite3Database(DatabaseBase):
             self._conn.commit()
         else:
             self._conn.rollback()
+            # Versions of rolled back writes may have been read
+            with self._versions_lock:
+                self._versions.clear()
 
 
 class Sqlite3DatabaseLock:
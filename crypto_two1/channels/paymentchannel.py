@@ -83,6 +83,11 @@ class PaymentChannel:
         self._wallet = wallet
         self._blockchain = blockchain
 
+        # Version and state machine of the last model read or written, so
+        # that properties don't read and parse the model again until the
+        # channel is updated
+        self._cached = (None, None)
+
     @staticmethod
     def open(
             database, wallet, blockchain, url, deposit_amount, expiration_time, fee_amount, zeroconf,
@@ -222,19 +227,38 @@ class PaymentChannel:
 
             # Update database, if successful payment or channel closed
             self._database.update(model)
+            version = self._database.read_version(self._url)
+
+        self._cached = (version, sm)
 
         if closed:
             raise ClosedError("Channel closed by server.")
 
         return payment_txid
 
-    def sync(self):
+    def sync(self, confirmed=None, spend_txids=None):
         """Synchronize the payment channel with the blockchain.
 
         Update the payment channel in the cases of deposit confirmation or
         deposit spend, and refund the payment channel in the case of channel
         expiration.
+
+        Args:
+            confirmed (dict or None): Confirmations already looked up with
+                check_confirmed_many(), keyed by txid. Other transactions are
+                looked up individually.
+            spend_txids (dict or None): Deposit spends already looked up with
+                lookup_spend_txids(), keyed by (txid, output_index). Other
+                deposits are looked up individually.
         """
+        confirmed = confirmed or {}
+        spend_txids = spend_txids or {}
+
+        def check_confirmed(txid):
+            if txid in confirmed:
+                return confirmed[txid]
+            return self._blockchain.check_confirmed(txid)
+
         with self._database:
             # Look up database model
             model = self._database.read(self._url)
@@ -247,19 +271,23 @@ class PaymentChannel:
 
             # Check for deposit confirmation
             if sm.state == PaymentChannelState.CONFIRMING_DEPOSIT:
-                if self._blockchain.check_confirmed(sm.deposit_txid):
+                if check_confirmed(sm.deposit_txid):
                     sm.confirm()
                 elif (time.time() - sm.creation_time) > PaymentChannel.DEPOSIT_REBROADCAST_TIMEOUT:
                     self._blockchain.broadcast_tx(sm.deposit_tx)
 
             # Check if channel got closed
             if sm.state in (PaymentChannelState.CONFIRMING_SPEND, PaymentChannelState.READY):
-                spend_txid = self._blockchain.lookup_spend_txid(sm.deposit_txid, sm.deposit_tx_utxo_index)
+                outpoint = (sm.deposit_txid, sm.deposit_tx_utxo_index)
+                if outpoint in spend_txids:
+                    spend_txid = spend_txids[outpoint]
+                else:
+                    spend_txid = self._blockchain.lookup_spend_txid(*outpoint)
                 if spend_txid:
                     sm.close(spend_txid)
 
                     # If spend transaction got confirmed
-                    if self._blockchain.check_confirmed(spend_txid):
+                    if check_confirmed(spend_txid):
                         spend_tx = self._blockchain.lookup_tx(spend_txid)
                         sm.finalize(spend_tx)
 
@@ -271,6 +299,9 @@ class PaymentChannel:
 
             # Update database
             self._database.update(model)
+            version = self._database.read_version(self._url)
+
+        self._cached = (version, sm)
 
     def close(self):
         """Close the payment channel.
@@ -309,6 +340,32 @@ class PaymentChannel:
 
             # Update database
             self._database.update(model)
+            version = self._database.read_version(self._url)
+
+        self._cached = (version, sm)
+
+    def _read(self):
+        """Get the state machine of the channel, from the cache if the
+        channel hasn't been updated since it was last read or written.
+
+        The state machine and its model must not be modified.
+
+        Returns:
+            PaymentChannelStateMachine: State machine of the channel model.
+
+        """
+        version, sm = self._cached
+        current_version = self._database.read_version(self._url)
+        if current_version is None or current_version != version:
+            with self._database:
+                model = self._database.read(self._url)
+            sm = PaymentChannelStateMachine(model, self._wallet)
+
+            # Don't cache a model that was updated while it was read
+            if current_version == self._database.read_version(self._url):
+                self._cached = (current_version, sm)
+
+        return sm
 
     @property
     def url(self):
@@ -328,9 +385,7 @@ class PaymentChannel:
             PaymentChannelState: Payment channel state.
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            return model.state
+        return self._read().state
 
     @property
     def ready(self):
@@ -342,9 +397,7 @@ class PaymentChannel:
                 not.
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            return model.state == PaymentChannelState.READY
+        return self._read().state == PaymentChannelState.READY
 
     @property
     def balance(self):
@@ -354,10 +407,7 @@ class PaymentChannel:
             int: Balance amount.
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.balance_amount
+        return self._read().balance_amount
 
     @property
     def deposit(self):
@@ -367,10 +417,7 @@ class PaymentChannel:
             int: Deposit amount.
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.deposit_amount
+        return self._read().deposit_amount
 
     @property
     def fee(self):
@@ -380,10 +427,7 @@ class PaymentChannel:
             int: Fee amount.
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.fee_amount
+        return self._read().fee_amount
 
     @property
     def creation_time(self):
@@ -393,9 +437,7 @@ class PaymentChannel:
             float: Creation absolute time (UNIX time).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            return model.creation_time
+        return self._read().creation_time
 
     @property
     def expiration_time(self):
@@ -405,10 +447,7 @@ class PaymentChannel:
             int: Expiration absolute time (UNIX time).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.expiration_time
+        return self._read().expiration_time
 
     @property
     def expired(self):
@@ -418,10 +457,7 @@ class PaymentChannel:
             bool: True if payment channel is expired, False if it is not.
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return time.time() > sm.expiration_time
+        return time.time() > self._read().expiration_time
 
     @property
     def refund_tx(self):
@@ -431,10 +467,7 @@ class PaymentChannel:
             str or None: Serialized refund transaction (ASCII hex).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.refund_tx
+        return self._read().refund_tx
 
     @property
     def refund_txid(self):
@@ -444,10 +477,7 @@ class PaymentChannel:
             str or None: Deposit transaction ID (RPC byte order).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.refund_txid
+        return self._read().refund_txid
 
     @property
     def deposit_tx(self):
@@ -457,10 +487,7 @@ class PaymentChannel:
             str or None: Serialized deposit transaction (ASCII hex).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.deposit_tx
+        return self._read().deposit_tx
 
     @property
     def deposit_txid(self):
@@ -470,10 +497,7 @@ class PaymentChannel:
             str or None: Deposit transaction ID (RPC byte order).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.deposit_txid
+        return self._read().deposit_txid
 
     @property
     def payment_tx(self):
@@ -483,10 +507,7 @@ class PaymentChannel:
             str or None: Serialized payment transaction (ASCII hex).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.payment_tx
+        return self._read().payment_tx
 
     @property
     def spend_tx(self):
@@ -496,10 +517,7 @@ class PaymentChannel:
             str or None: Serialized spend transaction (ASCII hex).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.spend_tx
+        return self._read().spend_tx
 
     @property
     def spend_txid(self):
@@ -509,7 +527,4 @@ class PaymentChannel:
             str or None: Spend transaction ID (RPC byte order).
 
         """
-        with self._database:
-            model = self._database.read(self._url)
-            sm = PaymentChannelStateMachine(model, self._wallet)
-            return sm.spend_txid
+        return self._read().spend_txid
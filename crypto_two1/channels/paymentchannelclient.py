@@ -7,6 +7,7 @@ from . import walletwrapper
 from . import database
 from . import blockchain
 from . import paymentchannel
+from . import statemachine
 from crypto_two1 import TWO1_CHANNELS_FEE
 
 
@@ -162,13 +163,55 @@ class PaymentChannelClient:
                 # Sync channel
                 self._channels[url].sync()
             else:
-                # Sync all channels
-                for channel in self._channels.values():
+                # Sync all channels, with their blockchain state looked up
+                # in a few batches
+                channels = list(self._channels.values())
+                try:
+                    confirmed, spend_txids = self._lookup_channels(channels)
+                except Exception:
+                    logger.exception("Error while looking up channels:")
+                    confirmed, spend_txids = {}, {}
+
+                for channel in channels:
                     try:
-                        channel.sync()
+                        channel.sync(confirmed, spend_txids)
                     except Exception:
                         logger.exception("Error while syncing channel {}:".format(channel.url))
 
+    def _lookup_channels(self, channels):
+        """Look up the confirmations and spends that syncing channels needs.
+
+        Args:
+            channels (list(PaymentChannel)): Channels to look up.
+
+        Returns:
+            tuple: Confirmations keyed by txid, as returned by
+                check_confirmed_many(), and deposit spends keyed by (txid,
+                output_index), as returned by lookup_spend_txids().
+
+        """
+        deposit_txids = []
+        outpoints = []
+        with self._database:
+            for channel in channels:
+                model = self._database.read(channel.url)
+                sm = statemachine.PaymentChannelStateMachine(model, self._wallet)
+                if sm.state == statemachine.PaymentChannelState.CONFIRMING_DEPOSIT:
+                    deposit_txids.append(sm.deposit_txid)
+                elif sm.state in (statemachine.PaymentChannelState.CONFIRMING_SPEND,
+                                  statemachine.PaymentChannelState.READY):
+                    outpoints.append((sm.deposit_txid, sm.deposit_tx_utxo_index))
+
+        confirmed = self._blockchain.check_confirmed_many(deposit_txids) if deposit_txids else {}
+        spend_txids = self._blockchain.lookup_spend_txids(outpoints) if outpoints else {}
+
+        # Spends are finalized once they are confirmed
+        spends = [txid for txid in spend_txids.values() if txid]
+        if spends:
+            confirmed.update(self._blockchain.check_confirmed_many(spends))
+
+        return confirmed, spend_txids
+
     def pay(self, url, amount):
         """Pay to the payment channel.
 
@@ -818,7 +818,7 @@ $ 21 sell sweep
     utxos = wallet.get_utxos(include_unconfirmed=True, accounts=wallet._accounts)
     utxo_sum = wallet._sum_utxos(utxos)
 
-    fee_amounts = txn_fees.get_fees()
+    fee_amounts = txn_fees.get_fee_estimator().get_fees()
     total_value, num_utxos = utxo_sum
 
     def fee_calc_small(num_utxos, total_value, fee_amounts):
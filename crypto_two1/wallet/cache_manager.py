@@ -1,21 +1,41 @@
+import bisect
+import heapq
 import json
 import os
 import time
 
 from crypto_two1.bitcoin.hash import Hash
 from crypto_two1.bitcoin.script import Script
-from crypto_two1.bitcoin.txn import CoinbaseInput
 from crypto_two1.bitcoin.txn import TransactionInput
 from crypto_two1.bitcoin.txn import TransactionOutput
 from crypto_two1.bitcoin.txn import Transaction
 from crypto_two1.bitcoin.txn import UnspentTransactionOutput
-from crypto_two1.bitcoin.utils import key_hash_to_address
+from crypto_two1.wallet.cache_store import Sqlite3CacheStore
+from crypto_two1.wallet.utxo_selectors import UtxoIndex
 from crypto_two1.wallet.wallet_txn import WalletTransaction
 
 
 class CacheManager(object):
     """ This is a glorified dict that provides relational methods
         for getting transactions for addresses, etc.
+
+        When loaded lazily from a sqlite3 database (see `load_from_db`),
+        only the address cache, the metadata of each transaction and a
+        snapshot of the UTXOs and balances of the wallet's addresses are
+        loaded. Balance and UTXO queries are answered from the snapshot
+        and the full transactions are only deserialized, and the
+        secondary indexes built, once something needs them.
+
+        In compact mode, transactions that are buried under at least
+        COMPACT_MIN_CONFIRMATIONS blocks and whose outputs have all been
+        spent by confirmed transactions are kept only as their
+        serialized bytes and metadata. They no longer affect any UTXO
+        or balance, so they are only rehydrated when requested or when
+        something (e.g. a reorg) changes them.
+
+    Args:
+        testnet (bool): Whether or not the cache is for testnet.
+        compact (bool): Whether or not to use compact mode.
     """
     # Statuses
     UNCONFIRMED = 0x10
@@ -25,9 +45,10 @@ class CacheManager(object):
     UNKNOWN = 0x3
 
     PROVISIONAL_MAX_DURATION = 60*60  # 60 minutes
+    COMPACT_MIN_CONFIRMATIONS = 6
     CACHE_VERSION = "0.3.0"
 
-    def __init__(self, testnet=False):
+    def __init__(self, testnet=False, compact=False):
         self._address_cache = {}
         self._txns_by_addr = {}
         self._deposits_for_addr = {}
@@ -36,7 +57,46 @@ class CacheManager(object):
         self._outputs_cache = {}
         self._txn_cache = {}
 
+        # Compacted transactions, keyed by the 32-byte txid. Values are
+        # (txn bytes, block, block_hash bytes, confirmations,
+        # network_time, value, fees, spends) tuples where spends is a
+        # tuple of (spend txid bytes, spend index) for each output.
+        self._compact_txns = {}
+        self.compact = compact
+
+        # Materialized UTXO set and balances. These are kept up to
+        # date by _refresh_outpoint() whenever an outpoint's status
+        # may have changed.
+        self._output_addrs = {}
+        self._spenders = {}
+        self._outpoint_state = {}
+        self._utxos = {}
+        self._conf_utxos = {}
+        self._balances = {}
+        self._addr_acct = {}
+        self._acct_balances = {}
+        # Per-account (all, confirmed) UtxoIndex pairs
+        self._utxo_indexes = {}
+
+        # Min-heap of (expiration, txid) for provisional transactions
+        # and the time-ordered history index. The history index is
+        # built on first use.
+        self._provisional_heap = []
+        self._history = None
+        self._history_keys = {}
+
         self._dirty = False
+        self._dirty_txids = set()
+        self._deleted_txids = set()
+        self._dirty_addresses = set()
+        self._dirty_confirmations = set()
+        self._store = None
+
+        self._lazy = False
+        self._lazy_txn_meta = {}
+        self._lazy_addrs_with_txns = set()
+        self._lazy_utxos = {}
+        self._lazy_balances = {}
 
         self._last_block = None
 
@@ -92,12 +152,15 @@ class CacheManager(object):
             force (bool): Forces a write to the file even if the caches
                 are clean.
         """
-        if not self._dirty and not force:
+        if not self._dirty and not self._dirty_confirmations and not force:
             return
 
+        self._ensure_loaded()
+
         # All we really need to serialize is the address and txn caches
+        txns = {txid: self._get_txn(txid) for txid in self._all_txids()}
         d = json.dumps(dict(addresses=self._address_cache,
-                            txns=self._serialize_cache(self._txn_cache),
+                            txns=self._serialize_cache(txns),
                             last_block=self.last_block,
                             version=self.CACHE_VERSION),
                        sort_keys=True).encode('utf-8')
@@ -110,6 +173,242 @@ class CacheManager(object):
 
         self._dirty = False
 
+    def to_db(self, filename, force=False):
+        """ Writes the cache data to a sqlite3 database such that it is
+            recoverable using `load_from_db`. Only the transactions
+            and addresses that have changed since the last write are
+            written, unless the caches were not loaded from this
+            database or force=True, in which case the database is
+            rewritten entirely.
+
+        Args:
+            filename (str): The full path of the database file to write
+                the caches to.
+            force (bool): Forces a full write of the database even if the
+                caches are clean.
+        """
+        p = os.path.abspath(filename)
+        full = force
+        if self._store is None or self._store.db_path != p:
+            # The database may not reflect what's in memory, so
+            # rewrite it entirely.
+            self._ensure_loaded()
+            if self._store is not None:
+                self._store.close()
+            full = True
+            self._store = Sqlite3CacheStore(p)
+        elif full:
+            self._ensure_loaded()
+
+        pending = self._dirty or self._dirty_txids or \
+            self._deleted_txids or self._dirty_addresses or \
+            self._dirty_confirmations
+        if not full and not pending:
+            return
+
+        if full:
+            addresses = [(a, c, i, addr)
+                         for a, chains in self._address_cache.items()
+                         for c, indices in chains.items()
+                         for i, addr in indices.items()]
+            txids = self._all_txids()
+        else:
+            addresses = [k + (self.get_address(*k),)
+                         for k in self._dirty_addresses]
+            txids = [t for t in self._dirty_txids if self._has_txn(t)]
+
+        txns = []
+        for txid in txids:
+            txn = self._get_txn(txid)
+            addrs = self._get_txn_addresses(txn)
+            rec = dict(txn.address_record(self.testnet), testnet=self.testnet)
+            txns.append((txid, txn,
+                         set(a for addr_list in addrs['inputs'] + addrs['outputs']
+                             for a in addr_list),
+                         rec))
+
+        meta = dict(version=self.CACHE_VERSION)
+        if self.last_block is not None:
+            meta['last_block'] = self.last_block
+
+        # The snapshot only changes when transactions do. In lazy
+        # mode the only possible changes are confirmation counts,
+        # which are not part of the snapshot.
+        snapshot = None
+        if full or self._dirty_txids or self._deleted_txids:
+            snapshot = self._build_snapshot()
+            meta['snapshot'] = 1
+
+        confirmations = [(self._lazy_txn_meta[txid][2], txid)
+                         for txid in self._dirty_confirmations]
+
+        self._store.write(meta=meta,
+                          addresses=addresses,
+                          txns=txns,
+                          deleted_txids=self._deleted_txids,
+                          confirmations=confirmations,
+                          snapshot=snapshot,
+                          full=full)
+
+        self._clear_dirty()
+
+    def _build_snapshot(self):
+        """ Builds the UTXO and balance snapshot for all addresses in
+            the address cache that have transactions.
+
+        Returns:
+            tuple: (utxos, balances) in the format expected by
+                Sqlite3CacheStore.write().
+        """
+        addresses = [addr
+                     for chains in self._address_cache.values()
+                     for indices in chains.values()
+                     for addr in indices.values()
+                     if addr in self._txns_by_addr]
+
+        conf_utxos = self.get_utxos(addresses)
+        all_utxos = self.get_utxos(addresses, True)
+        conf_balances = self.get_balances(addresses)
+        all_balances = self.get_balances(addresses, True)
+
+        utxos = []
+        for addr, utxo_list in all_utxos.items():
+            conf = set((str(u.transaction_hash), u.outpoint_index)
+                       for u in conf_utxos.get(addr, []))
+            for u in utxo_list:
+                txid = str(u.transaction_hash)
+                utxos.append((addr, txid, u.outpoint_index, u.value,
+                              bytes(u.script),
+                              int((txid, u.outpoint_index) in conf)))
+
+        balances = [(addr, conf_balances[addr], all_balances[addr])
+                    for addr in addresses]
+
+        return utxos, balances
+
+    def _clear_dirty(self):
+        self._dirty = False
+        self._dirty_txids = set()
+        self._deleted_txids = set()
+        self._dirty_addresses = set()
+        self._dirty_confirmations = set()
+
+    def _ensure_loaded(self):
+        """ Deserializes all transactions and builds the secondary
+            indexes if the cache was loaded lazily.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        if not self._lazy:
+            return
+
+        self._lazy = False
+        dirty = self._dirty_confirmations
+        txn_meta = self._lazy_txn_meta
+
+        self._provisional_heap = []
+        self._history = None
+
+        txns = []
+        for txn in self._store.read_txns():
+            # Pick up confirmation updates that haven't been written yet.
+            txn.confirmations = txn_meta[str(txn.hash)][2]
+            txns.append(txn)
+        self._load_txns(txns, prune_provisional=False)
+
+        self._dirty_txids = dirty
+        self._dirty_confirmations = set()
+        self._lazy_txn_meta = {}
+        self._lazy_addrs_with_txns = set()
+        self._lazy_utxos = {}
+        self._lazy_balances = {}
+
+    def _load_txns(self, txns, prune_provisional=True):
+        """ Inserts deserialized transactions, pruning expired
+            provisional ones if requested.
+
+        Args:
+            txns (iterable): WalletTransaction objects to insert.
+            prune_provisional (bool): If True, does not insert
+                provisionally-marked txns that have expired.
+        """
+        now = time.time()
+        for t in txns:
+            if t.provisional:
+                if not prune_provisional or \
+                   t.provisional > now:
+                    self.insert_txn(t,
+                                    mark_provisional=True,
+                                    expiration=t.provisional)
+                else:
+                    self._deleted_txids.add(str(t.hash))
+            else:
+                self.insert_txn(t, mark_provisional=False)
+
+    def load_from_db(self, filename, prune_provisional=True, lazy=False):
+        """ Loads the cache manager from a sqlite3 database written
+            by `to_db`.
+
+        Args:
+            filename (str): The full path of the database file.
+            prune_provisional (bool): If True, does not insert
+                provisionally-marked txns that have expired.
+            lazy (bool): If True, only the addresses, the transaction
+                metadata and the UTXO/balance snapshot are loaded.
+                Transactions are deserialized on first use. If the
+                database has no snapshot or contains expired provisional
+                transactions, everything is loaded immediately.
+        """
+        store = Sqlite3CacheStore(os.path.abspath(filename))
+        meta = store.read_meta()
+        if meta.get("version", None) != self.CACHE_VERSION:
+            store.close()
+            return
+
+        if self._store is not None:
+            self._store.close()
+        self._store = store
+
+        if "last_block" in meta:
+            self.last_block = int(meta['last_block'])
+
+        for acct_index, chain, index, address in store.read_addresses():
+            if acct_index not in self._address_cache:
+                self._address_cache[acct_index] = {0: {}, 1: {}}
+            self._address_cache[acct_index][chain][index] = address
+        self._reindex_accounts()
+
+        if lazy and "snapshot" in meta:
+            txn_meta = {r[0]: list(r[1:]) for r in store.read_txn_meta()}
+            now = time.time()
+            expired = prune_provisional and \
+                any(m[4] and m[4] < now for m in txn_meta.values())
+            if not expired:
+                self._lazy = True
+                self._lazy_txn_meta = txn_meta
+                self._lazy_addrs_with_txns = store.read_addresses_with_txns()
+                for addr, txid, index, value, script, conf in store.read_utxos():
+                    self._lazy_utxos.setdefault(addr, []).append(
+                        (txid, index, value, script, conf))
+                self._lazy_balances = {addr: (conf, total)
+                                       for addr, conf, total in store.read_balances()}
+                self._provisional_heap = [(m[4], txid)
+                                          for txid, m in txn_meta.items()
+                                          if m[4]]
+                heapq.heapify(self._provisional_heap)
+                self._clear_dirty()
+                return
+
+        self._load_txns(store.read_txns(), prune_provisional)
+
+        # Everything just loaded is already in the database, only
+        # pruned provisional txns need to be written back.
+        deleted = self._deleted_txids
+        self._clear_dirty()
+        self._deleted_txids = deleted
+        self._dirty = bool(deleted)
+
     def load_from_dict(self, d, prune_provisional=True):
         """ Loads the cache manager from a dict
 
@@ -131,30 +430,30 @@ class CacheManager(object):
                                                        for k3, v3 in v2.items()}
                                              for k2, v2 in v1.items()}
                                    for k1, v1 in d['addresses'].items()}
+            self._reindex_accounts()
 
         if "txns" in d:
-            now = time.time()
-            for txid in d['txns']:
-                t = WalletTransaction._deserialize(d['txns'][txid])
-                if t.provisional:
-                    if not prune_provisional or \
-                       t.provisional > now:
-                        self.insert_txn(t,
-                                        mark_provisional=True,
-                                        expiration=t.provisional)
-                else:
-                    self.insert_txn(t, mark_provisional=False)
+            self._load_txns((WalletTransaction._deserialize(t)
+                             for t in d['txns'].values()),
+                            prune_provisional)
 
         self._dirty = True
 
-    def load_from_file(self, filename):
-        """ Loads the dicts from a JSON-serialized file.
+    def load_from_file(self, filename, lazy=False):
+        """ Loads the dicts from a JSON-serialized file or a
+            sqlite3 database written by `to_db`.
 
         Args:
             filename (str): The full path of the file containing the
-                JSON-serialized dicts.
+                JSON-serialized dicts or the sqlite3 database.
+            lazy (bool): Load lazily if the file is a sqlite3
+                database. See `load_from_db`.
         """
         cache_file = os.path.abspath(filename)
+        if Sqlite3CacheStore.is_sqlite_file(cache_file):
+            self.load_from_db(cache_file, lazy=lazy)
+            return
+
         with open(cache_file) as cf:
             cache = json.load(cf)
 
@@ -182,8 +481,35 @@ class CacheManager(object):
 
         self._address_cache[acct_index][chain][index] = address
 
+        self._addr_acct[address] = acct_index
+        if address in self._balances:
+            self._add_acct_balance(acct_index, *self._balances[address])
+        for key, utxo in self._utxos.get(address, {}).items():
+            self._index_utxo(address, utxo,
+                             key in self._conf_utxos.get(address, {}))
+
+        self._dirty_addresses.add((acct_index, chain, index))
         self._dirty = True
 
+    def _reindex_accounts(self):
+        """ Rebuilds the address to account map and the per-account
+            balances from the address cache.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        self._addr_acct = {addr: acct_index
+                           for acct_index, chains in self._address_cache.items()
+                           for indices in chains.values()
+                           for addr in indices.values()}
+        self._acct_balances = {}
+        self._utxo_indexes = {}
+        for addr, acct_index in self._addr_acct.items():
+            if addr in self._balances:
+                self._add_acct_balance(acct_index, *self._balances[addr])
+            for key, utxo in self._utxos.get(addr, {}).items():
+                self._index_utxo(addr, utxo, key in self._conf_utxos.get(addr, {}))
+
     def get_address(self, acct_index, chain, index):
         """ Returns the address for chain/index, if it exists in the cache
 
@@ -271,11 +597,141 @@ class CacheManager(object):
         """
         txid = str(wallet_txn.hash)
 
+        if self._lazy:
+            if self._lazy_update_confirmations(txid, wallet_txn,
+                                               mark_provisional):
+                return
+            self._ensure_loaded()
+
+        self._rehydrate(txid)
+
         # Check if it's already in with no change in status
         if txid in self._txn_cache and \
            wallet_txn._serialize() == self._txn_cache[txid]._serialize():
             return
 
+        outpoints = set()
+        self._insert_txn(txid, wallet_txn, mark_provisional, expiration,
+                         outpoints)
+        for out_txid, out_index in outpoints:
+            self._refresh_outpoint(out_txid, out_index)
+        if self.compact:
+            self._compact_txns_if_possible(set(t for t, _ in outpoints))
+
+        self._dirty = True
+
+    def insert_txns(self, wallet_txns):
+        """ Inserts a batch of confirmed or unconfirmed (but not
+            provisional) transactions, e.g. the results of a sync with
+            the data provider.
+
+            Transactions that are already in the cache with the same
+            block and number of confirmations are skipped without
+            being serialized or re-indexed.
+
+        Args:
+            wallet_txns (iterable): WalletTransaction objects to insert.
+
+        Returns:
+            int: The number of transactions that were inserted or updated.
+        """
+        changed = []
+        updated = 0
+        for wt in wallet_txns:
+            txid = str(wt.hash)
+
+            if self._lazy:
+                if self._lazy_update_confirmations(txid, wt, False):
+                    continue
+                self._ensure_loaded()
+
+            meta = self._get_txn_meta(txid)
+            if meta is not None and not meta[4] and \
+               meta[0] == wt.block and meta[1] == wt.block_hash:
+                if meta[2] == wt.confirmations:
+                    continue
+                if (meta[2] > 0) == (wt.confirmations > 0):
+                    # Only the depth changed, which doesn't affect the
+                    # status of any outputs.
+                    self._update_confirmations(txid, wt.confirmations)
+                    updated += 1
+                    continue
+
+            changed.append((txid, wt))
+
+        if not changed and not updated:
+            return 0
+
+        outpoints = set()
+        for txid, wt in changed:
+            self._rehydrate(txid)
+            self._insert_txn(txid, wt, False, 0, outpoints)
+        for out_txid, out_index in outpoints:
+            self._refresh_outpoint(out_txid, out_index)
+        if self.compact:
+            self._compact_txns_if_possible(set(t for t, _ in outpoints))
+
+        self._dirty = True
+
+        return len(changed) + updated
+
+    def _get_txn_meta(self, txid):
+        """ Returns (block, block_hash, confirmations, network_time,
+            provisional) for a cached transaction or None if it is
+            not in the cache.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        txn = self._txn_cache.get(txid, None)
+        if txn is not None:
+            return (txn.block, txn.block_hash, txn.confirmations,
+                    txn.network_time, txn.provisional)
+
+        rec = self._compact_txns.get(bytes.fromhex(txid), None)
+        if rec is not None:
+            return (rec[1], Hash(rec[2]) if rec[2] is not None else None,
+                    rec[3], rec[4], False)
+
+        return None
+
+    def _update_confirmations(self, txid, confirmations):
+        """ Updates the number of confirmations of a cached transaction
+            when its confirmed/unconfirmed state doesn't change.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        txn = self._txn_cache.get(txid, None)
+        if txn is not None:
+            txn.confirmations = confirmations
+            for i in range(len(txn.outputs)):
+                self._refresh_outpoint(txid, i)
+        else:
+            key = bytes.fromhex(txid)
+            rec = self._compact_txns[key]
+            self._compact_txns[key] = rec[:3] + (confirmations,) + rec[4:]
+
+        self._dirty_txids.add(txid)
+        self._dirty = True
+
+    def _insert_txn(self, txid, wallet_txn, mark_provisional, expiration,
+                    outpoints):
+        """ Updates the caches and indexes for a transaction.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txid (str): The txid of wallet_txn.
+            wallet_txn (WalletTransaction): The transaction to insert.
+            mark_provisional (bool): See `insert_txn`.
+            expiration (int): See `insert_txn`.
+            outpoints (set): Set that all (txid, index) outpoints
+                affected by the insertion are added to. The caller must
+                call _refresh_outpoint() for each of them.
+        """
+
         if mark_provisional and not wallet_txn.provisional:
             now = time.time()
             if expiration < 0:
@@ -289,7 +745,14 @@ class CacheManager(object):
         if not mark_provisional and wallet_txn.provisional:
             wallet_txn.provisional = False
 
+        if wallet_txn.provisional:
+            heapq.heappush(self._provisional_heap,
+                           (wallet_txn.provisional, txid))
+        self._update_history(txid, wallet_txn.network_time)
+
         self._txn_cache[txid] = wallet_txn
+        self._dirty_txids.add(txid)
+        self._deleted_txids.discard(txid)
 
         conf = wallet_txn.confirmations > 0
         status = self.SPENT
@@ -302,7 +765,8 @@ class CacheManager(object):
             out_status |= self.PROVISIONAL
 
         # Get all the addresses for the transaction
-        addrs = wallet_txn.get_addresses(self.testnet)
+        addrs = self._get_txn_addresses(wallet_txn)
+        self._output_addrs[txid] = addrs['outputs']
 
         if txid not in self._inputs_cache:
             self._inputs_cache[txid] = dict()
@@ -313,21 +777,18 @@ class CacheManager(object):
         for i, inp in enumerate(wallet_txn.inputs):
             self._inputs_cache[txid][i] = inp
 
-            if not isinstance(inp, CoinbaseInput) and inp.script.is_multisig_sig():
-                # Only keep the P2SH address
-                sig_info = inp.script.extract_multisig_sig_info()
-                redeem_version = Script.P2SH_TESTNET_VERSION if self.testnet \
-                    else Script.P2SH_MAINNET_VERSION
-                a = key_hash_to_address(
-                    sig_info['redeem_script'].hash160(), redeem_version)
-
-                addrs['inputs'][i] = [a]
-
             # Update the status of any outputs
             out_txid = str(inp.outpoint)
+            self._rehydrate(out_txid)
             if out_txid not in self._outputs_cache:
                 self._outputs_cache[out_txid] = {}
 
+            outpoint = (out_txid, inp.outpoint_index)
+            if outpoint not in self._spenders:
+                self._spenders[outpoint] = {}
+            self._spenders[outpoint][(txid, i)] = addrs['inputs'][i]
+            outpoints.add(outpoint)
+
             if inp.outpoint_index not in self._outputs_cache[out_txid]:
                 d = dict(output=None,
                          status=status,
@@ -358,7 +819,62 @@ class CacheManager(object):
         self._insert_txid(txid, addrs['inputs'], 'input')
         self._insert_txid(txid, addrs['outputs'], 'output')
 
-        self._dirty = True
+        for i in range(len(wallet_txn.outputs)):
+            outpoints.add((txid, i))
+
+    def _lazy_update_confirmations(self, txid, wallet_txn, mark_provisional):
+        """ Applies an insertion to a lazily loaded cache if the only
+            thing that may have changed is the number of confirmations
+            and the transaction remains confirmed/unconfirmed.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Returns:
+            bool: True if the insertion was handled, False if the
+                transactions need to be fully loaded.
+        """
+        m = self._lazy_txn_meta.get(txid, None)
+        if m is None or mark_provisional or wallet_txn.provisional or m[4]:
+            return False
+
+        block, block_hash, confirmations, network_time, _ = m
+        bh = bytes(wallet_txn.block_hash) if wallet_txn.block_hash is not None else None
+        if block != wallet_txn.block or block_hash != bh or \
+           network_time != wallet_txn.network_time or \
+           (confirmations > 0) != (wallet_txn.confirmations > 0):
+            return False
+
+        if confirmations != wallet_txn.confirmations:
+            m[2] = wallet_txn.confirmations
+            self._dirty_confirmations.add(txid)
+
+        return True
+
+    def _get_txn_addresses(self, wallet_txn):
+        """ Returns the addresses associated with a transaction, keeping
+            only the P2SH address for multisig inputs.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            wallet_txn (WalletTransaction): The transaction.
+
+        Returns:
+            dict: A dict with 'inputs' and 'outputs' keys, each a list
+                of lists of addresses (one list per input/output).
+        """
+        rec = wallet_txn.address_record(self.testnet)
+
+        inputs = rec['inputs']
+        if rec['p2sh_inputs']:
+            # Only keep the P2SH address for multisig inputs
+            inputs = list(inputs)
+            for i, a in rec['p2sh_inputs'].items():
+                inputs[i] = [a]
+
+        return dict(inputs=inputs, outputs=rec['outputs'])
 
     def _insert_txid(self, txid, addresses, inout):
         """ Inserts a txid into either the spends or deposits cache.
@@ -394,6 +910,107 @@ class CacheManager(object):
                     self._txns_by_addr[a] = set()
                 self._txns_by_addr[a].add(_txid)
 
+    def _all_txids(self):
+        return list(self._txn_cache.keys()) + \
+            [k.hex() for k in self._compact_txns.keys()]
+
+    def _has_txn(self, txid):
+        return txid in self._txn_cache or \
+            (bool(self._compact_txns) and
+             bytes.fromhex(txid) in self._compact_txns)
+
+    def _get_txn(self, txid):
+        """ Returns a cached transaction, creating a new object for
+            compacted transactions without rehydrating them.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        txn = self._txn_cache.get(txid, None)
+        if txn is not None or not self._compact_txns:
+            return txn
+
+        rec = self._compact_txns.get(bytes.fromhex(txid), None)
+        if rec is None:
+            return None
+
+        txn, _ = WalletTransaction.from_bytes(rec[0])
+        txn.block = rec[1]
+        txn.block_hash = Hash(rec[2]) if rec[2] is not None else None
+        txn.confirmations = rec[3]
+        txn.network_time = rec[4]
+        txn.value = rec[5]
+        txn.fees = rec[6]
+
+        return txn
+
+    def _compact_txns_if_possible(self, txids):
+        """ Compacts transactions that are buried deeply enough and
+            whose outputs have all been spent by confirmed transactions.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txids (iterable): txids of candidate transactions.
+        """
+        for txid in txids:
+            txn = self._txn_cache.get(txid, None)
+            if txn is None or txn.provisional or \
+               txn.confirmations < self.COMPACT_MIN_CONFIRMATIONS:
+                continue
+
+            outputs = self._outputs_cache[txid]
+            if len(outputs) != len(txn.outputs) or \
+               any(o['status'] != self.SPENT for o in outputs.values()):
+                continue
+
+            spends = tuple((bytes.fromhex(outputs[i]['spend_txid']),
+                            outputs[i]['spend_index'])
+                           for i in range(len(txn.outputs)))
+            block_hash = bytes(txn.block_hash) if txn.block_hash is not None else None
+            self._compact_txns[bytes.fromhex(txid)] = (
+                bytes(txn), txn.block, block_hash, txn.confirmations,
+                txn.network_time, txn.value, txn.fees, spends)
+
+            del self._txn_cache[txid]
+            del self._outputs_cache[txid]
+            self._inputs_cache.pop(txid, None)
+
+    def compact_all(self):
+        """ Compacts all transactions that can be compacted, regardless
+            of whether compact mode is enabled.
+        """
+        self._ensure_loaded()
+        self._compact_txns_if_possible(list(self._txn_cache.keys()))
+
+    def _rehydrate(self, txid):
+        """ Restores a compacted transaction into the regular caches.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txid (str): The txid of the transaction. Nothing is done
+                if it isn't compacted.
+        """
+        if not self._compact_txns:
+            return
+
+        txn = self._get_txn(txid)
+        if txn is None or txid in self._txn_cache:
+            return
+
+        spends = self._compact_txns.pop(bytes.fromhex(txid))[7]
+        self._txn_cache[txid] = txn
+        self._inputs_cache[txid] = {i: inp for i, inp in enumerate(txn.inputs)}
+        self._outputs_cache[txid] = {
+            i: dict(output=out,
+                    status=self.SPENT,
+                    spend_txid=spends[i][0].hex(),
+                    spend_index=spends[i][1])
+            for i, out in enumerate(txn.outputs)}
+
     def _delete_txn(self, txid):
         """ Removes a transaction from the cache and updates any
             ancestor/descendant transactions' statuses so that it was
@@ -407,27 +1024,41 @@ class CacheManager(object):
         Args:
             txid (Hash or str): The ID of the transaction to remove.
         """
+        self._ensure_loaded()
+
         _txid = str(txid)
+        self._rehydrate(_txid)
         if _txid not in self._txn_cache:
             return
 
         # Go through the inputs and outputs and update the statuses
         txn = self._txn_cache[_txid]
-        addrs = txn.get_addresses(self.testnet)
+        addrs = self._get_txn_addresses(txn)
 
         for i, inp in enumerate(txn.inputs):
             # Update the status of any outpoints
             out_txid = str(inp.outpoint)
 
-            x = self._outputs_cache[out_txid][inp.outpoint_index]
-            x['status'] = self.UNSPENT
-            out_txn = self._txn_cache[out_txid]
-            if out_txn.provisional:
-                x['status'] |= self.PROVISIONAL
-            if out_txn.confirmations == 0:
-                x['status'] |= self.UNCONFIRMED
-            x['spend_txid'] = None
-            x['spend_index'] = None
+            # The funding txn may never have been in the cache (e.g. an
+            # external deposit) or may have been removed already.
+            self._rehydrate(out_txid)
+            x = self._outputs_cache.get(out_txid, {}).get(inp.outpoint_index, None)
+            out_txn = self._txn_cache.get(out_txid, None)
+            if x is not None:
+                x['status'] = self.UNSPENT
+                if out_txn is not None and out_txn.provisional:
+                    x['status'] |= self.PROVISIONAL
+                if out_txn is not None and out_txn.confirmations == 0:
+                    x['status'] |= self.UNCONFIRMED
+                x['spend_txid'] = None
+                x['spend_index'] = None
+
+            outpoint = (out_txid, inp.outpoint_index)
+            spenders = self._spenders.get(outpoint, {})
+            spenders.pop((_txid, i), None)
+            if not spenders:
+                self._spenders.pop(outpoint, None)
+            self._refresh_outpoint(out_txid, inp.outpoint_index)
 
         addresses = set()
         for addr_list in addrs['inputs'] + addrs['outputs']:
@@ -448,24 +1079,233 @@ class CacheManager(object):
         if _txid in self._inputs_cache:
             del self._inputs_cache[_txid]
 
+        out_indices = list(self._outputs_cache.get(_txid, {}).keys())
         if _txid in self._outputs_cache:
             del self._outputs_cache[_txid]
+        self._output_addrs.pop(_txid, None)
+
+        for i in out_indices:
+            self._refresh_outpoint(_txid, i)
 
         del self._txn_cache[_txid]
+        self._remove_history(_txid)
+        self._dirty_txids.discard(_txid)
+        self._deleted_txids.add(_txid)
 
         self._dirty = True
 
+    def _refresh_outpoint(self, txid, index):
+        """ Recomputes the contribution of an outpoint to the
+            materialized UTXO set and balances.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            txid (str): The txid of the transaction containing the output.
+            index (int): The index of the output.
+        """
+        key = (txid, index)
+        old = self._outpoint_state.pop(key, None)
+        if old is not None:
+            _, conf, value, deposit_addrs, spend_addrs = old
+            for a in deposit_addrs:
+                self._unindex_utxo(a, key)
+                self._remove_utxo(self._utxos, a, key)
+                if conf:
+                    self._remove_utxo(self._conf_utxos, a, key)
+                self._add_balance(a, -value if conf else 0, -value)
+            for a in spend_addrs:
+                self._add_balance(a, -value, 0)
+
+        o = self._outputs_cache.get(txid, {}).get(index, None)
+        if o is None or o['output'] is None:
+            return
+
+        status = o['status']
+        value = o['output'].value
+        utxo = None
+        conf = False
+        deposit_addrs = []
+        spend_addrs = []
+        if status & self.UNSPENT:
+            conf = status == self.UNSPENT
+            deposit_addrs = set(self._output_addrs[txid][index])
+            utxo = UnspentTransactionOutput(
+                transaction_hash=Hash(txid),
+                outpoint_index=index,
+                value=value,
+                scr=o['output'].script,
+                confirmations=self._txn_cache[txid].confirmations)
+            for a in deposit_addrs:
+                self._utxos.setdefault(a, {})[key] = utxo
+                if conf:
+                    self._conf_utxos.setdefault(a, {})[key] = utxo
+                self._index_utxo(a, utxo, conf)
+                self._add_balance(a, value if conf else 0, value)
+
+        # Confirmed outputs with unconfirmed spends still count towards
+        # the confirmed balance of the spending addresses so that it
+        # doesn't appear unnecessarily low.
+        if (status & self.SPENT) and \
+           (status & self.UNCONFIRMED or status & self.PROVISIONAL) and \
+           self._txn_cache[txid].confirmations != 0:
+            spend_addrs = [a
+                           for addrs in self._spenders.get(key, {}).values()
+                           for a in set(addrs)]
+            for a in spend_addrs:
+                self._add_balance(a, value, 0)
+
+        if deposit_addrs or spend_addrs:
+            self._outpoint_state[key] = (utxo, conf, value,
+                                         deposit_addrs, spend_addrs)
+
+    def _index_utxo(self, addr, utxo, conf):
+        """ Adds a UTXO to the value index of the account owning addr.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        acct_index = self._addr_acct.get(addr, None)
+        if acct_index is None:
+            return
+        indexes = self._utxo_indexes.get(acct_index, None)
+        if indexes is None:
+            indexes = self._utxo_indexes[acct_index] = (UtxoIndex(), UtxoIndex())
+        indexes[0].add(addr, utxo)
+        if conf:
+            indexes[1].add(addr, utxo)
+
+    def _unindex_utxo(self, addr, key):
+        """ Removes a UTXO from the value index of the account owning
+            addr.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        indexes = self._utxo_indexes.get(self._addr_acct.get(addr, None), None)
+        if indexes is not None:
+            for index in indexes:
+                index.remove(addr, *key)
+
+    @staticmethod
+    def _remove_utxo(utxos, addr, key):
+        del utxos[addr][key]
+        if not utxos[addr]:
+            del utxos[addr]
+
+    def _add_balance(self, addr, confirmed, total):
+        if addr not in self._balances:
+            self._balances[addr] = [0, 0]
+        b = self._balances[addr]
+        b[0] += confirmed
+        b[1] += total
+
+        acct_index = self._addr_acct.get(addr, None)
+        if acct_index is not None:
+            self._add_acct_balance(acct_index, confirmed, total)
+
+    def _add_acct_balance(self, acct_index, confirmed, total):
+        if acct_index not in self._acct_balances:
+            self._acct_balances[acct_index] = [0, 0]
+        b = self._acct_balances[acct_index]
+        b[0] += confirmed
+        b[1] += total
+
     def prune_provisional_txns(self):
         """ Removes transactions marked as provisional if they are past
             their expiration time.
         """
         now = time.time()
-        txids = list(self._txn_cache.keys())
-        for txid in txids:
-            txn = self._txn_cache[txid]
-            if txn.provisional and txn.provisional < now:
+        heap = self._provisional_heap
+        while heap and heap[0][0] < now:
+            if self._lazy:
+                # This rebuilds the heap
+                self._ensure_loaded()
+                heap = self._provisional_heap
+                continue
+
+            # Entries for txns that have since been confirmed, deleted
+            # or given a new expiration are stale and just dropped.
+            expiration, txid = heapq.heappop(heap)
+            txn = self._txn_cache.get(txid, None)
+            if txn is not None and txn.provisional == expiration:
                 self._delete_txn(txid)
 
+    def _build_history(self):
+        """ Builds the time-ordered history index.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        if self._lazy:
+            times = ((txid, m[3]) for txid, m in self._lazy_txn_meta.items())
+        else:
+            times = [(txid, t.network_time) for txid, t in self._txn_cache.items()]
+            times += [(k.hex(), rec[4]) for k, rec in self._compact_txns.items()]
+
+        self._history_keys = {txid: (network_time or 0, txid)
+                              for txid, network_time in times}
+        self._history = sorted(self._history_keys.values())
+
+    def _update_history(self, txid, network_time):
+        if self._history is None:
+            return
+
+        key = (network_time or 0, txid)
+        curr = self._history_keys.get(txid, None)
+        if curr == key:
+            return
+        if curr is not None:
+            self._remove_history(txid)
+
+        bisect.insort(self._history, key)
+        self._history_keys[txid] = key
+
+    def _remove_history(self, txid):
+        if self._history is None:
+            return
+
+        key = self._history_keys.pop(txid, None)
+        if key is not None:
+            del self._history[bisect.bisect_left(self._history, key)]
+
+    def iter_history(self, reverse=False, after=None):
+        """ Iterates over the txids of all cached transactions in
+            order of network time.
+
+        Args:
+            reverse (bool): If True, the most recent transactions are
+                returned first.
+            after (str): If given, iteration starts immediately after
+                the transaction with this txid (in the direction of
+                iteration).
+
+        Returns:
+            generator: A generator of txids.
+        """
+        if self._history is None:
+            self._build_history()
+
+        history = self._history
+        start = len(history) - 1 if reverse else 0
+        if after is not None:
+            key = self._history_keys.get(after, None)
+            if key is None:
+                raise ValueError("%s is not in the cache." % after)
+            if reverse:
+                start = bisect.bisect_left(history, key) - 1
+            else:
+                start = bisect.bisect_right(history, key)
+
+        if reverse:
+            indices = range(start, -1, -1)
+        else:
+            indices = range(start, len(history))
+
+        for i in indices:
+            yield history[i][1]
+
     def has_txns(self, account_index=None):
         """ Returns whether or not there are any transactions in the cache.
 
@@ -477,7 +1317,9 @@ class CacheManager(object):
             bool: True if there are any transactions, False otherwise.
         """
         if account_index is None:
-            return bool(self._txn_cache)
+            if self._lazy:
+                return bool(self._lazy_txn_meta)
+            return bool(self._txn_cache) or bool(self._compact_txns)
         elif account_index in self._address_cache:
             for chain, chain_addrs in self._address_cache[account_index].items():
                 for i, addr in chain_addrs.items():
@@ -497,7 +1339,14 @@ class CacheManager(object):
                 None if the transaction is not in the cache.
         """
         _txid = str(txid) if isinstance(txid, Hash) else txid
-        return self._txn_cache.get(_txid, None)
+        if self._lazy:
+            if _txid not in self._lazy_txn_meta:
+                return None
+            txn = self._store.read_txn(_txid)
+            txn.confirmations = self._lazy_txn_meta[_txid][2]
+            return txn
+
+        return self._get_txn(_txid)
 
     def have_transaction(self, txid):
         """ Returns whether or not a txid (and associated transaction)
@@ -511,7 +1360,31 @@ class CacheManager(object):
                 None if the transaction is not in the cache.
         """
         _txid = str(txid) if isinstance(txid, Hash) else txid
-        return _txid in self._txn_cache and self._txn_cache[_txid]
+        if self._lazy:
+            return _txid in self._lazy_txn_meta and self.get_transaction(_txid)
+
+        return self._has_txn(_txid) and self.get_transaction(_txid)
+
+    def get_output(self, txid, index):
+        """ Returns an output of a cached transaction.
+
+        Args:
+            txid (str): The txid of the transaction.
+            index (int): The index of the output.
+
+        Returns:
+            TransactionOutput: The output or None if the transaction
+                is not in the cache.
+        """
+        if self._lazy:
+            txn = self.get_transaction(txid)
+            return txn.outputs[index] if txn is not None else None
+
+        o = self._outputs_cache.get(txid, {}).get(index, None)
+        if o is None and self._has_txn(txid):
+            return self._get_txn(txid).outputs[index]
+
+        return o['output'] if o is not None else None
 
     def get_txns_for_address(self, address):
         """ Returns a list of transactions for the address
@@ -523,6 +1396,11 @@ class CacheManager(object):
             list: A list of dicts containing transaction metadata and
                the Transaction object.
         """
+        if self._lazy:
+            if address not in self._lazy_addrs_with_txns:
+                return []
+            return self._store.read_txids_for_address(address)
+
         return list(self._txns_by_addr.get(address, set()))
 
     def address_has_txns(self, address):
@@ -536,6 +1414,9 @@ class CacheManager(object):
             bool: True if there are transactions for the address,
                 False otherwise.
         """
+        if self._lazy:
+            return address in self._lazy_addrs_with_txns
+
         return bool(self.get_txns_for_address(address))
 
     def get_utxos(self, addresses, include_unconfirmed=False):
@@ -551,6 +1432,141 @@ class CacheManager(object):
             dict: Keys are addresses, values are lists of
                 UnspentTransactionOutput objects for the address.
         """
+        if self._lazy:
+            if self._in_snapshot(addresses):
+                return self._lazy_get_utxos(addresses, include_unconfirmed)
+            self._ensure_loaded()
+
+        utxos = self._utxos if include_unconfirmed else self._conf_utxos
+        rv = {}
+        for addr in addresses:
+            if addr in utxos:
+                rv[addr] = list(utxos[addr].values())
+
+        return rv
+
+    def get_balances(self, addresses, include_unconfirmed=False):
+        """ Returns a dict containing the balances for the desired
+            addresses
+
+        Args:
+            addresses (list): List of addresses to get balances for
+            include_unconfirmed (bool): True if unconfirmed
+                transactions should be included in the balance.
+
+        Returns:
+            dict: Keys are addresses, values are balances for the address.
+        """
+        if self._lazy:
+            if self._in_snapshot(addresses):
+                i = 1 if include_unconfirmed else 0
+                return {addr: self._lazy_balances[addr][i]
+                        if addr in self._lazy_balances else 0
+                        for addr in addresses}
+            self._ensure_loaded()
+
+        i = 1 if include_unconfirmed else 0
+        return {addr: self._balances[addr][i] if addr in self._balances else 0
+                for addr in addresses}
+
+    def get_account_balances(self, acct_index):
+        """ Returns the balances of all addresses of an account.
+
+        Args:
+            acct_index (int): Account index within wallet
+
+        Returns:
+            dict: Dict with 'confirmed' and 'total' balances.
+        """
+        if self._lazy:
+            addresses = [addr
+                         for indices in self._address_cache.get(acct_index, {}).values()
+                         for addr in indices.values()]
+            if self._in_snapshot(addresses):
+                return dict(confirmed=sum(self.get_balances(addresses).values()),
+                            total=sum(self.get_balances(addresses, True).values()))
+            self._ensure_loaded()
+
+        confirmed, total = self._acct_balances.get(acct_index, [0, 0])
+        return dict(confirmed=confirmed, total=total)
+
+    def get_utxo_index(self, acct_index, include_unconfirmed=False):
+        """ Returns the value-sorted index of an account's UTXOs.
+
+            The index is maintained by the cache and must not be
+            modified by the caller. It can be passed directly to a
+            utxo_selector.
+
+        Args:
+            acct_index (int): Account index within wallet
+            include_unconfirmed (bool): True if unconfirmed UTXOs
+                should be included.
+
+        Returns:
+            UtxoIndex: The index.
+        """
+        self._ensure_loaded()
+
+        indexes = self._utxo_indexes.get(acct_index, None)
+        if indexes is None:
+            indexes = self._utxo_indexes[acct_index] = (UtxoIndex(), UtxoIndex())
+        return indexes[0] if include_unconfirmed else indexes[1]
+
+    def check_consistency(self):
+        """ Checks the materialized UTXO set and balances against
+            values computed from scratch from the transaction caches.
+
+        Returns:
+            bool: True if everything matches, False otherwise.
+        """
+        self._ensure_loaded()
+
+        addresses = set(self._deposits_for_addr.keys()) | \
+            set(self._spends_for_addr.keys()) | \
+            set(self._balances.keys()) | set(self._utxos.keys())
+
+        def _key(u):
+            return (str(u.transaction_hash), u.outpoint_index, u.value,
+                    u.num_confirmations)
+
+        for include_unconfirmed in [False, True]:
+            exp = self._scan_utxos(addresses, include_unconfirmed)
+            utxos = self.get_utxos(addresses, include_unconfirmed)
+            if set(exp.keys()) != set(utxos.keys()):
+                return False
+            for addr, utxo_list in exp.items():
+                if sorted(map(_key, utxo_list)) != sorted(map(_key, utxos[addr])):
+                    return False
+
+            exp = self._scan_balances(addresses, include_unconfirmed)
+            if exp != self.get_balances(addresses, include_unconfirmed):
+                return False
+
+        for acct_index, chains in self._address_cache.items():
+            acct_addrs = [addr for indices in chains.values()
+                          for addr in indices.values()]
+            exp = dict(confirmed=sum(self._scan_balances(acct_addrs).values()),
+                       total=sum(self._scan_balances(acct_addrs, True).values()))
+            if exp != self.get_account_balances(acct_index):
+                return False
+
+            for include_unconfirmed in [False, True]:
+                exp = self.get_utxos(acct_addrs, include_unconfirmed)
+                index = self.get_utxo_index(acct_index, include_unconfirmed)
+                if {a: sorted(map(_key, u)) for a, u in exp.items()} != \
+                   {a: sorted(map(_key, u)) for a, u in index.items()} or \
+                   index.total_value != sum(u.value for ul in exp.values() for u in ul):
+                    return False
+
+        return True
+
+    def _scan_utxos(self, addresses, include_unconfirmed=False):
+        """ Computes the UTXOs for addresses by walking the deposits
+            of each address. Used to check the materialized UTXO set.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
         unconfirmed_mask = self.UNSPENT | self.UNCONFIRMED | self.PROVISIONAL
         rv = {}
         for addr in addresses:
@@ -559,6 +1575,10 @@ class CacheManager(object):
                 continue
 
             for txid in self._deposits_for_addr[addr]:
+                if txid not in self._txn_cache:
+                    # Compacted, so all outputs are spent
+                    continue
+
                 for i in self._deposits_for_addr[addr][txid]:
                     # Look up the status in the outputs cache
                     if txid not in self._outputs_cache or \
@@ -584,20 +1604,16 @@ class CacheManager(object):
 
         return rv
 
-    def get_balances(self, addresses, include_unconfirmed=False):
-        """ Returns a dict containing the balances for the desired
-            addresses
-
-        Args:
-            addresses (list): List of addresses to get balances for
-            include_unconfirmed (bool): True if unconfirmed
-                transactions should be included in the balance.
+    def _scan_balances(self, addresses, include_unconfirmed=False):
+        """ Computes the balances for addresses by walking the UTXOs
+            and spends of each address. Used to check the materialized
+            balances.
 
-        Returns:
-            dict: Keys are addresses, values are balances for the address.
+        Note:
+            THIS IS NOT A PUBLIC API.
         """
         # Confirmed Balance = sum(all confirmed utxos) + unconfirmed spends
-        utxos_by_addr = self.get_utxos(addresses, include_unconfirmed)
+        utxos_by_addr = self._scan_utxos(addresses, include_unconfirmed)
 
         balances = {}
 
@@ -610,13 +1626,19 @@ class CacheManager(object):
                 # unconfirmed spends so that we're not unnecessarily
                 # showing a lower confirmed balance
                 for txid, indices in self._spends_for_addr[addr].items():
+                    if txid not in self._inputs_cache:
+                        # Compacted, so the spend is confirmed
+                        continue
+
                     for i in indices:
                         inp = self._inputs_cache[txid][i]
                         out_txid = str(inp.outpoint)
                         out_index = inp.outpoint_index
 
-                        # Don't add in chained unconfirmed spends
-                        if self._txn_cache[out_txid].confirmations == 0:
+                        # Don't add in chained unconfirmed spends or
+                        # spends of outputs we know nothing about
+                        if out_txid not in self._txn_cache or \
+                           self._txn_cache[out_txid].confirmations == 0:
                             continue
 
                         # Look up the outpoint index and see what
@@ -634,3 +1656,40 @@ class CacheManager(object):
                 balances[addr] = 0
 
         return balances
+
+    def _in_snapshot(self, addresses):
+        """ Returns whether the UTXOs and balances of all addresses
+            can be answered from the lazily loaded snapshot.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        return all(addr in self._lazy_balances or
+                   addr not in self._lazy_addrs_with_txns
+                   for addr in addresses)
+
+    def _lazy_get_utxos(self, addresses, include_unconfirmed=False):
+        """ Returns UTXOs from the lazily loaded snapshot in the same
+            format as `get_utxos`.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        rv = {}
+        for addr in addresses:
+            for txid, i, value, script, conf in self._lazy_utxos.get(addr, []):
+                if not conf and not include_unconfirmed:
+                    continue
+
+                utxo = UnspentTransactionOutput(
+                    transaction_hash=Hash(txid),
+                    outpoint_index=i,
+                    value=value,
+                    scr=Script(script),
+                    confirmations=self._lazy_txn_meta[txid][2])
+
+                if addr not in rv:
+                    rv[addr] = []
+                rv[addr].append(utxo)
+
+        return rv
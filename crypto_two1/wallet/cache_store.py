@@ -0,0 +1,319 @@
+"""Provides persistent, incremental storage of the wallet cache."""
+import json
+import os
+import sqlite3
+
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.wallet.wallet_txn import WalletTransaction
+
+
+class Sqlite3CacheStore(object):
+    """ Sqlite3 storage backend for CacheManager.
+
+        Transactions are stored as serialized binary blobs along with
+        their metadata. Rows are only written for transactions and
+        addresses that have changed since the last write, so the cost
+        of saving the cache is proportional to the amount of new
+        activity rather than the lifetime history of the wallet.
+
+    Args:
+        db_path (str): Path to the database file. It is created if
+            it does not exist.
+    """
+    SQLITE_HEADER = b"SQLite format 3\x00"
+
+    @staticmethod
+    def is_sqlite_file(path):
+        """ Returns whether or not the file at path is a sqlite3 database.
+
+        Args:
+            path (str): Path to the file to check.
+
+        Returns:
+            bool: True if the file is a sqlite3 database, False otherwise.
+        """
+        try:
+            with open(path, 'rb') as f:
+                return f.read(16) == Sqlite3CacheStore.SQLITE_HEADER
+        except OSError:
+            return False
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+        # Make sure the file is only readable by the owner, the same
+        # as the JSON cache.
+        if db_path != ":memory:" and not os.path.exists(db_path):
+            os.close(os.open(db_path, flags=os.O_WRONLY | os.O_CREAT,
+                             mode=0o700))
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "meta ("
+                               "key VARCHAR NOT NULL PRIMARY KEY, "
+                               "value VARCHAR"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "addresses ("
+                               "account INTEGER NOT NULL, "
+                               "chain INTEGER NOT NULL, "
+                               "idx INTEGER NOT NULL, "
+                               "address VARCHAR NOT NULL, "
+                               "PRIMARY KEY (account, chain, idx)"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "txns ("
+                               "txid VARCHAR(64) NOT NULL PRIMARY KEY, "
+                               "txn BLOB NOT NULL, "
+                               "block INTEGER, "
+                               "block_hash BLOB, "
+                               "confirmations INTEGER, "
+                               "network_time INTEGER, "
+                               "value INTEGER, "
+                               "fees INTEGER, "
+                               "provisional FLOAT"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "txn_addresses ("
+                               "address VARCHAR NOT NULL, "
+                               "txid VARCHAR(64) NOT NULL, "
+                               "PRIMARY KEY (address, txid)"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "txn_records ("
+                               "txid VARCHAR(64) NOT NULL PRIMARY KEY, "
+                               "record VARCHAR NOT NULL"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "utxos ("
+                               "address VARCHAR NOT NULL, "
+                               "txid VARCHAR(64) NOT NULL, "
+                               "idx INTEGER NOT NULL, "
+                               "value INTEGER NOT NULL, "
+                               "script BLOB NOT NULL, "
+                               "confirmed INTEGER NOT NULL, "
+                               "PRIMARY KEY (txid, idx)"
+                               ");")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                               "balances ("
+                               "address VARCHAR NOT NULL PRIMARY KEY, "
+                               "confirmed INTEGER NOT NULL, "
+                               "total INTEGER NOT NULL"
+                               ");")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS "
+                               "addresses_address ON addresses (address);")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS "
+                               "txns_block ON txns (block);")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS "
+                               "txns_provisional ON txns (provisional);")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS "
+                               "txn_addresses_txid ON txn_addresses (txid);")
+
+    @staticmethod
+    def _txn_to_sqlite(txid, txn):
+        """ Converts a WalletTransaction into a tuple of sqlite values.
+
+        Args:
+            txid (str): The txid of the transaction.
+            txn (WalletTransaction): The transaction.
+
+        Returns:
+            tuple: Tuple of sqlite values representing the transaction.
+        """
+        block_hash = bytes(txn.block_hash) if txn.block_hash is not None else None
+        return (txid, bytes(txn), txn.block, block_hash, txn.confirmations,
+                txn.network_time, txn.value, txn.fees, txn.provisional or 0)
+
+    @staticmethod
+    def _sqlite_to_txn(values):
+        """ Converts a tuple of sqlite values into a WalletTransaction.
+
+        Args:
+            values (tuple): Tuple of sqlite values as returned by
+                _txn_to_sqlite, optionally followed by the JSON-encoded
+                address record of the transaction.
+
+        Returns:
+            WalletTransaction: The deserialized transaction.
+        """
+        txn, _ = WalletTransaction.from_bytes(values[1])
+        txn.block = values[2]
+        txn.block_hash = Hash(values[3]) if values[3] is not None else None
+        txn.confirmations = values[4]
+        txn.network_time = values[5]
+        txn.value = values[6]
+        txn.fees = values[7]
+        txn.provisional = values[8] or False
+
+        if len(values) > 9 and values[9] is not None:
+            rec = json.loads(values[9])
+            txn._set_address_record(rec.pop('testnet'), rec)
+
+        return txn
+
+    def read_meta(self):
+        """ Returns the stored metadata.
+
+        Returns:
+            dict: Key/value pairs of metadata (e.g. 'version', 'last_block').
+        """
+        cur = self._conn.execute("SELECT key, value FROM meta")
+        return {k: v for k, v in cur.fetchall()}
+
+    def read_addresses(self):
+        """ Returns all stored addresses.
+
+        Returns:
+            list(tuple): List of (account, chain, index, address) tuples.
+        """
+        cur = self._conn.execute("SELECT account, chain, idx, address FROM addresses")
+        return cur.fetchall()
+
+    def read_txns(self):
+        """ Returns a generator over all stored transactions.
+
+        Yields:
+            WalletTransaction: A stored transaction.
+        """
+        cur = self._conn.execute("SELECT txns.*, txn_records.record FROM txns "
+                                 "LEFT JOIN txn_records USING (txid)")
+        for row in cur:
+            yield self._sqlite_to_txn(row)
+
+    def read_txn(self, txid):
+        """ Returns a single stored transaction.
+
+        Args:
+            txid (str): The txid of the transaction.
+
+        Returns:
+            WalletTransaction: The transaction or None if it is not stored.
+        """
+        cur = self._conn.execute("SELECT txns.*, txn_records.record FROM txns "
+                                 "LEFT JOIN txn_records USING (txid) "
+                                 "WHERE txid=? LIMIT 1", (txid,))
+        row = cur.fetchone()
+        return self._sqlite_to_txn(row) if row is not None else None
+
+    def read_txn_meta(self):
+        """ Returns the metadata of all stored transactions without
+            deserializing the transactions themselves.
+
+        Returns:
+            list(tuple): List of (txid, block, block_hash,
+                confirmations, network_time, provisional) tuples.
+        """
+        cur = self._conn.execute("SELECT txid, block, block_hash, confirmations, "
+                                 "network_time, provisional FROM txns")
+        return cur.fetchall()
+
+    def read_txids_for_address(self, address):
+        """ Returns the txids of all stored transactions associated
+            with address.
+
+        Args:
+            address (str): The address.
+
+        Returns:
+            list(str): List of txids.
+        """
+        cur = self._conn.execute("SELECT txid FROM txn_addresses WHERE address=?", (address,))
+        return [row[0] for row in cur.fetchall()]
+
+    def read_addresses_with_txns(self):
+        """ Returns all addresses that have stored transactions.
+
+        Returns:
+            set(str): Set of addresses.
+        """
+        cur = self._conn.execute("SELECT DISTINCT address FROM txn_addresses")
+        return set(row[0] for row in cur.fetchall())
+
+    def read_utxos(self):
+        """ Returns the stored UTXO snapshot.
+
+        Returns:
+            list(tuple): List of (address, txid, index, value, script,
+                confirmed) tuples.
+        """
+        cur = self._conn.execute("SELECT address, txid, idx, value, script, confirmed FROM utxos")
+        return cur.fetchall()
+
+    def read_balances(self):
+        """ Returns the stored balance snapshot.
+
+        Returns:
+            list(tuple): List of (address, confirmed, total) tuples.
+        """
+        cur = self._conn.execute("SELECT address, confirmed, total FROM balances")
+        return cur.fetchall()
+
+    def write(self, meta, addresses, txns, deleted_txids,
+              confirmations=None, snapshot=None, full=False):
+        """ Writes changed rows to the database in a single transaction.
+
+        Args:
+            meta (dict): Key/value pairs of metadata to store.
+            addresses (list(tuple)): List of (account, chain, index,
+                address) tuples to store.
+            txns (list(tuple)): List of (txid, WalletTransaction,
+                addresses, record) tuples to store, where addresses is
+                an iterable of all addresses associated with the
+                transaction and record is its address record (see
+                WalletTransaction.address_record()) with an additional
+                'testnet' key.
+            deleted_txids (iterable): txids of transactions to remove.
+            confirmations (list(tuple)): List of (confirmations, txid)
+                tuples for transactions where only the number of
+                confirmations has changed.
+            snapshot (tuple): If not None, a (utxos, balances) tuple
+                that replaces the stored UTXO and balance snapshot. The
+                rows are in the formats returned by read_utxos() and
+                read_balances() respectively.
+            full (bool): If True, all existing rows are removed before
+                writing, i.e. the database is rewritten from scratch.
+        """
+        confirmations = confirmations or []
+        with self._conn:
+            if full:
+                for table in ["meta", "addresses", "txns", "txn_addresses",
+                              "txn_records", "utxos", "balances"]:
+                    self._conn.execute("DELETE FROM %s" % table)
+
+            self._conn.executemany("INSERT OR REPLACE INTO meta VALUES (?,?)",
+                                   [(k, str(v)) for k, v in meta.items()])
+            self._conn.executemany("INSERT OR REPLACE INTO addresses VALUES (?,?,?,?)",
+                                   addresses)
+
+            deleted = [(txid,) for txid in deleted_txids]
+            updated = [(txid,) for txid, _, _, _ in txns]
+            self._conn.executemany("DELETE FROM txns WHERE txid=?", deleted)
+            self._conn.executemany("DELETE FROM txn_records WHERE txid=?", deleted)
+            self._conn.executemany("DELETE FROM txn_addresses WHERE txid=?",
+                                   deleted + updated)
+
+            self._conn.executemany("INSERT OR REPLACE INTO txns VALUES (?,?,?,?,?,?,?,?,?)",
+                                   [self._txn_to_sqlite(txid, txn)
+                                    for txid, txn, _, _ in txns])
+            self._conn.executemany("INSERT OR IGNORE INTO txn_addresses VALUES (?,?)",
+                                   [(a, txid)
+                                    for txid, _, addrs, _ in txns
+                                    for a in addrs])
+            self._conn.executemany("INSERT OR REPLACE INTO txn_records VALUES (?,?)",
+                                   [(txid, json.dumps(rec))
+                                    for txid, _, _, rec in txns])
+            self._conn.executemany("UPDATE txns SET confirmations=? WHERE txid=?",
+                                   confirmations)
+
+            if snapshot is not None:
+                utxos, balances = snapshot
+                self._conn.execute("DELETE FROM utxos")
+                self._conn.execute("DELETE FROM balances")
+                self._conn.executemany("INSERT INTO utxos VALUES (?,?,?,?,?,?)", utxos)
+                self._conn.executemany("INSERT INTO balances VALUES (?,?,?)", balances)
+
+    def close(self):
+        """ Closes the underlying database connection.
+        """
+        self._conn.close()
@@ -72,3 +72,11 @@ class OverfullTransactionException(TransactionBuilderException):
 
 class UnreasonableFeeError(WalletError):
     pass
+
+
+class UtxoReservedError(WalletError):
+    pass
+
+
+class TransactionTooLargeError(WalletError):
+    pass
@@ -1,4 +1,7 @@
 import logging
+import threading
+import time
+
 import requests
 
 from crypto_two1.wallet import exceptions
@@ -24,28 +27,242 @@ DUST_LIMIT = int(DUST_LIMIT_PER_KB * 0.20 * 3)
 
 _fee_host = "https://bitcoinfees.21.co/"
 
+# Seconds to wait for the fee server before giving up
+DEFAULT_FEE_TIMEOUT = 3.0
+# Seconds a fee quote is considered fresh
+DEFAULT_FEE_TTL = 600
+# Seconds to wait before retrying after a failed fee request
+DEFAULT_FEE_RETRY_INTERVAL = 60
+
 logger = logging.getLogger('wallet')
 
 
-def get_fees():
-    try:
-        response = requests.get(_fee_host + "v1/fees/recommended")
-        if response.status_code == 200:
-            fee_per_kb = response.json()['halfHourFee'] * 1000
-        else:
-            raise requests.ConnectionError('Received status_code %d' % response.status_code)
-    except requests.RequestException as error:
-        fee_per_kb = DEFAULT_FEE_PER_KB
-        logger.error(
-            "Error getting recommended fees from server: %s. Using defaults." %
-            error)
-
+def _check_fee(fee_per_kb):
     if not 0 <= fee_per_kb <= 2 * DEFAULT_FEE_PER_KB:
         raise exceptions.UnreasonableFeeError(
             'Unreasonable fee per kB: %s' % fee_per_kb)
 
+
+def _fee_amounts(fee_per_kb):
     return {
         'per_kb': fee_per_kb,
         'per_input': int(DEFAULT_INPUT_SIZE_KB * fee_per_kb),
         'per_output': int(DEFAULT_OUTPUT_SIZE_KB * fee_per_kb)
     }
+
+
+class FeeSource(object):
+    """ Abstract base class for sources of recommended fee rates.
+    """
+
+    def get_fee_per_kb(self):
+        """ Returns the recommended fee rate.
+
+        Returns:
+            int: The fee in satoshis per kB.
+        """
+        raise NotImplementedError
+
+
+class StaticFeeSource(FeeSource):
+    """ Fee source that always returns a fixed fee rate. Useful for
+        tests and offline deployments.
+
+    Args:
+        fee_per_kb (int): The fee in satoshis per kB.
+    """
+
+    def __init__(self, fee_per_kb=DEFAULT_FEE_PER_KB):
+        self.fee_per_kb = fee_per_kb
+
+    def get_fee_per_kb(self):
+        return self.fee_per_kb
+
+
+class BitcoinFeesSource(FeeSource):
+    """ Fee source that requests the recommended fee rate from a
+        bitcoinfees server.
+
+    Args:
+        host (str): URL of the server.
+        timeout (float): Seconds to wait for the server to respond.
+    """
+
+    def __init__(self, host=None, timeout=DEFAULT_FEE_TIMEOUT):
+        self.host = host if host is not None else _fee_host
+        self.timeout = timeout
+
+    def get_fee_per_kb(self):
+        response = requests.get(self.host + "v1/fees/recommended",
+                                timeout=self.timeout)
+        if response.status_code != 200:
+            raise requests.ConnectionError('Received status_code %d' % response.status_code)
+        return response.json()['halfHourFee'] * 1000
+
+
+class FeeEstimator(object):
+    """ Caches fee quotes from a FeeSource so that fee lookups do not
+        block on the network.
+
+        A quote is reused for ttl seconds. Once it is stale it is still
+        returned while a new one is requested in a background thread.
+        Before the first quote arrives lookups wait at most timeout
+        seconds and then use fallback_fee_per_kb. Quotes outside the
+        range accepted by get_fees() are discarded.
+
+    Args:
+        source (FeeSource): Where to get fee quotes from. Defaults to
+            a BitcoinFeesSource.
+        ttl (float): Seconds a quote is considered fresh.
+        timeout (float): Maximum number of seconds a lookup waits
+            for the first quote.
+        fallback_fee_per_kb (int): Fee per kB to use when no quote
+            is available.
+        background (bool): If False, stale quotes are refreshed
+            synchronously by the lookup instead of in a background
+            thread.
+        retry_interval (float): Seconds to wait before retrying after
+            a failed request.
+    """
+
+    def __init__(self, source=None, ttl=DEFAULT_FEE_TTL,
+                 timeout=DEFAULT_FEE_TIMEOUT,
+                 fallback_fee_per_kb=DEFAULT_FEE_PER_KB,
+                 background=True,
+                 retry_interval=DEFAULT_FEE_RETRY_INTERVAL):
+        self.source = source if source is not None else BitcoinFeesSource(timeout=timeout)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.fallback_fee_per_kb = fallback_fee_per_kb
+        self.background = background
+        self.retry_interval = retry_interval
+
+        self._lock = threading.Lock()
+        self._fee_per_kb = None
+        self._updated = None
+        self._next_attempt = 0
+        self._refreshing = None
+
+    def refresh(self):
+        """ Synchronously requests a new quote from the source.
+
+        Returns:
+            bool: True if a new quote was obtained, False otherwise.
+        """
+        try:
+            fee_per_kb = self.source.get_fee_per_kb()
+            _check_fee(fee_per_kb)
+        except Exception as error:
+            logger.error("Error getting recommended fees: %s" % error)
+            with self._lock:
+                self._next_attempt = time.monotonic() + self.retry_interval
+            return False
+
+        with self._lock:
+            self._fee_per_kb = fee_per_kb
+            self._updated = time.monotonic()
+            self._next_attempt = 0
+        return True
+
+    def _start_refresh(self):
+        # Private, returns an Event that is set when the in-flight
+        # background refresh completes.
+        with self._lock:
+            if self._refreshing is not None:
+                return self._refreshing
+            done = self._refreshing = threading.Event()
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = None
+                done.set()
+
+        threading.Thread(target=run, name="FeeEstimator", daemon=True).start()
+        return done
+
+    def get_fee_per_kb(self):
+        """ Returns the current fee rate.
+
+        Returns:
+            int: The fee in satoshis per kB.
+        """
+        now = time.monotonic()
+        with self._lock:
+            fee_per_kb = self._fee_per_kb
+            fresh = fee_per_kb is not None and now - self._updated < self.ttl
+            retry = now >= self._next_attempt
+
+        if not fresh and retry:
+            if not self.background:
+                self.refresh()
+            else:
+                done = self._start_refresh()
+                if fee_per_kb is None:
+                    done.wait(self.timeout)
+            with self._lock:
+                fee_per_kb = self._fee_per_kb
+
+        return fee_per_kb if fee_per_kb is not None else self.fallback_fee_per_kb
+
+    def get_fees(self):
+        """ Returns the current fee amounts.
+
+        Returns:
+            dict: A dict with keys 'per_kb', 'per_input' and
+                'per_output', in the same format as get_fees().
+        """
+        return _fee_amounts(self.get_fee_per_kb())
+
+
+_fee_estimator = None
+_fee_estimator_lock = threading.Lock()
+
+
+def get_fee_estimator():
+    """ Returns the FeeEstimator used by the wallet, creating a default
+        one if none has been set.
+
+    Returns:
+        FeeEstimator: The fee estimator.
+    """
+    global _fee_estimator
+    with _fee_estimator_lock:
+        if _fee_estimator is None:
+            _fee_estimator = FeeEstimator()
+        return _fee_estimator
+
+
+def set_fee_estimator(estimator):
+    """ Sets the FeeEstimator used by the wallet.
+
+    Args:
+        estimator (FeeEstimator): The fee estimator, or None to go back
+            to the default.
+    """
+    global _fee_estimator
+    with _fee_estimator_lock:
+        _fee_estimator = estimator
+
+
+def get_fees():
+    """ Requests the recommended fees from the fee server. This blocks
+        for up to DEFAULT_FEE_TIMEOUT seconds; use get_fee_estimator()
+        for a cached value.
+
+    Returns:
+        dict: A dict with keys 'per_kb', 'per_input' and 'per_output'.
+    """
+    try:
+        fee_per_kb = BitcoinFeesSource().get_fee_per_kb()
+    except requests.RequestException as error:
+        fee_per_kb = DEFAULT_FEE_PER_KB
+        logger.error(
+            "Error getting recommended fees from server: %s. Using defaults." %
+            error)
+
+    _check_fee(fee_per_kb)
+
+    return _fee_amounts(fee_per_kb)
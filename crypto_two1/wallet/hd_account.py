@@ -1,6 +1,7 @@
 import time
+from collections import defaultdict
+
 from crypto_two1.bitcoin.crypto import HDKey, HDPrivateKey, HDPublicKey
-from crypto_two1.wallet.wallet_txn import WalletTransaction
 
 
 class HDAccount(object):
@@ -99,18 +100,19 @@ class HDAccount(object):
                 addresses = {i: self.get_address(change, i)
                              for i in range(addr_range, end)}
 
-                if self.data_provider.can_limit_by_height:
-                    min_block = None if check_all else self._cache_manager.last_block
-                    txns = self.data_provider.get_transactions(
+                min_block = None if check_all else self._cache_manager.last_block
+                # Transactions are decoded straight into
+                # WalletTransactions as the provider reads them.
+                txns = defaultdict(list)
+                for wt, addrs in self.data_provider.iter_wallet_transactions(
                         list(addresses.values()),
                         limit=10000,
-                        min_block=min_block)
-                else:
-                    txns = self.data_provider.get_transactions(
-                        list(addresses.values()),
-                        limit=10000)
+                        min_block=min_block):
+                    for addr in addrs:
+                        txns[addr].append(wt)
 
                 inserted_txns = set()
+                batch = []
                 for i in sorted(addresses.keys()):
                     addr = addresses[i]
 
@@ -126,22 +128,16 @@ class HDAccount(object):
 
                     if txns[addr]:
                         current_last = i
-                        for t in txns[addr]:
-                            txid = str(t['transaction'].hash)
+                        for wt in txns[addr]:
+                            txid = str(wt.hash)
                             if txid not in inserted_txns:
-                                wt = WalletTransaction.from_transaction(
-                                    t['transaction'])
-                                wt.block = t['metadata']['block']
-                                wt.block_hash = t['metadata']['block_hash']
-                                wt.confirmations = t['metadata']['confirmations']
-                                if 'network_time' in t['metadata']:
-                                    wt.network_time = t['metadata']['network_time']
-                                self._cache_manager.insert_txn(wt)
+                                batch.append(wt)
                                 inserted_txns.add(txid)
 
                     if addr_has_txns:
                         current_last = i
 
+                self._cache_manager.insert_txns(batch)
                 addr_range += self.DISCOVERY_INCREMENT
 
             self.last_indices[change] = current_last
@@ -323,6 +319,13 @@ class HDAccount(object):
         return self._cache_manager.get_utxos(addresses=self.all_used_addresses,
                                              include_unconfirmed=include_unconfirmed)
 
+    def get_utxo_index(self, include_unconfirmed=False):
+        """ Returns a value-sorted index of the account's unspent
+            transaction outputs, maintained by the cache. It contains
+            the same UTXOs as get_utxos() and must not be modified.
+        """
+        return self._cache_manager.get_utxo_index(self.index, include_unconfirmed)
+
     def to_dict(self):
         """ Returns a JSON-serializable dict to save account data
 
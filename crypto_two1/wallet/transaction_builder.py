@@ -1,5 +1,4 @@
 from collections import defaultdict
-from collections import deque
 
 from crypto_two1.wallet import fees
 from crypto_two1.wallet import exceptions
@@ -7,9 +6,20 @@ from crypto_two1.wallet import exceptions
 
 def pack_wallets(wallets, addresses_and_amounts):
     '''
-        Pack a list of wallets with transactions, greedily in the order given,
-        splitting a payout across multiple wallets if it doesn't fit. Return the built
-        transactions and the payouts that don't fit even after splitting.
+        Pack a list of wallets with transactions so as to use as few
+        wallets, and thus pay as few fees, as possible, splitting a payout
+        across multiple wallets only if it doesn't fit in any single one.
+        Return the built transactions and the payouts that don't fit even
+        after splitting.
+
+        Payouts are placed largest first, each into the fullest wallet
+        already in use that still has room for it, opening the unused
+        wallet with the most room only when none does (best-fit
+        decreasing bin packing). Every transaction pays for its own
+        overhead, inputs and change output, so filling as few wallets as
+        possible minimizes the total fees across wallets. The payouts of
+        each builder, and the leftover ones, are kept in the order they
+        were given in.
 
         inputs:
             wallets: [Two1Wallet]
@@ -27,25 +37,55 @@ def pack_wallets(wallets, addresses_and_amounts):
         raise Exception('Passed in duplicate wallets')
 
     builders = [TransactionBuilder(wallet) for wallet in wallets]
-    payouts = deque(addresses_and_amounts)
-
-    for builder in builders:
-        try:
-            while payouts:
-                address, amount = payouts.popleft()
-                builder.add(address, amount)
-        except exceptions.OverfullTransactionException as e:
-            # ensure what's left after splitting this payout exceeds the dust limit
-            overage = max(e.args[0]['overage'], fees.DUST_LIMIT + 1000)
-            amount_that_fits = amount - overage
-
+    balances = [builder.spendable_balance for builder in builders]
+
+    def room(i):
+        return balances[i] - builders[i].total
+
+    leftover = []
+    for address, amount in sorted(addresses_and_amounts, key=lambda p: p[1], reverse=True):
+        # Best fit: the fullest wallet already in use that can take the
+        # whole payout, otherwise the unused wallet with the most room.
+        fits = [i for i in range(len(builders)) if room(i) >= amount]
+        used = sorted((i for i in fits if len(builders[i])), key=room)
+        unused = sorted((i for i in fits if not len(builders[i])), key=room, reverse=True)
+        for i in used + unused:
             try:
-                builder.add(address, amount_that_fits)
-                payouts.appendleft((address, overage))
-            except exceptions.DustLimitError:
-                payouts.appendleft((address, amount))
+                builders[i].add(address, amount)
+                amount = 0
+                break
+            except exceptions.OverfullTransactionException:
+                continue
+        else:
+            # Split the payout across the wallets with the most room
+            for i in sorted(range(len(builders)), key=room, reverse=True):
+                try:
+                    builders[i].add(address, amount)
+                    amount = 0
+                    break
+                except exceptions.OverfullTransactionException as e:
+                    # ensure what's left after splitting this payout exceeds the dust limit
+                    overage = max(e.args[0]['overage'], fees.DUST_LIMIT + 1000)
+                    if amount <= overage:
+                        continue
+                    try:
+                        builders[i].add(address, amount - overage)
+                        amount = overage
+                    except (exceptions.TransactionBuilderException, exceptions.DustLimitError):
+                        continue
+
+        if amount:
+            leftover.append((address, amount))
+
+    # Put the payouts back in the order they were given in
+    order = {}
+    for address, _ in addresses_and_amounts:
+        order.setdefault(address, len(order))
+    for builder in builders:
+        builder._sort_outputs(order)
+    leftover.sort(key=lambda p: order[p[0]])
 
-    return builders, list(payouts)
+    return builders, leftover
 
 
 class TransactionBuilder(object):
@@ -99,16 +139,26 @@ class TransactionBuilder(object):
 
             The transaction_builder module has a pack_wallets function that
             intelligently packs wallets using the TransactionBuilder
+
+            The builder is incremental: it keeps the selected UTXOs and, when
+            an output changes, first re-runs the wallet's utxo_selector over
+            just those UTXOs. Only if they no longer cover the amount and fees
+            is the selector run over all of the wallet's UTXOs, which can
+            replace the whole selection rather than add to it. The UTXOs come
+            from the wallet's get_utxo_index() (a cached, value-sorted index)
+            if it has one, otherwise from get_utxos().
         '''
         self.wallet = wallet
         self.current_fees = 0
         self._addresses_and_amounts = defaultdict(int)
+        self._subtotal = 0
+        self._num_outputs = 0
         self.selected_utxos = {}  # {address: [utxo]}
 
     @property
     def subtotal(self):
         ''' Subtotal transaction amount (excluding fees) '''
-        return sum(v for (a, v) in self.addresses_and_amounts.items())
+        return self._subtotal
 
     @property
     def total(self):
@@ -117,11 +167,12 @@ class TransactionBuilder(object):
 
     @property
     def spendable_balance(self):
-        utxos_by_addr = self.wallet.get_utxos()
-        _spendable_balance = sum(
+        utxos_by_addr = self._wallet_utxos()
+        if hasattr(utxos_by_addr, 'total_value'):
+            return utxos_by_addr.total_value
+        return sum(
             sum(u.value for u in utxos) for _, utxos in utxos_by_addr.items()
         )
-        return _spendable_balance
 
     @property
     def remaining_balance(self):
@@ -135,19 +186,41 @@ class TransactionBuilder(object):
         }
 
     def __len__(self):
-        return len([a for (a, v) in self.addresses_and_amounts.items()])
+        return self._num_outputs
 
     def __repr__(self):
         return '<TransactionBuilder: {}>'.format(repr(self.addresses_and_amounts))
 
-    def _rebuild(self):
+    def _wallet_utxos(self):
+        '''
+            All of the wallet's UTXOs. BaseWallet doesn't require
+            get_utxo_index(), so wallets without it are asked for get_utxos().
+        '''
+        if hasattr(self.wallet, 'get_utxo_index'):
+            return self.wallet.get_utxo_index()
+        return self.wallet.get_utxos()
+
+    def _sort_outputs(self, order):
+        '''
+            Reorder the payouts by the position of their address in `order`.
+        '''
+        self._addresses_and_amounts = defaultdict(int, sorted(
+            self._addresses_and_amounts.items(), key=lambda p: order.get(p[0], len(order))))
+
+    def _set_amount(self, address, amount):
+        old_amount = self._addresses_and_amounts[address]
+        self._addresses_and_amounts[address] = amount
+        self._subtotal += amount - old_amount
+        self._num_outputs += (amount > 0) - (old_amount > 0)
+
+    def _rebuild(self, address):
         '''
-            Check if the current transaction can be sent as is,
-            and throw an exception if not.
+            Check if the current transaction can be sent as is after the
+            amount paid to `address` changed, and throw an exception if not.
         '''
-        for address, amount in self.addresses_and_amounts.items():
-            if amount < fees.DUST_LIMIT:
-                raise exceptions.DustLimitError(amount)
+        amount = self._addresses_and_amounts[address]
+        if 0 < amount < fees.DUST_LIMIT:
+            raise exceptions.DustLimitError(amount)
 
         amount = self.subtotal
         if amount == 0:
@@ -155,22 +228,43 @@ class TransactionBuilder(object):
             self.selected_utxos = {}
             return
 
-        selected_utxos, txn_fees = self.wallet.utxo_selector(
-            utxos_by_addr=self.wallet.get_utxos(),
-            amount=amount,
-            num_outputs=len(self),
-        )
+        selected_utxos = {}
+        if self.selected_utxos:
+            # See if the current inputs still cover everything
+            selected_utxos, txn_fees = self.wallet.utxo_selector(
+                utxos_by_addr=self.selected_utxos,
+                amount=amount,
+                num_outputs=len(self),
+            )
+
+        if not selected_utxos:
+            selected_utxos, txn_fees = self.wallet.utxo_selector(
+                utxos_by_addr=self._wallet_utxos(),
+                amount=amount,
+                num_outputs=len(self),
+            )
 
         if not selected_utxos:
+            spendable_balance = self.spendable_balance
             raise exceptions.OverfullTransactionException({
                 'amount': amount,
                 'fee': txn_fees,
-                'spendable_balance': self.spendable_balance,
-                'overage': abs(self.spendable_balance - amount - txn_fees),
+                'spendable_balance': spendable_balance,
+                'overage': abs(spendable_balance - amount - txn_fees),
             })
 
         self.current_fees = txn_fees
-        self.selected_utxos = selected_utxos
+        self.selected_utxos = dict(selected_utxos)
+
+    def _update(self, address, amount):
+        old_amount = self._addresses_and_amounts[address]
+        self._set_amount(address, amount)
+
+        try:
+            self._rebuild(address)
+        except (exceptions.TransactionBuilderException, exceptions.DustLimitError):
+            self._set_amount(address, old_amount)
+            raise
 
     def add(self, address, amount):
         '''
@@ -185,14 +279,7 @@ class TransactionBuilder(object):
                 OverfullTransactionException: if the resulting transaction does not
                                               fit in the wallet.
         '''
-        old_amount = self._addresses_and_amounts[address]
-        self._addresses_and_amounts[address] += amount
-
-        try:
-            self._rebuild()
-        except (exceptions.TransactionBuilderException, exceptions.DustLimitError):
-            self._addresses_and_amounts[address] = old_amount
-            raise
+        self._update(address, self._addresses_and_amounts[address] + amount)
 
     def remove(self, address, amount='all'):
         '''
@@ -215,13 +302,7 @@ class TransactionBuilder(object):
         else:
             new_amount = old_amount - amount
 
-        self._addresses_and_amounts[address] = new_amount
-
-        try:
-            self._rebuild()
-        except (exceptions.TransactionBuilderException, exceptions.DustLimitError):
-            self._addresses_and_amounts[address] = old_amount
-            raise
+        self._update(address, new_amount)
 
     def execute_transaction(self):
         if not self.addresses_and_amounts:
@@ -17,6 +17,7 @@ from crypto_two1.bitcoin.script import Script
 from crypto_two1.bitcoin.txn import Transaction
 from crypto_two1.bitcoin.txn import TransactionInput
 from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.bitcoin.txn import UnspentTransactionOutput
 from crypto_two1.bitcoin import utils
 from crypto_two1.blockchain.base_provider import BaseProvider
 from crypto_two1.blockchain.twentyone_provider import TwentyOneProvider
@@ -27,8 +28,18 @@ from crypto_two1.wallet.base_wallet import BaseWallet
 from crypto_two1.wallet.cache_manager import CacheManager
 from crypto_two1.wallet.wallet_txn import WalletTransaction
 from crypto_two1.wallet import fees as txn_fees
+from crypto_two1.wallet import txn_signer
+from crypto_two1.wallet.utxo_reservations import DEFAULT_RESERVATION_TTL
+from crypto_two1.wallet.utxo_reservations import UtxoReservations
 from crypto_two1.wallet.utxo_selectors import utxo_selector_smallest_first
 from crypto_two1.wallet.utxo_selectors import _fee_calc
+from crypto_two1.wallet.utxo_selectors import UtxoIndex
+from crypto_two1.wallet.utxo_selectors import utxo_selector_largest_first
+from crypto_two1.wallet.utxo_selectors import estimate_txn_size
+from crypto_two1.wallet.utxo_selectors import MAX_STANDARD_TXN_SIZE
+from crypto_two1.wallet.utxo_selectors import P2PKH_INPUT_SIZE
+from crypto_two1.wallet.utxo_selectors import P2PKH_OUTPUT_SIZE
+from crypto_two1.wallet.utxo_selectors import TXN_OVERHEAD_SIZE
 
 
 def _public_key_serializer(public_key):
@@ -130,6 +141,21 @@ class Two1Wallet(BaseWallet):
            prototype documented above.
         skip_discovery (bool): If True, skips account and address discovery.
            This should only be set to True on account creation!
+        compact_cache (bool): If True, deeply confirmed, fully spent
+           transactions are kept in a compact form in memory. Useful for
+           long-running processes with large wallets.
+        signing_processes (int): Maximum number of processes used to
+           sign transaction inputs. Defaults to 1, i.e. signing in this
+           process. None uses the number of CPUs. See close().
+        reservation_ttl (float): Seconds the UTXOs spent by a built
+           transaction stay reserved unless the transaction is
+           broadcast with broadcast_transaction() or fails to build.
+        max_txn_size (int): Maximum estimated size in bytes of a
+           transaction built by the wallet. Payouts that don't fit are
+           split across several transactions.
+        max_txn_inputs (int): Maximum number of inputs of a transaction
+           built by the wallet, or None for no limit other than
+           max_txn_size.
 
     Returns:
         Two1Wallet: The wallet instance.
@@ -142,6 +168,8 @@ class Two1Wallet(BaseWallet):
                                        "default_wallet.json")
     WALLET_FILE_VERSION = "0.1.0"
     WALLET_CACHE_VERSION = "0.1.0"
+    # Times to reselect UTXOs when another spender reserves them first
+    RESERVATION_RETRIES = 5
 
     """ The configuration options available for creating the wallet.
 
@@ -447,9 +475,23 @@ class Two1Wallet(BaseWallet):
     def __init__(self, params_or_file, data_provider,
                  passphrase='',
                  utxo_selector=utxo_selector_smallest_first,
-                 skip_discovery=False):
+                 skip_discovery=False,
+                 compact_cache=False,
+                 signing_processes=1,
+                 reservation_ttl=DEFAULT_RESERVATION_TTL,
+                 max_txn_size=MAX_STANDARD_TXN_SIZE,
+                 max_txn_inputs=None):
         self.data_provider = data_provider
         self.utxo_selector = utxo_selector
+        self.signing_processes = signing_processes
+        self.reservation_ttl = reservation_ttl
+        self.max_txn_size = max_txn_size
+        self.max_txn_inputs = max_txn_inputs
+        # (reservation, expiration) of built transactions, keyed by txid
+        self._txn_reservations = {}
+        # Reservations of broadcast transactions, kept until a sync
+        # shows their inputs spent or they expire.
+        self._broadcast_reservations = {}
         self._testnet = False
         self._filename = ""
 
@@ -498,7 +540,7 @@ class Two1Wallet(BaseWallet):
 
         self._root_keys = HDKey.from_path(self._master_key,
                                           self.account_type.account_derivation_prefix)
-        self._cache_manager = CacheManager(self._testnet)
+        self._cache_manager = CacheManager(self._testnet, compact=compact_cache)
 
         self._accounts = []
         self._account_map = {}
@@ -514,6 +556,13 @@ class Two1Wallet(BaseWallet):
             self._account_map = params.get("account_map", {})
             self._load_accounts(account_params, cache_file)
 
+        # UTXO reservations are shared with other processes using the
+        # same wallet through a database next to the cache.
+        if cache_file is not None and cache_file.endswith(".db"):
+            self.utxo_reservations = UtxoReservations(cache_file[:-3] + "_reservations.db")
+        else:
+            self.utxo_reservations = UtxoReservations()
+
         if self.logger.level == logging.DEBUG:
             for a in self._accounts:
                 kser = ""
@@ -618,13 +667,11 @@ class Two1Wallet(BaseWallet):
         self._account_map[name] = index
 
     def _load_accounts(self, account_params, cache_file=None):
-        cache = {}
+        # Older wallets have a JSON cache file. It is loaded here and
+        # migrated to the sqlite3 cache the next time the wallet is
+        # written out.
         if cache_file is not None and os.path.exists(cache_file):
-            with open(cache_file) as cf:
-                cache = json.load(cf)
-
-        if cache:
-            self._cache_manager.load_from_dict(cache)
+            self._cache_manager.load_from_file(cache_file, lazy=True)
 
         for i, a in enumerate(account_params):
             # Determine account name
@@ -670,12 +717,16 @@ class Two1Wallet(BaseWallet):
     def sync_accounts(self):
         """ Syncs all accounts with the blockchain and prunes all
         expired provisional transactions.
+
+        The UTXO reservations of broadcast transactions that the sync
+        returned are released, as their inputs now show as spent.
         """
         for a in self._accounts:
             a._sync_txns()
             a._update_balance()
 
         self._cache_manager.prune_provisional_txns()
+        self._release_broadcast_reservations()
 
         self._cache_manager.last_block = self.data_provider.get_block_height()
         self.sync_wallet_file()
@@ -815,6 +866,33 @@ class Two1Wallet(BaseWallet):
 
         return utxos
 
+    def get_utxo_index(self, include_unconfirmed=False, accounts=[]):
+        """ Returns a value-sorted index of all UTXOs in all specified
+            accounts.
+
+        Args:
+            include_unconfirmed (bool): If True, includes any
+                unconfirmed UTXOs.
+            accounts (list): A list of either account indices or names.
+
+        Returns:
+            UtxoIndex: The index, which is also a dict-like mapping of
+                address to list of UnspentTransactionOutput objects. For
+                a single account this is the index maintained by the
+                cache and must not be modified.
+        """
+        accts = self._check_and_get_accounts(accounts)
+        if len(accts) == 1:
+            return accts[0].get_utxo_index(include_unconfirmed)
+
+        index = UtxoIndex()
+        for acct in accts:
+            for addr, utxos in acct.get_utxo_index(include_unconfirmed).items():
+                for u in utxos:
+                    index.add(addr, u)
+
+        return index
+
     def to_dict(self):
         """ Creates a dict of critical parameters.
 
@@ -841,7 +919,7 @@ class Two1Wallet(BaseWallet):
         # Convert to hex str to make sure we don't get weird
         # characters.
         cf_id = utils.bytes_to_str(p['passphrase_hash'][-4:].encode('utf-8'))
-        cache_file = os.path.join(dirname, "wallet_%s_cache.json" % (cf_id))
+        cache_file = os.path.join(dirname, "wallet_%s_cache.db" % (cf_id))
         p['cache_file'] = cache_file
 
         d = json.dumps(p).encode('utf-8')
@@ -860,7 +938,7 @@ class Two1Wallet(BaseWallet):
             self._filename = file_or_filename.name
             file_or_filename.write(d)
 
-        self._cache_manager.to_file(cache_file, force_cache_write)
+        self._cache_manager.to_db(cache_file, force_cache_write)
 
     def sync_wallet_file(self, force_cache_write=False):
         """ Syncs all wallet data to the wallet file used
@@ -872,6 +950,13 @@ class Two1Wallet(BaseWallet):
             self.to_file(self._filename, force_cache_write)
             self.logger.debug("Sync'ed file %s" % self._filename)
 
+    def close(self):
+        """ Stops the worker processes used to sign transactions, if
+            signing_processes allowed any. They are started again if
+            the wallet signs more transactions.
+        """
+        txn_signer.shutdown()
+
     def addresses(self, accounts=[]):
         """ Gets the address list for the current wallet.
 
@@ -1114,84 +1199,163 @@ class Two1Wallet(BaseWallet):
             self.logger.critical(
                 "Problem sending transaction to network: %s" % e)
 
+        if res:
+            # Other spenders only see the inputs as spent once they
+            # sync, so the reservation is kept until then or until it
+            # expires.
+            entry = self._txn_reservations.pop(str(_txn.hash), None)
+            if entry is not None:
+                self._broadcast_reservations[str(_txn.hash)] = entry
+        else:
+            # The inputs can be used again.
+            self._release_txn_reservation(_txn)
+
         return res
 
-    def build_signed_transaction(self, addresses_and_amounts,
-                                 use_unconfirmed=False,
-                                 insert_into_cache=False,
-                                 expiration=0,
-                                 fees=None,
-                                 accounts=[]):
-        """ Makes raw signed unbroadcasted transaction(s) for the specified amount.
+    def _release_txn_reservation(self, txn):
+        """ Releases the UTXOs reserved for a transaction built by
+            build_signed_transaction(), if any.
 
-        In the future, this function may create multiple transactions
-        if a single one would be too big.
+        Note:
+            THIS IS NOT A PUBLIC API.
 
         Args:
-            addresses_and_amounts (dict): A dict keyed by recipient address
-               and corresponding values being the amount - *in satoshis* - to
-               send to that address.
-            use_unconfirmed (bool): Use unconfirmed transactions if necessary.
-            insert_into_cache (bool): Insert the transaction into the
-                wallet's cache and mark it as provisional.
-            expiration (int): Time, in seconds from epoch, when a
-                provisional transaction should be automatically
-                pruned. This is invalid unless insert_into_cache=True.
-                If expiration == 0, it is set to time.time() +
-                CacheManager.PROVISIONAL_MAX_DURATION.  This cannot be
-                greater than CacheManager.PROVISIONAL_MAX_DURATION
-                seconds in the future.
-            fees (int): Specify the fee amount manually.
-            accounts (list): List of accounts to use. If
-               not provided, all discovered accounts may be used based
-               on the chosen UTXO selection algorithm.
+            txn (Transaction): The transaction.
+        """
+        entry = self._txn_reservations.pop(str(txn.hash), None)
+        if entry is not None:
+            self.utxo_reservations.release(entry[0])
+
+    def _release_broadcast_reservations(self):
+        """ Releases the reservations of broadcast transactions that
+            the cache has from a sync, i.e. that are no longer
+            provisional, or that were pruned from it.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        self._prune_reservations()
+        for txid in list(self._broadcast_reservations):
+            txn = self._cache_manager.get_transaction(txid)
+            if txn is None or not txn.provisional:
+                self.utxo_reservations.release(
+                    self._broadcast_reservations.pop(txid)[0])
+
+    def _prune_reservations(self):
+        """ Forgets the reservations of built or broadcast transactions
+            that have expired.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+        """
+        now = time.time()
+        for reservations in (self._txn_reservations, self._broadcast_reservations):
+            for txid, (_, expires) in list(reservations.items()):
+                if expires <= now:
+                    del reservations[txid]
+
+    def broadcast_transactions(self, txns):
+        """ Broadcasts a group of transactions in order.
+
+            Transactions may spend outputs of the ones before them (as
+            those returned by build_signed_transaction() can), so
+            broadcasting stops at the first failure and the rest are
+            not broadcast.
+
+        Args:
+            txns (list(Transaction)): Transactions to broadcast.
 
         Returns:
-            list(WalletTransaction): A list of WalletTransaction objects
+            list(str): The txids of the transactions that were
+                broadcast, in order.
         """
-        subtotal_amount = 0
-        # Add up total amount & check for any outputs that are below
-        # the dust limit as they would make the transaction non-standard
-        for addr, amount in addresses_and_amounts.items():
-            if not isinstance(amount, int):
-                raise exceptions.SatoshiUnitsError(
-                    "Can't send a non-integer amount of satoshis %s. Did you forget to convert from BTC?" %
-                    (amount,))
-            if amount <= txn_fees.DUST_LIMIT:
-                raise exceptions.DustLimitError(
-                    "Can't send %d satoshis to %s: amount is below dust limit!" %
-                    (amount, addr))
-            subtotal_amount += amount
+        txids = []
+        for i, txn in enumerate(txns):
+            txid = self.broadcast_transaction(txn)
+            if not txid:
+                for t in txns[i + 1:]:
+                    self._release_txn_reservation(t)
+                break
+            txids.append(txid)
 
-        if not accounts:
-            accts = self._accounts
-        else:
-            accts = self._check_and_get_accounts(accounts)
+        return txids
 
-        # Now get the unspents from all accounts and select which we
-        # want to use
-        utxos_by_addr = self.get_utxos(include_unconfirmed=use_unconfirmed,
-                                       accounts=accts)
+    def _reserve_selection(self, utxos_by_addr, amount, num_outputs, fees,
+                           utxo_selector):
+        """ Selects UTXOs for a transaction and reserves them.
 
-        total_available = sum(u.value for key, utxos in utxos_by_addr.items() for u in utxos)
-        selected_utxos, fees = self.utxo_selector(utxos_by_addr=utxos_by_addr,
-                                                  amount=subtotal_amount,
-                                                  num_outputs=len(addresses_and_amounts),
-                                                  fees=fees)
-
-        # Verify we have enough money
-        total_with_fees = subtotal_amount + fees
-        enough_money = bool(selected_utxos)
-        if not enough_money:
-            message = ('Available balance (%d satoshis) is less than\n'
-                       'payment (%d satoshis) + fees (%d satoshis) = %d satoshis.')
-            raise exceptions.WalletBalanceError(
-                message % (total_available, subtotal_amount, fees, total_with_fees)
-            )
+            UTXOs reserved by other spenders are left out. If another
+            spender reserves some of the selected ones first, the
+            selection is made again.
 
-        if use_unconfirmed:
-            self.logger.warning("May be using unconfirmed inputs to complete transaction.")
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            utxos_by_addr (UtxoIndex): The UTXOs to select from.
+            amount (int): Amount to send, excluding fees.
+            num_outputs (int): Number of outputs, excluding change.
+            fees (int): Fee amount, or None to let the selector decide.
+            utxo_selector (function): The selector to use.
 
+        Returns:
+            tuple: (selected_utxos, fees, reservation), or None if the
+                selection doesn't fit within the transaction size and
+                input limits. Nothing is reserved in that case.
+        """
+        for attempt in range(self.RESERVATION_RETRIES):
+            available = utxos_by_addr.without(self.utxo_reservations.reserved())
+            selected_utxos, sel_fees = utxo_selector(utxos_by_addr=available,
+                                                     amount=amount,
+                                                     num_outputs=num_outputs,
+                                                     fees=fees)
+
+            # Verify we have enough money
+            if not selected_utxos:
+                message = ('Available balance (%d satoshis) is less than\n'
+                           'payment (%d satoshis) + fees (%d satoshis) = %d satoshis.')
+                raise exceptions.WalletBalanceError(
+                    message % (available.total_value, amount, sel_fees, amount + sel_fees)
+                )
+
+            scripts = [u.script
+                       for utxo_list in selected_utxos.values()
+                       for u in utxo_list]
+            if self.max_txn_inputs is not None and len(scripts) > self.max_txn_inputs:
+                return None
+            if estimate_txn_size(scripts, num_outputs + 1) > self.max_txn_size:
+                return None
+
+            try:
+                reservation = self.utxo_reservations.reserve(
+                    [(str(u.transaction_hash), u.outpoint_index)
+                     for utxo_list in selected_utxos.values()
+                     for u in utxo_list],
+                    self.reservation_ttl)
+                return selected_utxos, sel_fees, reservation
+            except exceptions.UtxoReservedError:
+                if attempt == self.RESERVATION_RETRIES - 1:
+                    raise
+
+    def _build_txn(self, selected_utxos, addresses_and_amounts, fees,
+                   change_acct):
+        """ Builds and signs a single transaction.
+
+        Note:
+            THIS IS NOT A PUBLIC API.
+
+        Args:
+            selected_utxos (dict): The UTXOs to spend, keyed by address.
+            addresses_and_amounts (list(tuple)): (address, amount)
+                tuples for the outputs.
+            fees (int): The fee amount.
+            change_acct (HDAccount): The account to send change to.
+
+        Returns:
+            tuple: (txn, change), where change is an
+                (address, UnspentTransactionOutput) tuple for the change
+                output or None if there is no change.
+        """
         # Get all private keys in one shot
         private_keys = self.get_private_keys(list(selected_utxos.keys()))
 
@@ -1207,7 +1371,9 @@ class Two1Wallet(BaseWallet):
                                                script=utxo.script,
                                                sequence_num=0xffffffff))
 
-        for addr, amount in addresses_and_amounts.items():
+        subtotal_amount = 0
+        for addr, amount in addresses_and_amounts:
+            subtotal_amount += amount
             addr_prefix, key_hash = utils.address_to_key_hash(addr)
             if addr_prefix in [0x05, 0xC4]:
                 script = Script.build_p2sh(key_hash)
@@ -1217,14 +1383,16 @@ class Two1Wallet(BaseWallet):
                                              script=script))
 
         # one more output for the change, if the change is above the dust limit
-        change = total_utxo_amount - total_with_fees
+        change = total_utxo_amount - subtotal_amount - fees
+        change_output = None
         if change > txn_fees.DUST_LIMIT:
-            _, change_key_hash = utils.address_to_key_hash(accts[0].get_next_address(True))
+            change_address = change_acct.get_next_address(True)
+            _, change_key_hash = utils.address_to_key_hash(change_address)
             # Pick a random location to put the change output in
             insert_index = random.randint(0, len(outputs))
-            outputs.insert(insert_index,
-                           TransactionOutput(value=change,
-                                             script=Script.build_p2pkh(change_key_hash)))
+            change_output = TransactionOutput(value=change,
+                                              script=Script.build_p2pkh(change_key_hash))
+            outputs.insert(insert_index, change_output)
 
         txn = WalletTransaction(version=Transaction.DEFAULT_TRANSACTION_VERSION,
                                 inputs=inputs,
@@ -1234,7 +1402,7 @@ class Two1Wallet(BaseWallet):
                                 fees=fees)
 
         # Now sign all the inputs
-        i = 0
+        to_sign = []
         for addr, utxo_list in selected_utxos.items():
             # Need to get the private key
             private_key = private_keys.get(addr, None)
@@ -1243,23 +1411,154 @@ class Two1Wallet(BaseWallet):
                     "Couldn't find address %s or unable to generate private key for it." % addr)
 
             for utxo in utxo_list:
-                signed = txn.sign_input(input_index=i,
+                to_sign.append((len(to_sign), private_key, utxo.script))
+
+        signed = txn_signer.sign_inputs(txn, to_sign,
                                         hash_type=Transaction.SIG_HASH_ALL,
-                                        private_key=private_key,
-                                        sub_script=utxo.script)
+                                        processes=self.signing_processes)
+        if not signed:
+            raise exceptions.WalletSigningError("Unable to sign inputs.")
+
+        if change_output is None:
+            return txn, None
+
+        return txn, (change_address,
+                     UnspentTransactionOutput(transaction_hash=txn.hash,
+                                              outpoint_index=insert_index,
+                                              value=change,
+                                              scr=change_output.script,
+                                              confirmations=0))
+
+    def build_signed_transaction(self, addresses_and_amounts,
+                                 use_unconfirmed=False,
+                                 insert_into_cache=False,
+                                 expiration=0,
+                                 fees=None,
+                                 accounts=[]):
+        """ Makes raw signed unbroadcasted transaction(s) for the specified amount.
+
+        If the payouts don't fit in a single transaction of at most
+        max_txn_size bytes and max_txn_inputs inputs, they are split
+        across several transactions. Each transaction may spend the
+        change of the ones before it, so they must be broadcast in
+        order (see broadcast_transactions()).
+
+        Args:
+            addresses_and_amounts (dict or list): A dict keyed by
+               recipient address and corresponding values being the
+               amount - *in satoshis* - to send to that address, or a
+               list of (address, amount) tuples.
+            use_unconfirmed (bool): Use unconfirmed transactions if necessary.
+            insert_into_cache (bool): Insert the transaction into the
+                wallet's cache and mark it as provisional.
+            expiration (int): Time, in seconds from epoch, when a
+                provisional transaction should be automatically
+                pruned. This is invalid unless insert_into_cache=True.
+                If expiration == 0, it is set to time.time() +
+                CacheManager.PROVISIONAL_MAX_DURATION.  This cannot be
+                greater than CacheManager.PROVISIONAL_MAX_DURATION
+                seconds in the future.
+            fees (int): Specify the fee amount manually. If the payouts
+                are split, this is the fee of each transaction.
+            accounts (list): List of accounts to use. If
+               not provided, all discovered accounts may be used based
+               on the chosen UTXO selection algorithm.
 
-                if not signed:
-                    raise exceptions.WalletSigningError(
-                        "Unable to sign input %d." % i)
+        Returns:
+            list(WalletTransaction): A list of WalletTransaction objects
+        """
+        if isinstance(addresses_and_amounts, dict):
+            payouts = list(addresses_and_amounts.items())
+        else:
+            payouts = list(addresses_and_amounts)
 
-                i += 1
+        # Check for any outputs that are below the dust limit as they
+        # would make the transaction non-standard
+        for addr, amount in payouts:
+            if not isinstance(amount, int):
+                raise exceptions.SatoshiUnitsError(
+                    "Can't send a non-integer amount of satoshis %s. Did you forget to convert from BTC?" %
+                    (amount,))
+            if amount <= txn_fees.DUST_LIMIT:
+                raise exceptions.DustLimitError(
+                    "Can't send %d satoshis to %s: amount is below dust limit!" %
+                    (amount, addr))
+
+        if not accounts:
+            accts = self._accounts
+        else:
+            accts = self._check_and_get_accounts(accounts)
+
+        self._prune_reservations()
+
+        if use_unconfirmed:
+            self.logger.warning("May be using unconfirmed inputs to complete transaction.")
 
-        if insert_into_cache:
-            self._cache_manager.insert_txn(txn,
-                                           mark_provisional=True,
-                                           expiration=expiration)
+        # Now get the unspents from all accounts
+        utxos_by_addr = self.get_utxo_index(include_unconfirmed=use_unconfirmed,
+                                            accounts=accts)
 
-        return [txn]
+        # At most this many outputs fit next to one input and change
+        max_outputs = (self.max_txn_size - TXN_OVERHEAD_SIZE - P2PKH_INPUT_SIZE) // \
+            P2PKH_OUTPUT_SIZE - 1
+
+        txns = []
+        reservations = []
+        try:
+            while payouts:
+                # Select UTXOs for as many payouts as fit, halving the
+                # number of payouts until the selection fits too.
+                num_payouts = max(1, min(len(payouts), max_outputs))
+                utxo_selector = self.utxo_selector
+                while True:
+                    batch = payouts[:num_payouts]
+                    rv = self._reserve_selection(utxos_by_addr,
+                                                 sum(amount for _, amount in batch),
+                                                 len(batch),
+                                                 fees,
+                                                 utxo_selector)
+                    if rv is not None:
+                        break
+                    if num_payouts > 1:
+                        num_payouts //= 2
+                    elif utxo_selector is not utxo_selector_largest_first:
+                        # Fewest inputs is all that matters now
+                        utxo_selector = utxo_selector_largest_first
+                    else:
+                        raise exceptions.TransactionTooLargeError(
+                            "Can't pay %d satoshis to %s with at most %s inputs in %d bytes." %
+                            (batch[0][1], batch[0][0], self.max_txn_inputs, self.max_txn_size))
+
+                selected_utxos, batch_fees, reservation = rv
+                reservations.append(reservation)
+                txn, change = self._build_txn(selected_utxos, batch,
+                                              batch_fees, accts[0])
+                txns.append(txn)
+                payouts = payouts[num_payouts:]
+
+                if payouts:
+                    # Later transactions can't use the UTXOs just spent
+                    # but can use the change.
+                    utxos_by_addr = utxos_by_addr.without(
+                        set((str(u.transaction_hash), u.outpoint_index)
+                            for utxo_list in selected_utxos.values()
+                            for u in utxo_list))
+                    if change is not None:
+                        utxos_by_addr.add(*change)
+        except:
+            # Don't hold on to the UTXOs if the transactions can't be built
+            for reservation in reservations:
+                self.utxo_reservations.release(reservation)
+            raise
+
+        for txn, reservation in zip(txns, reservations):
+            if insert_into_cache:
+                self._cache_manager.insert_txn(txn,
+                                               mark_provisional=True,
+                                               expiration=expiration)
+            self._txn_reservations[str(txn.hash)] = (reservation, time.time() + self.reservation_ttl)
+
+        return txns
 
     def make_signed_transaction_for(self, address, amount,
                                     use_unconfirmed=False,
@@ -1308,13 +1607,14 @@ class Two1Wallet(BaseWallet):
                                              accounts=[]):
         """ Makes raw signed unbroadcasted transaction(s) for the specified amount.
 
-        In the future, this function may create multiple transactions
-        if a single one would be too big.
+        This creates multiple transactions if a single one would be too
+        big. See build_signed_transaction().
 
         Args:
-            addresses_and_amounts (dict): A dict keyed by recipient address
-               and corresponding values being the amount - *in satoshis* - to
-               send to that address.
+            addresses_and_amounts (dict or list): A dict keyed by
+               recipient address and corresponding values being the
+               amount - *in satoshis* - to send to that address, or a
+               list of (address, amount) tuples.
             use_unconfirmed (bool): Use unconfirmed transactions if necessary.
             insert_into_cache (bool): Insert the transaction(s) into
                 the wallet's cache and mark it as provisional.
@@ -1349,10 +1649,15 @@ class Two1Wallet(BaseWallet):
                          use_unconfirmed=False, fees=None, accounts=[]):
         """ Sends bitcoins to multiple addresses.
 
+            The payouts may be split across several transactions, which
+            are broadcast in order. If one can't be broadcast, the rest
+            aren't either.
+
         Args:
-            addresses_and_amounts (dict): A dict keyed by recipient address
-               and corresponding values being the amount - *in satoshis* - to
-               send to that address.
+            addresses_and_amounts (dict or list): A dict keyed by
+               recipient address and corresponding values being the
+               amount - *in satoshis* - to send to that address, or a
+               list of (address, amount) tuples.
             use_unconfirmed (bool): Use unconfirmed transactions if necessary.
             fees (int): Specify the fee amount manually.
             accounts (list): List of accounts to use. If
@@ -1368,16 +1673,17 @@ class Two1Wallet(BaseWallet):
             fees=fees,
             accounts=accounts)
 
+        txids = self.broadcast_transactions([t["txn"] for t in txn_dict])
+
         res = []
-        for t in txn_dict:
-            txid = self.broadcast_transaction(t["txn"])
-            if not txid:
-                self.logger.critical("Unable to send txn %s" % t["txid"])
-            elif txid != t["txid"]:
+        for t, txid in zip(txn_dict, txids):
+            if txid != t["txid"]:
                 # Something weird happened ...
                 raise exceptions.TxidMismatchError("Transaction IDs do not match")
-            else:
-                res.append(t)
+            res.append(t)
+
+        for t in txn_dict[len(txids):]:
+            self.logger.critical("Unable to send txn %s" % t["txid"])
 
         return res
 
@@ -1488,7 +1794,7 @@ class Two1Wallet(BaseWallet):
                 (total_value))
 
         # Compute an approximate fee
-        fee_amounts = txn_fees.get_fees()
+        fee_amounts = txn_fees.get_fee_estimator().get_fees()
         fees = fee_calculator(num_utxos, total_value, fee_amounts)
 
         curr_utxo_selector = self.utxo_selector
@@ -1556,7 +1862,7 @@ class Two1Wallet(BaseWallet):
                                 for i in range(num_addresses)]
 
             # Compute an approximate fee
-            fee_amounts = txn_fees.get_fees()
+            fee_amounts = txn_fees.get_fee_estimator().get_fees()
             fees = num_utxos * fee_amounts['per_input'] + \
                 num_addresses * fee_amounts['per_output']
 
@@ -1663,10 +1969,9 @@ class Two1Wallet(BaseWallet):
         return rv
 
     def _create_txn_history_record(self, txid, acct_addrs):
-        txc = self._cache_manager._txn_cache
         include = False
-        wt = txc[txid]
-        wt_addrs = wt.get_addresses(self._testnet)
+        wt = self._cache_manager.get_transaction(txid)
+        wt_addrs = wt.address_record(self._testnet)
 
         values = dict(inputs=0, outputs=0,
                       internal_inputs=0, internal_outputs=0)
@@ -1684,7 +1989,7 @@ class Two1Wallet(BaseWallet):
                     # Lookup the value for the corresponding output
                     o = wt.inputs[i].outpoint
                     o_index = wt.inputs[i].outpoint_index
-                    value = self._cache_manager._outputs_cache[str(o)][o_index]['output'].value
+                    value = self._cache_manager.get_output(str(o), o_index).value
                     values["inputs"] += value
 
                     txid_dict['spends'].append(
@@ -1696,24 +2001,25 @@ class Two1Wallet(BaseWallet):
                     values["internal_inputs"] += value
 
         for o, out_addrs in enumerate(wt_addrs['outputs']):
+            out_value = wt_addrs['values'][o]
             for out_addr in out_addrs:
-                values["outputs"] += wt.outputs[o].value
+                values["outputs"] += out_value
                 if out_addr in acct_addrs:
                     acct = acct_addrs[out_addr][0].name
                     addr_type = 'change' if acct_addrs[out_addr][1] == 1 else 'payout'
 
                     txid_dict['deposits'].append(
                         dict(address=out_addr,
-                             value=wt.outputs[o].value,
+                             value=out_value,
                              acct=acct,
                              addr_type=addr_type))
                     include = True
-                    values["internal_outputs"] += wt.outputs[o].value
+                    values["internal_outputs"] += out_value
                 else:
                     if len(txid_dict['spends']):
                         txid_dict['deposits'].append(
                             dict(address=out_addr,
-                                 value=wt.outputs[o].value,
+                                 value=out_value,
                                  acct=None,
                                  addr_type='external'))
 
@@ -1739,10 +2045,26 @@ class Two1Wallet(BaseWallet):
 
         return record
 
-    def transaction_history(self, accounts=[]):
-        """ Returns a list containing all transactions associated with
+    def transaction_history(self, accounts=[], offset=0, limit=None,
+                            since=None, reverse=False):
+        """ Returns a list containing transactions associated with
             this wallet. Transactions are ordered from oldest to most
             recent.
+
+        Args:
+            accounts (list): List of either account indices or names
+                to get the history for. Defaults to all accounts.
+            offset (int): Number of matching transactions to skip.
+            limit (int): Maximum number of transactions to return.
+                If None, all matching transactions are returned.
+            since (str): Cursor for pagination: if given, only
+                transactions after the one with this txid are returned,
+                e.g. the txid of the last record of the previous page.
+            reverse (bool): If True, returns the most recent
+                transactions first.
+
+        Returns:
+            list(dict): A list of transaction history records.
         """
         # First get address to account/chain mapping
         accts = self._check_and_get_accounts(accounts)
@@ -1756,13 +2078,20 @@ class Two1Wallet(BaseWallet):
                     acct_addrs[addr] = (a, i)
 
         history = []
-        txc = self._cache_manager._txn_cache
-        ordered_txids = sorted(list(txc.keys()),
-                               key=lambda txid: txc[txid].network_time)
-        for txid in ordered_txids:
+        for txid in self._cache_manager.iter_history(reverse, since):
+            if limit is not None and len(history) >= limit:
+                break
+
             record = self._create_txn_history_record(txid, acct_addrs)
-            if record is not None:
-                history.append(record)
+            if record is None:
+                continue
+
+            if offset > 0:
+                offset -= 1
+                continue
+
+            history.append(record)
+
         return history
 
     @property
@@ -0,0 +1,166 @@
+"""Signs many transaction inputs at once, optionally across processes."""
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+from crypto_two1.bitcoin import crypto
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.utils import pack_compact_int
+from crypto_two1.wallet.wallet_txn import WalletTransaction
+
+# Below this many inputs the cost of starting worker processes
+# outweighs the gain.
+PARALLEL_MIN_INPUTS = 32
+# Number of signatures handed to a worker at a time
+CHUNK_SIZE = 16
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _raw_private_key(private_key):
+    # Extended keys wrap a plain PrivateKey
+    if isinstance(private_key, crypto.HDPrivateKey):
+        return private_key._key.key
+    return private_key.key
+
+
+def _sign_chunk(chunk):
+    """ Signs a list of (private key int, message) tuples.
+
+    Note:
+        THIS IS NOT A PUBLIC API. It runs in worker processes.
+
+    Returns:
+        list(bytes): The DER-encoded signatures.
+    """
+    keys = {}
+    rv = []
+    for k, msg in chunk:
+        key = keys.get(k, None)
+        if key is None:
+            key = keys[k] = crypto.PrivateKey(k)
+        rv.append(key.sign(msg, False).to_der())
+    return rv
+
+
+def _sign_messages(items, processes):
+    """ Signs (private key int, message) tuples, in parallel if
+        worthwhile.
+
+    Note:
+        THIS IS NOT A PUBLIC API.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if processes <= 1 or len(items) < PARALLEL_MIN_INPUTS:
+        return _sign_chunk(items)
+
+    chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+    # map() returns results in submission order, so the output doesn't
+    # depend on scheduling.
+    return [sig for sigs in _get_executor(processes).map(_sign_chunk, chunks) for sig in sigs]
+
+
+def _get_executor(processes):
+    """ Returns the pool of worker processes, creating it on first use
+        or again if the number of processes changes.
+
+        Workers are spawned rather than forked, as the calling process
+        may be running other threads.
+
+    Note:
+        THIS IS NOT A PUBLIC API.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is not None and _executor_workers != processes:
+            _executor.shutdown(wait=True)
+            _executor = None
+        if _executor is None:
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = processes
+        return _executor
+
+
+def shutdown():
+    """ Stops the worker processes used for signing, if any. They are
+        started again the next time they are needed.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def sign_inputs(txn, inputs, hash_type=Transaction.SIG_HASH_ALL, processes=1):
+    """ Signs several P2PKH inputs of a transaction.
+
+        All signature hashes are computed in one pass over the
+        transaction (see Transaction.get_sighashes()), each private key
+        is matched against its scripts once, and the signatures are
+        computed across a pool of processes when there are enough
+        inputs and more than one process is allowed. Signing is deterministic (RFC6979), so the resulting
+        transaction is byte-identical to one signed with
+        Transaction.sign_input() input by input. Multisig redeem
+        scripts are signed with sign_input().
+
+    Args:
+        txn (Transaction): The transaction to sign. It is modified in
+            place.
+        inputs (list(tuple)): List of (input index, private key,
+            sub_script) tuples. See Transaction.sign_input().
+        hash_type (int): What kind of signature hash to do.
+        processes (int): Maximum number of worker processes. 1, the
+            default, signs in this process. None uses the number of
+            CPUs. The pool is kept for later calls until shutdown() is
+            called.
+
+    Returns:
+        bool: True if all inputs were signed.
+    """
+    p2pkh = []
+    for input_index, private_key, sub_script in inputs:
+        if input_index < 0 or input_index >= len(txn.inputs):
+            raise ValueError("Invalid input index.")
+        if sub_script.is_p2pkh():
+            p2pkh.append((input_index, private_key, sub_script))
+        elif not txn.sign_input(input_index, hash_type, private_key, sub_script):
+            raise ValueError("Could not sign input %d." % input_index)
+
+    if not p2pkh:
+        return True
+
+    # Check each key against its scripts, but only once per
+    # key/script pair.
+    matches = {}
+    for _, private_key, sub_script in p2pkh:
+        mkey = (id(private_key), bytes(sub_script))
+        if mkey not in matches:
+            m = txn._match_public_key(private_key, sub_script.remove_op("OP_CODESEPARATOR"))
+            if not m['match']:
+                raise ValueError("Address derived from private key does not match sub_script!")
+            matches[mkey] = txn._get_public_key_bytes(private_key,
+                                                      m['info']['compressed'])
+
+    messages = txn.get_sighashes({i: s for i, _, s in p2pkh}, hash_type)
+    sigs = _sign_messages([(_raw_private_key(k), messages[i]) for i, k, _ in p2pkh],
+                          processes)
+
+    for (input_index, private_key, sub_script), sig in zip(p2pkh, sigs):
+        pub_key_bytes = matches[(id(private_key), bytes(sub_script))]
+        txn.inputs[input_index].script = Script([sig + pack_compact_int(hash_type),
+                                                 pub_key_bytes])
+
+    if isinstance(txn, WalletTransaction):
+        # The input scripts changed, so forget any extracted addresses.
+        txn.clear_address_records()
+
+    return True
@@ -0,0 +1,142 @@
+"""Reserves UTXOs so that concurrent spenders of one wallet don't
+select the same ones."""
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from crypto_two1.wallet import exceptions
+
+# Seconds a reservation is held unless it is released
+DEFAULT_RESERVATION_TTL = 300
+
+
+class UtxoReservations(object):
+    """ A set of reserved outpoints, each with an expiration time.
+
+        Reservations are stored in a sqlite3 database so they are
+        shared by every thread and process that opens the same file.
+        Reserving is atomic: either all of the requested outpoints are
+        reserved or none are. Expired reservations are ignored and
+        removed on the next write.
+
+    Args:
+        db_path (str): Path to the database file. It is created if it
+            does not exist. ":memory:" keeps the reservations private
+            to this object.
+    """
+
+    def __init__(self, db_path=":memory:"):
+        self.db_path = db_path
+
+        if db_path != ":memory:" and not os.path.exists(db_path):
+            os.close(os.open(db_path, flags=os.O_WRONLY | os.O_CREAT,
+                             mode=0o700))
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS "
+                           "reservations ("
+                           "txid VARCHAR(64) NOT NULL, "
+                           "idx INTEGER NOT NULL, "
+                           "token VARCHAR(32) NOT NULL, "
+                           "expires FLOAT NOT NULL, "
+                           "PRIMARY KEY (txid, idx)"
+                           ");")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS "
+                           "reservations_token ON reservations (token);")
+
+    @contextlib.contextmanager
+    def _write(self):
+        # Private, runs a write transaction that holds the database
+        # lock from the start so that check-then-insert is atomic
+        # across processes.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except:
+                self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._conn.execute("COMMIT")
+
+    def reserve(self, outpoints, ttl=DEFAULT_RESERVATION_TTL):
+        """ Reserves outpoints.
+
+        Args:
+            outpoints (iterable): (txid, index) tuples to reserve.
+                Repeated outpoints are reserved once.
+            ttl (float): Seconds until the reservation expires.
+
+        Returns:
+            str: A token identifying the reservation.
+
+        Raises:
+            UtxoReservedError: If any of the outpoints is already
+                reserved. No outpoints are reserved in that case.
+        """
+        outpoints = list(dict.fromkeys(tuple(o) for o in outpoints))
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._write() as conn:
+            conn.execute("DELETE FROM reservations WHERE expires <= ?", (now,))
+            try:
+                conn.executemany("INSERT INTO reservations VALUES (?,?,?,?)",
+                                 [(txid, index, token, now + ttl)
+                                  for txid, index in outpoints])
+            except sqlite3.IntegrityError:
+                raise exceptions.UtxoReservedError(
+                    "One or more UTXOs are already reserved.")
+
+        return token
+
+    def release(self, token):
+        """ Releases a reservation. Releasing an unknown or expired
+            reservation does nothing.
+
+        Args:
+            token (str): The token returned by reserve().
+        """
+        with self._write() as conn:
+            conn.execute("DELETE FROM reservations WHERE token=?", (token,))
+
+    def reserved(self):
+        """ Returns all currently reserved outpoints.
+
+        Returns:
+            set(tuple): Set of (txid, index) tuples.
+        """
+        with self._lock:
+            cur = self._conn.execute("SELECT txid, idx FROM reservations WHERE expires > ?",
+                                     (time.time(),))
+            return set(cur.fetchall())
+
+    @contextlib.contextmanager
+    def reservation(self, outpoints, ttl=DEFAULT_RESERVATION_TTL):
+        """ Context manager that reserves outpoints and releases them
+            if the block raises. Otherwise the reservation is kept
+            until it is released or expires.
+
+        Args:
+            outpoints (iterable): (txid, index) tuples to reserve.
+            ttl (float): Seconds until the reservation expires.
+
+        Yields:
+            str: The reservation token.
+        """
+        token = self.reserve(outpoints, ttl)
+        try:
+            yield token
+        except:
+            self.release(token)
+            raise
+
+    def close(self):
+        """ Closes the underlying database connection.
+        """
+        self._conn.close()
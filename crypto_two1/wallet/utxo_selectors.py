@@ -1,4 +1,274 @@
-from crypto_two1.wallet.fees import get_fees
+import bisect
+import math
+from collections.abc import Mapping
+
+from crypto_two1.wallet.fees import DUST_LIMIT
+from crypto_two1.wallet.fees import get_fee_estimator
+
+# Serialized sizes (in bytes) used to estimate fees. Signatures are
+# assumed to be 72 bytes (DER) plus the hash type, i.e. an upper bound.
+TXN_OVERHEAD_SIZE = 10  # version, input/output counts, lock time
+P2PKH_INPUT_SIZE = 148
+P2PK_INPUT_SIZE = 114
+# A 2-of-2 multisig redeem script as used by payment channels
+P2SH_MULTISIG_INPUT_SIZE = 262
+P2PKH_OUTPUT_SIZE = 34
+P2SH_OUTPUT_SIZE = 32
+# Larger transactions are not relayed by nodes
+MAX_STANDARD_TXN_SIZE = 100000
+
+# Limits that keep branch and bound selection fast on wallets with
+# very many UTXOs.
+BNB_MAX_CANDIDATES = 256
+BNB_MAX_TRIES = 1000
+
+
+def estimate_input_size(script):
+    """ Estimates the serialized size of an input spending an output.
+
+    Args:
+        script (Script): The scriptPubKey of the output being spent.
+
+    Returns:
+        int: The estimated size of the input in bytes.
+    """
+    b = bytes(script)
+    n = len(b)
+    if n == 25 and b[:3] == b"\x76\xa9\x14" and b[23:] == b"\x88\xac":
+        return P2PKH_INPUT_SIZE
+    elif n == 23 and b[:2] == b"\xa9\x14" and b[22] == 0x87:
+        return P2SH_MULTISIG_INPUT_SIZE
+    elif n in (35, 67) and b[0] == n - 2 and b[-1] == 0xac:
+        return P2PK_INPUT_SIZE
+    elif n > 3 and b[-1] == 0xae and 0x51 <= b[0] <= 0x60:
+        # Bare multisig: OP_0 followed by m signatures
+        m = b[0] - 0x50
+        return 41 + 1 + 74 * m + (2 if 1 + 74 * m > 0xfc else 0)
+    return P2PKH_INPUT_SIZE
+
+
+def estimate_output_size(script):
+    """ Estimates the serialized size of an output.
+
+    Args:
+        script (Script): The scriptPubKey of the output.
+
+    Returns:
+        int: The size of the output in bytes.
+    """
+    n = len(bytes(script))
+    return 8 + (1 if n < 0xfd else 3) + n
+
+
+def estimate_txn_size(input_scripts, num_outputs, output_scripts=[]):
+    """ Estimates the serialized size of a transaction.
+
+    Args:
+        input_scripts (list(Script)): The scriptPubKeys of the outputs
+            spent by the inputs.
+        num_outputs (int): Number of P2PKH outputs, in addition to
+            output_scripts.
+        output_scripts (list(Script)): The scriptPubKeys of any
+            other outputs.
+
+    Returns:
+        int: The estimated size of the transaction in bytes.
+    """
+    return TXN_OVERHEAD_SIZE + \
+        sum(estimate_input_size(s) for s in input_scripts) + \
+        num_outputs * P2PKH_OUTPUT_SIZE + \
+        sum(estimate_output_size(s) for s in output_scripts)
+
+
+def fee_for_size(size, fee_per_kb):
+    """ Returns the fee for a transaction of the given size.
+
+    Args:
+        size (int): Size of the transaction in bytes.
+        fee_per_kb (int): Fee rate in satoshis per kB.
+
+    Returns:
+        int: The fee in satoshis.
+    """
+    return int(math.ceil(size * fee_per_kb / 1000))
+
+
+class UtxoIndex(Mapping):
+    """ A set of UTXOs kept sorted by value.
+
+        UTXOs are kept in buckets according to the bit length of their
+        value, each bucket being a sorted list. Adding or removing a
+        UTXO only touches one (small) bucket and UTXOs can be walked
+        in value order from any starting value without sorting the
+        whole set. The estimated input size of each UTXO is computed
+        once when it is added.
+
+        The index is also a read-only mapping of address to a list of
+        UnspentTransactionOutput objects, i.e. it can be passed to any
+        utxo_selector in place of a utxos_by_addr dict.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._bucket_ids = []
+        self._entries = {}
+        self._by_addr = {}
+        self.total_value = 0
+
+    @classmethod
+    def from_utxos_by_addr(cls, utxos_by_addr):
+        """ Creates an index from a dict of UTXOs.
+
+        Args:
+            utxos_by_addr (dict): Keys are addresses, values are lists
+                of UnspentTransactionOutput objects.
+
+        Returns:
+            UtxoIndex: The index.
+        """
+        index = cls()
+        for addr, utxos in utxos_by_addr.items():
+            for u in utxos:
+                index.add(addr, u)
+        return index
+
+    def add(self, address, utxo):
+        """ Adds a UTXO to the index, replacing any existing one with
+            the same outpoint and address.
+
+        Args:
+            address (str): Address the UTXO belongs to.
+            utxo (UnspentTransactionOutput): The UTXO.
+        """
+        ident = (str(utxo.transaction_hash), utxo.outpoint_index, address)
+        if ident in self._entries:
+            self.remove(address, ident[0], ident[1])
+
+        key = (utxo.value,) + ident
+        b = utxo.value.bit_length()
+        bucket = self._buckets.get(b, None)
+        if bucket is None:
+            bucket = self._buckets[b] = []
+            bisect.insort(self._bucket_ids, b)
+        bisect.insort(bucket, key)
+
+        self._entries[ident] = (utxo, estimate_input_size(utxo.script))
+        self._by_addr.setdefault(address, {})[ident[:2]] = utxo
+        self.total_value += utxo.value
+
+    def remove(self, address, txid, index):
+        """ Removes a UTXO from the index.
+
+        Args:
+            address (str): Address the UTXO belongs to.
+            txid (str): The txid of the transaction containing the UTXO.
+            index (int): The output index of the UTXO.
+
+        Returns:
+            UnspentTransactionOutput: The removed UTXO or None if it
+                was not in the index.
+        """
+        ident = (txid, index, address)
+        entry = self._entries.pop(ident, None)
+        if entry is None:
+            return None
+        utxo = entry[0]
+
+        key = (utxo.value,) + ident
+        b = utxo.value.bit_length()
+        bucket = self._buckets[b]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if not bucket:
+            del self._buckets[b]
+            self._bucket_ids.remove(b)
+
+        addr_utxos = self._by_addr[address]
+        del addr_utxos[(txid, index)]
+        if not addr_utxos:
+            del self._by_addr[address]
+        self.total_value -= utxo.value
+
+        return utxo
+
+    def without(self, outpoints):
+        """ Returns the index minus some UTXOs.
+
+        Args:
+            outpoints (set): (txid, index) tuples of the UTXOs to leave
+                out.
+
+        Returns:
+            UtxoIndex: A new index, or this one if none of the
+                outpoints are in it.
+        """
+        if not outpoints or not any(ident[:2] in outpoints for ident in self._entries):
+            return self
+
+        index = UtxoIndex()
+        for addr, utxos in self._by_addr.items():
+            for key, utxo in utxos.items():
+                if key not in outpoints:
+                    index.add(addr, utxo)
+        return index
+
+    @property
+    def num_utxos(self):
+        """ int: The number of UTXOs in the index.
+        """
+        return len(self._entries)
+
+    def __getitem__(self, address):
+        return list(self._by_addr[address].values())
+
+    def __iter__(self):
+        return iter(self._by_addr)
+
+    def __len__(self):
+        return len(self._by_addr)
+
+    def _iter_keys(self, reverse=False, min_value=None, max_value=None):
+        # Private, yields (value, txid, index, address) keys in value
+        # order.
+        ids = self._bucket_ids
+        lo = 0 if min_value is None else bisect.bisect_left(ids, max(min_value, 0).bit_length())
+        hi = len(ids) if max_value is None else \
+            bisect.bisect_right(ids, max(max_value, 0).bit_length())
+        if reverse:
+            for b in reversed(ids[lo:hi]):
+                bucket = self._buckets[b]
+                end = len(bucket) if max_value is None else \
+                    bisect.bisect_left(bucket, (max_value + 1,))
+                for i in range(end - 1, -1, -1):
+                    key = bucket[i]
+                    if min_value is not None and key[0] < min_value:
+                        return
+                    yield key
+        else:
+            for b in ids[lo:hi]:
+                bucket = self._buckets[b]
+                start = 0 if min_value is None else \
+                    bisect.bisect_left(bucket, (min_value,))
+                for i in range(start, len(bucket)):
+                    key = bucket[i]
+                    if max_value is not None and key[0] > max_value:
+                        return
+                    yield key
+
+    def iter_utxos(self, reverse=False, min_value=None, max_value=None):
+        """ Iterates over the UTXOs in order of value.
+
+        Args:
+            reverse (bool): If True, the largest UTXOs come first.
+            min_value (int): If not None, only UTXOs worth at least
+                this much are returned.
+            max_value (int): If not None, only UTXOs worth at most
+                this much are returned.
+
+        Yields:
+            tuple: (address, UnspentTransactionOutput) tuples.
+        """
+        for key in self._iter_keys(reverse, min_value, max_value):
+            yield key[3], self._entries[key[1:]][0]
 
 
 def _get_utxos_addr_tuple_list(utxos_by_addr):
@@ -12,14 +282,17 @@ def _get_utxos_addr_tuple_list(utxos_by_addr):
 
 def utxo_selector_smallest_first(utxos_by_addr, amount,
                                  num_outputs, fees=None):
-    f = get_fees()
+    f = get_fee_estimator().get_fees()
     input_fee = f['per_input']
     output_fee = f['per_output']
 
     # Order the utxos by amount
-    utxo_tuple_list = _get_utxos_addr_tuple_list(utxos_by_addr)
-    ordered_utxos = sorted(utxo_tuple_list,
-                           key=lambda utxo_addr_tuple: utxo_addr_tuple[1].value)
+    if isinstance(utxos_by_addr, UtxoIndex):
+        ordered_utxos = utxos_by_addr.iter_utxos()
+    else:
+        utxo_tuple_list = _get_utxos_addr_tuple_list(utxos_by_addr)
+        ordered_utxos = sorted(utxo_tuple_list,
+                               key=lambda utxo_addr_tuple: utxo_addr_tuple[1].value)
 
     calc_fees = num_outputs * output_fee
     utxos_to_use = {}
@@ -49,3 +322,292 @@ def utxo_selector_smallest_first(utxos_by_addr, amount,
 
 def _fee_calc(num_utxos, total_value, fee_amounts):
     return num_utxos * fee_amounts['per_input'] + fee_amounts['per_output']
+
+
+class _Selection(object):
+    """ Parameters shared by the size-based selectors.
+
+    Note:
+        THIS IS NOT A PUBLIC API.
+    """
+
+    def __init__(self, utxos_by_addr, amount, num_outputs, fees):
+        if isinstance(utxos_by_addr, UtxoIndex):
+            self.index = utxos_by_addr
+        else:
+            self.index = UtxoIndex.from_utxos_by_addr(utxos_by_addr)
+        self.amount = amount
+        self.fees = fees
+
+        if fees is None:
+            self.fee_per_kb = get_fee_estimator().get_fee_per_kb()
+            self.base_fee = fee_for_size(TXN_OVERHEAD_SIZE + num_outputs * P2PKH_OUTPUT_SIZE,
+                                         self.fee_per_kb)
+            self.change_fee = fee_for_size(P2PKH_OUTPUT_SIZE, self.fee_per_kb)
+        else:
+            self.fee_per_kb = 0
+            self.base_fee = fees
+            self.change_fee = 0
+
+        # Amount the effective values of the inputs must add up to
+        self.target = amount + self.base_fee
+        self._input_fees = {}
+
+    def effective_value(self, key):
+        """ Returns the value of a UTXO minus the fee to spend it.
+        """
+        size = self.index._entries[key[1:]][1]
+        fee = self._input_fees.get(size, None)
+        if fee is None:
+            fee = self._input_fees[size] = fee_for_size(size, self.fee_per_kb)
+        return key[0] - fee
+
+    def max_input_fee(self):
+        return fee_for_size(max(P2PKH_INPUT_SIZE, P2SH_MULTISIG_INPUT_SIZE),
+                            self.fee_per_kb)
+
+    def result(self, keys):
+        """ Builds the selector return value from a list of index keys.
+        """
+        selected = {}
+        total = 0
+        fee = self.base_fee
+        for key in keys:
+            selected.setdefault(key[3], []).append(self.index._entries[key[1:]][0])
+            total += key[0]
+            fee += key[0] - self.effective_value(key)
+
+        if self.fees is not None:
+            fee = self.fees
+        elif total - self.amount - fee > DUST_LIMIT:
+            # The wallet adds a change output whenever more than
+            # DUST_LIMIT is left over, so the fee has to pay for it. If
+            # too little is left to pay for it and still be worth
+            # keeping, the rest goes to the fee instead.
+            if total - self.amount - fee - self.change_fee > DUST_LIMIT:
+                fee += self.change_fee
+            else:
+                fee = total - self.amount
+
+        if not keys or total < self.amount + fee:
+            return {}, fee
+        return selected, fee
+
+
+def _select_branch_and_bound(sel):
+    """ Searches for a set of UTXOs that pays the target without
+        leaving enough for a change output, i.e. wasting at most
+        DUST_LIMIT satoshis.
+
+    Note:
+        THIS IS NOT A PUBLIC API.
+
+    Returns:
+        list: Index keys of the selected UTXOs or None.
+    """
+    window = DUST_LIMIT
+    target = sel.target
+    max_fee = sel.max_input_fee()
+
+    def _match(need, max_value=None):
+        # Smallest UTXO whose effective value is in [need, need + window]
+        hi = need + window + max_fee
+        if max_value is not None:
+            hi = min(hi, max_value)
+        for key in sel.index._iter_keys(min_value=need, max_value=hi):
+            if need <= sel.effective_value(key) <= need + window:
+                return key
+        return None
+
+    # Look for a single UTXO, then for a pair, using range queries on
+    # the index.
+    key = _match(target)
+    if key is not None:
+        return [key]
+
+    tries = 0
+    for a in sel.index._iter_keys(reverse=True, max_value=target + max_fee):
+        ev = sel.effective_value(a)
+        if ev * 2 < target or tries >= BNB_MAX_TRIES:
+            break
+        tries += 1
+        if ev >= target:
+            continue
+        b = _match(target - ev, a[0])
+        if b is not None and b != a:
+            return [a, b]
+
+    # Otherwise search combinations of the largest UTXOs that could
+    # be part of a match.
+    cands = []
+    for key in sel.index._iter_keys(reverse=True, max_value=target + window + max_fee):
+        ev = sel.effective_value(key)
+        if ev <= 0:
+            continue
+        if ev <= target + window:
+            cands.append((ev, key))
+            if len(cands) >= BNB_MAX_CANDIDATES:
+                break
+    cands.sort(reverse=True)
+    vals = [c[0] for c in cands]
+
+    available = sum(vals)
+    if available < target:
+        return None
+
+    best = None
+    best_excess = None
+    included = []
+    value = 0
+    i = 0
+    for _ in range(BNB_MAX_TRIES):
+        backtrack = False
+        if value + available < target or value > target + window:
+            backtrack = True
+        elif value >= target:
+            excess = value - target
+            if best is None or excess < best_excess:
+                best = [j for j, inc in enumerate(included) if inc]
+                best_excess = excess
+                if excess == 0:
+                    break
+            backtrack = True
+
+        if backtrack:
+            # Undo trailing omissions, then omit the last inclusion.
+            while included and not included[-1]:
+                included.pop()
+                i -= 1
+                available += vals[i]
+            if not included:
+                break
+            included[-1] = False
+            value -= vals[i - 1]
+        else:
+            available -= vals[i]
+            if included and not included[-1] and vals[i] == vals[i - 1]:
+                # Including this would repeat the search done for its
+                # equal-valued predecessor.
+                included.append(False)
+            else:
+                included.append(True)
+                value += vals[i]
+            i += 1
+
+    return None if best is None else [cands[j][1] for j in best]
+
+
+def _select_knapsack(sel):
+    """ Picks the better of the smallest UTXO that covers the target
+        plus change on its own and a greedy combination of smaller
+        UTXOs with unnecessary inputs removed.
+
+    Note:
+        THIS IS NOT A PUBLIC API.
+
+    Returns:
+        list: Index keys of the selected UTXOs or None.
+    """
+    # Make sure any change is above the dust limit
+    target = sel.target + sel.change_fee + DUST_LIMIT + 1
+
+    larger = None
+    for key in sel.index._iter_keys(min_value=target):
+        if sel.effective_value(key) >= target:
+            larger = key
+            break
+
+    smaller = []
+    total = 0
+    max_value = larger[0] - 1 if larger is not None else None
+    for key in sel.index._iter_keys(reverse=True, max_value=max_value):
+        ev = sel.effective_value(key)
+        if ev <= 0:
+            continue
+        smaller.append((ev, key))
+        total += ev
+        if total >= target:
+            break
+
+    if total >= target:
+        # Drop the smallest inputs that aren't needed
+        for j in range(len(smaller) - 1, -1, -1):
+            if total - smaller[j][0] >= target:
+                total -= smaller[j][0]
+                smaller[j] = None
+        smaller = [c[1] for c in smaller if c is not None]
+        if larger is None or sum(k[0] for k in smaller) < larger[0]:
+            return smaller
+
+    return [larger] if larger is not None else None
+
+
+def _select_largest_first(sel):
+    """ Adds UTXOs from largest to smallest until the target is met.
+
+    Note:
+        THIS IS NOT A PUBLIC API.
+
+    Returns:
+        list: Index keys of the selected UTXOs or None.
+    """
+    keys = []
+    total = 0
+    for key in sel.index._iter_keys(reverse=True):
+        ev = sel.effective_value(key)
+        if ev <= 0:
+            continue
+        keys.append(key)
+        total += ev
+        if total >= sel.target:
+            return keys
+    return None
+
+
+def utxo_selector_branch_and_bound(utxos_by_addr, amount,
+                                   num_outputs, fees=None):
+    """ Selects UTXOs that pay for amount and fees without creating a
+        change output, if such a combination can be found quickly.
+
+        Fees are estimated from the actual script types of the UTXOs.
+        See Two1Wallet for the selector prototype.
+    """
+    sel = _Selection(utxos_by_addr, amount, num_outputs, fees)
+    return sel.result(_select_branch_and_bound(sel) or [])
+
+
+def utxo_selector_knapsack(utxos_by_addr, amount, num_outputs, fees=None):
+    """ Selects either the smallest UTXO that covers amount, fees and
+        change on its own or a small combination of smaller UTXOs,
+        whichever overshoots least.
+
+        Fees are estimated from the actual script types of the UTXOs.
+        See Two1Wallet for the selector prototype.
+    """
+    sel = _Selection(utxos_by_addr, amount, num_outputs, fees)
+    return sel.result(_select_knapsack(sel) or [])
+
+
+def utxo_selector_largest_first(utxos_by_addr, amount,
+                                num_outputs, fees=None):
+    """ Selects the largest UTXOs until amount and fees are covered,
+        minimizing the number of inputs.
+
+        Fees are estimated from the actual script types of the UTXOs.
+        See Two1Wallet for the selector prototype.
+    """
+    sel = _Selection(utxos_by_addr, amount, num_outputs, fees)
+    return sel.result(_select_largest_first(sel) or [])
+
+
+def utxo_selector_best(utxos_by_addr, amount, num_outputs, fees=None):
+    """ Tries branch and bound to avoid change, then knapsack and
+        finally largest first selection.
+
+        Fees are estimated from the actual script types of the UTXOs.
+        See Two1Wallet for the selector prototype.
+    """
+    sel = _Selection(utxos_by_addr, amount, num_outputs, fees)
+    keys = _select_branch_and_bound(sel) or _select_knapsack(sel) or \
+        _select_largest_first(sel)
+    return sel.result(keys or [])
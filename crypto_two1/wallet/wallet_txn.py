@@ -1,7 +1,11 @@
 import copy
 
 from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import CoinbaseInput
 from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.utils import address_to_key_hash
+from crypto_two1.bitcoin.utils import key_hash_to_address
 
 
 class WalletTransaction(Transaction):
@@ -19,7 +23,7 @@ class WalletTransaction(Transaction):
             tuple: First element of the tuple is the WalletTransaction,
                    second is the remainder of the byte stream.
         """
-        t, b1 = Transaction.from_bytes()
+        t, b1 = Transaction.from_bytes(b)
         return WalletTransaction.from_transaction(t), b1
 
     @staticmethod
@@ -82,9 +86,131 @@ class WalletTransaction(Transaction):
         self.fees = fees
         self.provisional = False
 
+        # Wallet transactions are not modified once created, so the
+        # addresses only need to be extracted from the scripts once.
+        self._address_records = {}
+        self._output_index = None
+
     def __eq__(self, o):
         return self._serialize() == o._serialize()
 
+    def address_record(self, testnet=False):
+        """ Returns the addresses and values of the inputs and outputs
+            of this transaction. The record is computed once per network
+            and memoized.
+
+        Args:
+            testnet (bool): True if the transaction is a testnet transaction.
+
+        Returns:
+            dict:
+                A dict containing the following key/value pairs:
+                'inputs': list of lists of addresses, one per input
+                'outputs': list of lists of addresses, one per output
+                'values': list of output values
+                'p2sh_inputs': dict mapping the index of each multisig
+                    input to the P2SH address it spends from
+                'output_hash160s': list containing, for each P2PKH or
+                    P2SH output, the hex-encoded hash160 it pays to
+                    and None for all other outputs
+        """
+        rec = self._address_records.get(testnet, None)
+        if rec is not None:
+            return rec
+
+        addrs = Transaction.get_addresses(self, testnet)
+
+        p2sh_inputs = {}
+        redeem_version = Script.P2SH_TESTNET_VERSION if testnet \
+            else Script.P2SH_MAINNET_VERSION
+        for i, inp in enumerate(self.inputs):
+            if not isinstance(inp, CoinbaseInput) and inp.script.is_multisig_sig():
+                sig_info = inp.script.extract_multisig_sig_info()
+                p2sh_inputs[i] = key_hash_to_address(
+                    sig_info['redeem_script'].hash160(), redeem_version)
+
+        h160s = []
+        for o in self.outputs:
+            scr = o.script
+            if scr.is_p2pkh() or scr.is_p2sh():
+                h160s.append(scr.get_hash160().hex())
+            else:
+                h160s.append(None)
+
+        rec = dict(inputs=addrs['inputs'],
+                   outputs=addrs['outputs'],
+                   values=[o.value for o in self.outputs],
+                   p2sh_inputs=p2sh_inputs,
+                   output_hash160s=h160s)
+        self._address_records[testnet] = rec
+
+        return rec
+
+    def clear_address_records(self):
+        """ Forgets the memoized address records. This must be called
+            whenever the input or output scripts are changed in place,
+            e.g. when inputs are signed.
+        """
+        self._address_records = {}
+
+    def sign_input(self, input_index, hash_type, private_key, sub_script):
+        # Signing changes the input scripts, so forget any extracted
+        # addresses.
+        self.clear_address_records()
+        return super().sign_input(input_index, hash_type, private_key, sub_script)
+
+    def _set_address_record(self, testnet, rec):
+        # Private, used to restore a record from the wallet cache
+        rec['p2sh_inputs'] = {int(k): v for k, v in rec['p2sh_inputs'].items()}
+        self._address_records[testnet] = rec
+
+    def get_addresses(self, testnet=False):
+        """ Returns all addresses associated with this transaction.
+
+        Args:
+            testnet (bool): True if the transaction is a testnet transaction.
+
+        Returns:
+            dict:
+                A dict containing the following key/value pairs:
+                'inputs': list of lists of addresses, one per input
+                'outputs': list of lists of addresses, one per output
+        """
+        rec = self.address_record(testnet)
+        return dict(inputs=list(rec['inputs']),
+                    outputs=list(rec['outputs']))
+
+    def output_index_for_address(self, address_or_hash160):
+        """ Returns the index of the output in this transaction
+        that pays to the provided address.
+
+        Args:
+            address_or_hash160 (str or bytes): If a string, a
+                Base58Check encoded address. If bytes, the hash160
+                of the public key.
+
+        Returns:
+            int: The index of the corresponding output or None.
+        """
+        if isinstance(address_or_hash160, str):
+            ver, h160 = address_to_key_hash(address_or_hash160)
+        elif isinstance(address_or_hash160, bytes):
+            h160 = address_or_hash160
+        else:
+            raise TypeError("address_or_hash160 can only be bytes or str")
+
+        if self._output_index is None:
+            # The hash160s don't depend on the network, so any record
+            # will do.
+            rec = next(iter(self._address_records.values()), None) or \
+                self.address_record()
+            self._output_index = {}
+            for i, h in enumerate(rec['output_hash160s']):
+                if h is not None and h not in self._output_index:
+                    self._output_index[h] = i
+
+        return self._output_index.get(h160.hex(), None)
+
     def _serialize(self):
         # Private, only for internal wallet usage
         h = None if self.block_hash is None else str(self.block_hash)
@@ -1,5 +1,8 @@
 import arrow
 from calendar import timegm
+
+import pytest
+
 from crypto_two1.bitcoin.block import Block
 from crypto_two1.bitcoin.crypto import HDKey
 from crypto_two1.bitcoin.crypto import HDPrivateKey
@@ -12,8 +15,12 @@ from crypto_two1.bitcoin.txn import CoinbaseInput
 from crypto_two1.bitcoin.txn import Transaction
 from crypto_two1.bitcoin.txn import TransactionInput
 from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.bitcoin.utils import address_to_key_hash
+from crypto_two1.bitcoin.utils import b58decode_check
+from crypto_two1.bitcoin.utils import b58encode_check
 from crypto_two1.bitcoin.utils import bytes_to_str
 from crypto_two1.bitcoin.utils import difficulty_to_target
+from crypto_two1.bitcoin.utils import key_hash_to_address
 from crypto_two1.bitcoin.utils import target_to_bits
 
 
@@ -175,6 +182,26 @@ def test_utils():
     assert target_to_bits(0x00000000000404CB000000000000000000000000000000000000000000000000) == 0x1b0404cb
 
 
+def test_base58():
+    h160 = bytes.fromhex("f1fd1dc65af03c30fe743ac63cef3a120ffab57d")
+    for version, address in [(0x00, "1P4X54WbgeVKAnbKziaGP5n9b6Qvc9R8RZ"),
+                             (0x05, "3PkXzc13EYohFxHm7pEroi95jcheC7NhSo"),
+                             (0x6f, "n3aUN7baVfvZwu4wiHYeCzzUT61dVtTBsp")]:
+        assert key_hash_to_address(h160, version) == address
+        assert key_hash_to_address(h160.hex(), version) == address
+        assert address_to_key_hash(address) == (version, h160)
+        assert address_to_key_hash(address.encode()) == (version, h160)
+
+    for b in [b"", b"\x00", b"\x00\x00\x01", bytes(range(78))]:
+        assert b58decode_check(b58encode_check(b)) == b
+    assert b58encode_check(b"\x00" * 21).startswith("1" * 21)
+
+    with pytest.raises(ValueError):
+        address_to_key_hash("1P4X54WbgeVKAnbKziaGP5n9b6Qvc9R8Ra")
+    with pytest.raises(ValueError):
+        address_to_key_hash("0P4X54WbgeVKAnbKziaGP5n9b6Qvc9R8RZ")
+
+
 def test_txn():
     txn_str = "0100000001205607fb482a03600b736fb0c257dfd4faa49e45db3990e2c4994796031eae6e000000008b483045022100ed84be709227397fb1bc13b749f235e1f98f07ef8216f15da79e926b99d2bdeb02206ff39819d91bc81fecd74e59a721a38b00725389abb9cbecb42ad1c939fd8262014104e674caf81eb3bb4a97f2acf81b54dc930d9db6a6805fd46ca74ac3ab212c0bbf62164a11e7edaf31fbf24a878087d925303079f2556664f3b32d125f2138cbefffffffff0128230000000000001976a914f1fd1dc65af03c30fe743ac63cef3a120ffab57d88ac00000000"  # nopep8
     tx = Transaction.from_hex(txn_str)
@@ -186,3 +186,24 @@ def test_multisig_sign():
     assert not tx.verify_input_signature(0, script_pub_key)
 
     assert tx.verify_partial_multisig(0, script_pub_key)
+
+
+def test_get_sighashes():
+    scripts = [script.Script.build_p2pkh(k[1].hash160(compressed=False)) for k in keys]
+    inputs = [txn.TransactionInput(hash.Hash(bytes([i]) * 32), i, script.Script(""), 0xffffffff)
+              for i in range(5)]
+    outputs = [txn.TransactionOutput(1000 * (i + 1), scripts[i % 2]) for i in range(3)]
+    transaction = txn.Transaction(txn.Transaction.DEFAULT_TRANSACTION_VERSION,
+                                  inputs, outputs, 0)
+
+    for hash_type in [txn.Transaction.SIG_HASH_ALL, txn.Transaction.SIG_HASH_NONE,
+                      txn.Transaction.SIG_HASH_SINGLE]:
+        sub_scripts = {i: scripts[i % 2] for i in range(5)}
+        msgs = transaction.get_sighashes(sub_scripts, hash_type)
+        for i in range(5):
+            _, exp = transaction.get_signature_for_input(i, hash_type, keys[i % 2][0],
+                                                         sub_scripts[i])
+            assert msgs[i] == exp
+
+    with pytest.raises(ValueError):
+        transaction.get_sighashes({5: scripts[0]})
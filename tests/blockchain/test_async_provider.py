@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from crypto_two1.blockchain.async_provider import AsyncBaseProvider
+from crypto_two1.blockchain.async_provider import AsyncToSyncProvider
+from crypto_two1.blockchain.async_provider import SyncToAsyncProvider
+from crypto_two1.blockchain.async_provider import to_async
+from crypto_two1.blockchain.async_provider import to_sync
+from crypto_two1.blockchain.base_provider import BaseProvider
+from crypto_two1.blockchain.exceptions import DataProviderError
+
+DELAY = 0.1
+
+
+class _AsyncProvider(AsyncBaseProvider):
+
+    def __init__(self):
+        super().__init__()
+        self.testnet = False
+        self.active = 0
+        self.max_active = 0
+        self.threads = set()
+
+    async def get_transactions_by_id(self, ids):
+        self.threads.add(threading.get_ident())
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(DELAY)
+        self.active -= 1
+        if "bad" in ids:
+            raise DataProviderError("bad txid")
+        return {txid: dict(metadata={}, transaction=None) for txid in ids}
+
+    async def get_block_height(self):
+        return 400000
+
+
+class _SyncProvider(BaseProvider):
+
+    def __init__(self):
+        super().__init__()
+        self.testnet = True
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def get_transactions(self, address_list, limit=100, min_block=None):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(DELAY)
+        with self.lock:
+            self.active -= 1
+        return {a: [min_block] for a in address_list}
+
+    def get_block_height(self):
+        return 400000
+
+
+def test_async_provider():
+    provider = _AsyncProvider()
+
+    async def lookups():
+        return await asyncio.gather(*[provider.get_transactions_by_id(["%064x" % i])
+                                      for i in range(2000)])
+
+    loop = asyncio.new_event_loop()
+    results = loop.run_until_complete(lookups())
+    loop.close()
+
+    # Lookups in flight at once on one thread
+    assert provider.threads == {threading.get_ident()}
+    assert 1 < provider.max_active <= 2000
+    assert [list(r.keys())[0] for r in results] == ["%064x" % i for i in range(2000)]
+
+    with pytest.raises(NotImplementedError):
+        asyncio.new_event_loop().run_until_complete(provider.get_utxos(["addr"]))
+
+
+def test_sync_to_async():
+    provider = _SyncProvider()
+    async_provider = to_async(provider, max_workers=4)
+    assert isinstance(async_provider, SyncToAsyncProvider)
+    assert to_async(async_provider) is async_provider
+    assert to_sync(async_provider) is provider
+    assert async_provider.testnet
+    assert not async_provider.can_limit_by_height
+
+    async def lookups():
+        return await asyncio.gather(*[async_provider.get_transactions(["addr%d" % i], min_block=i)
+                                      for i in range(8)])
+
+    loop = asyncio.new_event_loop()
+    results = loop.run_until_complete(lookups())
+
+    assert 1 < provider.max_active <= 4
+    assert results == [{"addr%d" % i: [i]} for i in range(8)]
+    assert loop.run_until_complete(async_provider.get_block_height()) == 400000
+
+    with pytest.raises(NotImplementedError):
+        loop.run_until_complete(async_provider.get_utxos(["addr"]))
+
+    loop.close()
+    async_provider.close()
+
+
+def test_async_to_sync():
+    provider = _AsyncProvider()
+    sync_provider = to_sync(provider)
+    assert isinstance(sync_provider, AsyncToSyncProvider)
+    assert to_sync(sync_provider) is sync_provider
+    assert to_async(sync_provider) is provider
+    assert not sync_provider.testnet
+
+    assert sync_provider.get_block_height() == 400000
+    assert list(sync_provider.get_transactions_by_id(["a", "b"]).keys()) == ["a", "b"]
+    with pytest.raises(DataProviderError):
+        sync_provider.get_transactions_by_id(["bad"])
+
+    # Calls from several threads share the background loop
+    results = {}
+
+    def lookup(i):
+        results[i] = sync_provider.get_transactions_by_id(["%d" % i])
+
+    threads = [threading.Thread(target=lookup, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert provider.threads == {sync_provider._thread.ident}
+    assert provider.max_active > 1
+    assert results == {i: {"%d" % i: dict(metadata={}, transaction=None)} for i in range(20)}
+
+    # Works from within a running event loop too
+    async def nested():
+        return sync_provider.get_block_height()
+
+    assert asyncio.new_event_loop().run_until_complete(nested()) == 400000
+
+    sync_provider.close()
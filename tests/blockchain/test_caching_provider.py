@@ -0,0 +1,174 @@
+import time
+
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import TransactionInput
+from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.blockchain.base_provider import BaseProvider
+from crypto_two1.blockchain.caching_provider import CachingProvider
+
+HEIGHT = 1000
+
+
+def _txn(i):
+    return Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                       [TransactionInput(Hash("%064x" % (i + 1)), 0, Script("OP_1"), 0xffffffff)],
+                       [TransactionOutput(10000 + i, Script("OP_1"))],
+                       0)
+
+
+class _Provider(BaseProvider):
+    """ Provider with 10 transactions to each of 2 addresses. Even
+        numbered transactions are deeply confirmed, odd numbered ones
+        are unconfirmed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.testnet = False
+        self.height = HEIGHT
+        self.requested_ids = []
+        self.requested_addrs = []
+        self.txns = {}
+        self.addr_txns = {"addr0": [], "addr1": []}
+        for i in range(20):
+            txn = _txn(i)
+            self.txns[str(txn.hash)] = txn
+            self.addr_txns["addr%d" % (i % 2)].append(str(txn.hash))
+
+    def _result(self, txid):
+        txn = self.txns[txid]
+        i = list(self.txns.keys()).index(txid)
+        if i % 2 == 0:
+            block = i
+            metadata = dict(block=block, block_hash=Hash("%064x" % block),
+                            network_time=i, confirmations=self.height - block + 1)
+        else:
+            metadata = dict(block=None, block_hash=None, network_time=i, confirmations=0)
+        return dict(metadata=metadata, transaction=txn)
+
+    def get_transactions_by_id(self, ids):
+        self.requested_ids += ids
+        return {txid: self._result(txid) for txid in ids}
+
+    def get_transactions(self, address_list, limit=100, min_block=None):
+        self.requested_addrs += address_list
+        return {a: [self._result(txid) for txid in self.addr_txns[a]]
+                for a in address_list if a in self.addr_txns}
+
+    def get_block_height(self):
+        return self.height
+
+    def broadcast_transaction(self, transaction):
+        return "txid"
+
+
+def _check(results, provider):
+    for txid, r in results.items():
+        exp = provider._result(txid)
+        assert r['metadata'] == exp['metadata']
+        assert bytes(r['transaction']) == bytes(exp['transaction'])
+
+
+def test_get_transactions_by_id(tmpdir):
+    db_path = str(tmpdir.join("provider_cache.db"))
+    p = _Provider()
+    c = CachingProvider(p, db_path=db_path, ttl=0.2, block_height_ttl=0)
+    txids = list(p.txns.keys())
+
+    r = c.get_transactions_by_id(txids)
+    assert list(r.keys()) == txids
+    assert p.requested_ids == txids
+    _check(r, p)
+
+    # Everything is cached for a while
+    p.requested_ids = []
+    r = c.get_transactions_by_id(txids)
+    assert p.requested_ids == []
+    _check(r, p)
+
+    # ... after which only the unconfirmed ones are fetched again. The
+    # confirmations of the others follow the block height.
+    time.sleep(0.2)
+    p.height += 5
+    r = c.get_transactions_by_id(txids)
+    assert p.requested_ids == txids[1::2]
+    _check(r, p)
+
+    # The cache persists
+    c.close()
+    p.requested_ids = []
+    c = CachingProvider(p, db_path=db_path, ttl=0.2, block_height_ttl=0)
+    r = c.get_transactions_by_id(txids[::2])
+    assert p.requested_ids == []
+    _check(r, p)
+
+
+def test_eviction():
+    p = _Provider()
+    c = CachingProvider(p, max_txns=4)
+    txids = list(p.txns.keys())[::2]
+
+    c.get_transactions_by_id(txids[:4])
+    time.sleep(0.01)
+    c.get_transactions_by_id(txids[:1])
+    c.get_transactions_by_id(txids[4:5])
+
+    # The least recently used transaction is gone
+    p.requested_ids = []
+    c.get_transactions_by_id(txids[:5])
+    assert p.requested_ids == txids[1:2]
+
+
+def test_get_transactions():
+    p = _Provider()
+    c = CachingProvider(p, ttl=0.2)
+
+    r = c.get_transactions(["addr0", "addr1", "addr2"])
+    assert p.requested_addrs == ["addr0", "addr1", "addr2"]
+    assert sorted(r.keys()) == ["addr0", "addr1"]
+    for a, txns in r.items():
+        assert [str(t['transaction'].hash) for t in txns] == p.addr_txns[a]
+
+    p.requested_addrs = []
+    r = c.get_transactions(["addr1", "addr2"])
+    assert list(r.keys()) == ["addr1"]
+    assert [str(t['transaction'].hash) for t in r["addr1"]] == p.addr_txns["addr1"]
+    assert p.requested_addrs == []
+    # Like the other providers, addresses without transactions have none
+    assert r["addr2"] == []
+
+    # A different limit is a different query
+    c.get_transactions(["addr1"], limit=5)
+    assert p.requested_addrs == ["addr1"]
+
+    # The transactions are cached by id too
+    c.get_transactions_by_id(p.addr_txns["addr0"])
+    assert p.requested_ids == []
+
+    # Broadcasting drops the cached address results
+    p.requested_addrs = []
+    c.broadcast_transaction(_txn(100))
+    c.get_transactions(["addr0"])
+    assert p.requested_addrs == ["addr0"]
+
+    # So does time
+    time.sleep(0.2)
+    p.requested_addrs = []
+    c.get_transactions(["addr1"])
+    assert p.requested_addrs == ["addr1"]
+
+
+def test_block_height():
+    p = _Provider()
+    c = CachingProvider(p, block_height_ttl=0.1)
+    assert c.get_block_height() == HEIGHT
+    p.height += 1
+    assert c.get_block_height() == HEIGHT
+    time.sleep(0.1)
+    assert c.get_block_height() == HEIGHT + 1
+
+    c.testnet = True
+    assert p.testnet
+    assert not c.can_limit_by_height
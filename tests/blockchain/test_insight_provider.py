@@ -0,0 +1,140 @@
+import time
+import urllib.parse
+
+import pytest
+
+from crypto_two1.bitcoin import crypto
+from crypto_two1.bitcoin import utils
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import TransactionInput
+from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.blockchain.insight_provider import InsightProvider
+
+DELAY = 0.1
+BLOCK_HEIGHT = 400000
+
+
+def _txn_json(i, address):
+    _, key_hash = utils.address_to_key_hash(address)
+    txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                      [TransactionInput(Hash("%064x" % (i + 1)), 0, Script("OP_1"), 0xffffffff)],
+                      [TransactionOutput(10000 + i, Script.build_p2pkh(key_hash))],
+                      0)
+    return {"txid": str(txn.hash),
+            "locktime": 0,
+            "confirmations": i % 3,
+            "blockhash": "%064x" % i,
+            "time": 1400000000 + i,
+            "vin": [{"n": 0,
+                     "txid": "%064x" % (i + 1),
+                     "vout": 0,
+                     "scriptSig": {"hex": utils.bytes_to_str(bytes(Script("OP_1")))},
+                     "sequence": 0xffffffff}],
+            "vout": [{"n": 0,
+                      "value": (10000 + i) / 1e8,
+                      "scriptPubKey": {"hex": utils.bytes_to_str(bytes(txn.outputs[0].script)),
+                                       "addresses": [address]}}]}
+
+
+def _handle(request):
+    server = request.server
+    url = urllib.parse.urlparse(request.path)
+    path = url.path.split("/")[2:]
+    query = urllib.parse.parse_qs(url.query)
+    with server.lock:
+        server.requests.append(path[0])
+
+    if path[0] == "status":
+        body = {"info": {"blocks": BLOCK_HEIGHT}}
+    elif path[0] == "addrs":
+        txns = [t
+                for a in path[1].split(",")
+                for t in server.txns_by_addr.get(a, [])]
+        fr = int(query["from"][0])
+        to = min(int(query["to"][0]), len(txns))
+        with server.lock:
+            server.pages.append(fr)
+        body = {"totalItems": len(txns),
+                "from": fr,
+                "to": to,
+                "items": txns[fr:to]}
+    else:
+        body = server.txns_by_id[path[1]]
+    request.send_json(body)
+
+
+@pytest.fixture
+def server(mock_http_server):
+    # 250 addresses with 3 transactions each: 2 chunks, with 6 and 2
+    # pages of transactions.
+    addresses = [crypto.PrivateKey(i + 1).public_key.address() for i in range(250)]
+    s = mock_http_server(_handle, DELAY)
+    s.txns_by_addr = {a: [_txn_json(3 * i + j, a) for j in range(3)]
+                      for i, a in enumerate(addresses)}
+    s.txns_by_id = {t["txid"]: t
+                    for txns in s.txns_by_addr.values()
+                    for t in txns}
+    s.requests = []
+    s.pages = []
+    return s
+
+
+def _provider(server, **kwargs):
+    return InsightProvider(server.url, **kwargs)
+
+
+def test_get_transactions(server):
+    addresses = list(server.txns_by_addr.keys())
+    provider = _provider(server)
+
+    data = provider.get_transactions(addresses)
+
+    # Block height, first pages, then the remaining pages, several
+    # at a time
+    assert server.requests == ["status"] + ["addrs"] * 8
+    assert server.pages[:2] == [0, 0]
+    assert sorted(server.pages[2:]) == [100, 100, 200, 300, 400, 500]
+    assert 1 < server.max_active <= provider.max_workers
+
+    assert set(data.keys()) == set(addresses)
+    for a in addresses:
+        txns = data[a]
+        assert [str(t['transaction'].hash) for t in txns] == \
+            [t["txid"] for t in server.txns_by_addr[a]]
+        for t, exp in zip(txns, server.txns_by_addr[a]):
+            if exp["confirmations"]:
+                assert t['metadata']['block'] == BLOCK_HEIGHT - exp["confirmations"] + 1
+            else:
+                assert t['metadata']['block'] is None
+
+    # Results don't depend on concurrency
+    sequential = _provider(server, max_workers=1).get_transactions(addresses)
+    assert {a: [str(t['transaction'].hash) for t in txns] for a, txns in sequential.items()} == \
+        {a: [str(t['transaction'].hash) for t in txns] for a, txns in data.items()}
+
+
+def test_get_transactions_by_id(server):
+    txids = list(server.txns_by_id.keys())[:16]
+    provider = _provider(server)
+
+    data = provider.get_transactions_by_id(txids)
+
+    assert server.requests == ["status"] + ["tx"] * 16
+    assert 1 < server.max_active <= provider.max_workers
+    assert list(data.keys()) == txids
+
+
+def test_block_height_cache(server):
+    provider = _provider(server, block_height_ttl=0.5)
+    assert provider.get_block_height() == BLOCK_HEIGHT
+
+    txids = list(server.txns_by_id.keys())[:2]
+    provider.get_transactions_by_id(txids)
+    provider.get_transactions(list(server.txns_by_addr.keys())[:1])
+    assert server.requests.count("status") == 1
+
+    time.sleep(0.5)
+    assert provider.get_block_height() == BLOCK_HEIGHT
+    assert server.requests.count("status") == 2
@@ -0,0 +1,52 @@
+import json
+import random
+
+import pytest
+
+from crypto_two1.blockchain.json_stream import iter_json_array
+
+DOCUMENTS = [
+    [],
+    [1, -2.5e-3, True, False, None, "x"],
+    [{"hash": "ab" * 32, "inputs": [{"value": 100}], "outputs": []}] * 20,
+    ["héllo ☃ \"quoted\"", [[], {}], {"a": [1, {"b": None}]}],
+    [123456789, 0.5, 1e20, -0],
+]
+
+
+@pytest.mark.parametrize("data", DOCUMENTS)
+def test_iter_json_array(data):
+    text = json.dumps(data, ensure_ascii=False, indent=1)
+    body = text.encode()
+    rng = random.Random(len(body))
+
+    assert list(iter_json_array([body])) == data
+    assert list(iter_json_array([text])) == data
+    # Split in the middle of values, numbers and UTF-8 characters
+    assert list(iter_json_array(body[i:i + 1] for i in range(len(body)))) == data
+    for _ in range(20):
+        cuts = sorted(rng.sample(range(len(body) + 1), min(len(body), 5)))
+        chunks = [body[i:j] for i, j in zip([0] + cuts, cuts + [len(body)])]
+        assert list(iter_json_array(chunks)) == data
+
+
+def test_iter_json_array_incremental():
+    chunks = [b'[{"a": 1},', b' {"b"', b': 2}]']
+    read = []
+
+    def gen():
+        for c in chunks:
+            read.append(c)
+            yield c
+
+    it = iter_json_array(gen())
+    assert next(it) == {"a": 1}
+    assert len(read) == 1
+    assert next(it) == {"b": 2}
+    assert len(read) == 3
+
+
+@pytest.mark.parametrize("text", ["", "{}", "[1,]", "[1", "[1 2]", "[1] x", '["abc', "[tru]"])
+def test_iter_json_array_invalid(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array([text[:2], text[2:]]))
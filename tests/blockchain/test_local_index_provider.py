@@ -0,0 +1,231 @@
+import calendar
+import datetime
+import gzip
+import json
+import os
+import struct
+
+import pytest
+
+from crypto_two1.bitcoin import crypto
+from crypto_two1.bitcoin import utils
+from crypto_two1.bitcoin.block import Block
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import CoinbaseInput
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import TransactionInput
+from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.blockchain.local_index_provider import LocalIndexProvider
+
+BLOCKS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, "bitcoin", "blocks.json.gz")
+NUM_BLOCKS = 12
+REWARD = 5000000000
+FEE = 10000
+
+keys = [crypto.PrivateKey(i + 1) for i in range(3)]
+addresses = [k.public_key.address() for k in keys]
+
+
+def _p2pkh(address):
+    _, key_hash = utils.address_to_key_hash(address)
+    return Script.build_p2pkh(key_hash)
+
+
+@pytest.fixture(scope="module")
+def chain():
+    """ A chain of blocks with the header fields (version, time, bits,
+        nonce) of the blocks in blocks.json.gz. Block i pays the reward
+        to addresses[i % 3] and, from the second block on, spends the
+        previous block's reward: 1 BTC to the next address and the rest
+        back.
+    """
+    with gzip.open(BLOCKS_PATH, 'rt') as f:
+        blocks_json = sorted(json.load(f), key=lambda b: int(b['height']))[:NUM_BLOCKS]
+
+    start_height = int(blocks_json[0]['height'])
+    blocks = []
+    prev_hash = Hash(blocks_json[0]['previous_block_hash'])
+    for i, b in enumerate(blocks_json):
+        height = start_height + i
+        cb = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                         [CoinbaseInput(height, struct.pack("<I", height), block_version=1)],
+                         [TransactionOutput(REWARD, _p2pkh(addresses[i % 3]))],
+                         0)
+        txns = [cb]
+        if blocks:
+            prev_cb = blocks[-1].txns[0]
+            spend = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                                [TransactionInput(prev_cb.hash, 0, Script(), 0xffffffff)],
+                                [TransactionOutput(100000000, _p2pkh(addresses[(i + 1) % 3])),
+                                 TransactionOutput(REWARD - 100000000 - FEE,
+                                                   _p2pkh(addresses[(i - 1) % 3]))],
+                                0)
+            spend.sign_input(0, Transaction.SIG_HASH_ALL, keys[(i - 1) % 3],
+                             prev_cb.outputs[0].script)
+            txns.append(spend)
+
+        t = datetime.datetime.strptime(b['time'], "%Y-%m-%dT%H:%M:%S.%fZ")
+        block = Block(height, int(b['version']), prev_hash,
+                      calendar.timegm(t.timetuple()),
+                      int(b['bits'], 16), int(b['nonce']), txns)
+        blocks.append(block)
+        prev_hash = block.hash
+
+    return start_height, blocks
+
+
+def _write_blk(path, blocks):
+    with open(path, 'wb') as f:
+        for b in blocks:
+            data = bytes(b)
+            f.write(LocalIndexProvider.MAINNET_MAGIC + struct.pack("<I", len(data)) + data)
+        # Preallocated space
+        f.write(bytes(64))
+
+
+def _check_index(p, start_height, blocks):
+    tip = start_height + len(blocks) - 1
+    assert p.get_block_height() == tip
+
+    # Every address is paid by its coinbases and spends
+    txns = p.get_transactions(addresses)
+    assert sorted(txns.keys()) == sorted(addresses)
+    all_txids = set(str(t.hash) for b in blocks for t in b.txns)
+    assert set(str(t['transaction'].hash)
+               for txn_list in txns.values()
+               for t in txn_list) == all_txids
+    for txn_list in txns.values():
+        # Most recent first
+        heights = [t['metadata']['block'] for t in txn_list]
+        assert heights == sorted(heights, reverse=True)
+        for t in txn_list:
+            h = t['metadata']['block']
+            assert t['metadata']['confirmations'] == tip - h + 1
+            assert t['metadata']['block_hash'] == blocks[h - start_height].hash
+            assert t['metadata']['network_time'] == blocks[h - start_height].block_header.time
+
+    assert p.get_transactions(["1BitcoinEaterAddressDontSendf59kuE"])["1BitcoinEaterAddressDontSendf59kuE"] == []
+
+    # Limits
+    assert len(p.get_transactions(addresses[:1], limit=2)[addresses[0]]) == 2
+    recent = p.get_transactions(addresses, min_block=tip - 1)
+    assert set(str(t['transaction'].hash) for txn_list in recent.values() for t in txn_list) == \
+        set(str(t.hash) for b in blocks[-2:] for t in b.txns)
+
+    # By id
+    by_id = p.get_transactions_by_id([str(blocks[3].txns[1].hash), "00" * 32])
+    assert list(by_id.keys()) == [str(blocks[3].txns[1].hash)]
+    assert bytes(by_id[str(blocks[3].txns[1].hash)]['transaction']) == bytes(blocks[3].txns[1])
+
+    # Spends
+    spends = p.get_spending_txids([(str(blocks[3].txns[0].hash), 0),
+                                   (str(blocks[-1].txns[0].hash), 0)])
+    assert spends == {(str(blocks[3].txns[0].hash), 0): str(blocks[4].txns[1].hash)}
+
+    # Only the last coinbase and the outputs of the spends are unspent
+    utxos = p.get_utxos(addresses)
+    unspent = set((str(u.transaction_hash), u.outpoint_index) for us in utxos.values() for u in us)
+    exp = set([(str(blocks[-1].txns[0].hash), 0)])
+    for b in blocks[1:]:
+        exp |= set([(str(b.txns[1].hash), 0), (str(b.txns[1].hash), 1)])
+    assert unspent == exp
+
+    balances = p.get_balance(addresses)
+    assert sum(b['total'] for b in balances.values()) == \
+        REWARD * len(blocks) - FEE * (len(blocks) - 1)
+
+
+def test_block_file(chain, tmpdir):
+    start_height, blocks = chain
+
+    # Blocks out of order and a stale block forking off the third one
+    fork = Block(start_height + 3, 1, blocks[2].hash, blocks[3].block_header.time,
+                 blocks[3].block_header.bits, 0, blocks[3].txns[:1])
+    file_blocks = blocks[:4] + [blocks[5], fork, blocks[4]] + blocks[6:]
+    path = str(tmpdir.join("blk00000.dat"))
+    _write_blk(path, file_blocks)
+    assert len(list(LocalIndexProvider.read_block_file(path))) == len(file_blocks)
+
+    index_path = str(tmpdir.join("index.db"))
+    p = LocalIndexProvider(index_path)
+    with pytest.raises(ValueError):
+        p.ingest(path)
+    assert p.ingest(path, start_height=start_height) == len(blocks)
+    _check_index(p, start_height, blocks)
+
+    # Nothing new the second time around
+    assert p.ingest(path) == 0
+    p.close()
+
+    # The index is kept on disk
+    p = LocalIndexProvider(index_path)
+    _check_index(p, start_height, blocks)
+    p.close()
+
+
+def test_block_directory(chain, tmpdir):
+    start_height, blocks = chain
+
+    d = tmpdir.mkdir("blocks")
+    for b in blocks[:5]:
+        d.join("%08d.block" % b.height).write_binary(bytes(b))
+    # Later blocks in a block file, read after the single blocks
+    _write_blk(str(d.join("blk00000.dat")), blocks[5:])
+
+    p = LocalIndexProvider(":memory:")
+    assert p.ingest(str(d), start_height=start_height) == len(blocks)
+    _check_index(p, start_height, blocks)
+
+
+def test_ingest_blocks(chain):
+    start_height, blocks = chain
+
+    p = LocalIndexProvider(":memory:")
+    # Blocks that don't connect wait for their parent
+    assert p.ingest_blocks(blocks[:2] + blocks[3:6] + blocks[2:3],
+                           start_height=start_height) == 6
+    # ... and are otherwise left out
+    assert p.ingest_blocks(blocks[7:]) == 0
+    assert p.get_block_height() == start_height + 5
+    assert p.ingest_blocks(blocks[6:]) == len(blocks) - 6
+    _check_index(p, start_height, blocks)
+
+
+def _fork_block(parent, height, tag):
+    cb = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                     [CoinbaseInput(height, tag, block_version=1)],
+                     [TransactionOutput(REWARD, _p2pkh(addresses[0]))],
+                     0)
+    return Block(height, 1, parent.hash, parent.block_header.time + 1,
+                 parent.block_header.bits, 0, [cb])
+
+
+def test_ingest_forks(chain):
+    start_height, blocks = chain
+    fork = _fork_block(blocks[3], start_height + 4, b"fork")
+    fork2 = _fork_block(fork, start_height + 5, b"fork2")
+
+    # A stale sibling held with the main chain block doesn't replace it
+    p = LocalIndexProvider(":memory:")
+    assert p.ingest_blocks(blocks[:3] + [blocks[4], fork, blocks[3]] + blocks[5:],
+                           start_height=start_height) == len(blocks)
+    _check_index(p, start_height, blocks)
+
+    # The index switches to a branch once it is longer, within a call
+    p = LocalIndexProvider(":memory:")
+    assert p.ingest_blocks(blocks[:4] + [fork, blocks[4], fork2] + blocks[5:],
+                           start_height=start_height) == len(blocks) + 2
+    _check_index(p, start_height, blocks)
+
+    # ... and across calls, and back again. Blocks removed by an
+    # earlier call have to be passed again.
+    p = LocalIndexProvider(":memory:")
+    assert p.ingest_blocks(blocks[:5], start_height=start_height) == 5
+    assert p.ingest_blocks([fork, fork2]) == 2
+    assert p.get_block_height() == start_height + 5
+    assert p.get_transactions_by_id([str(fork2.txns[0].hash)])
+    assert p.ingest_blocks(blocks[5:]) == 0
+    assert p.ingest_blocks(blocks[4:]) == len(blocks) - 4
+    _check_index(p, start_height, blocks)
@@ -0,0 +1,206 @@
+import threading
+import time
+
+import pytest
+
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import TransactionInput
+from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.blockchain.base_provider import BaseProvider
+from crypto_two1.blockchain.exceptions import DataProviderUnavailableError
+from crypto_two1.blockchain.multi_provider import MultiProvider
+
+
+class _Provider(BaseProvider):
+
+    def __init__(self, name, delay=0, fail=False, txids=(), height=400000):
+        super().__init__()
+        self.testnet = False
+        self.can_limit_by_height = True
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.txids = set(txids)
+        self.height = height
+        self.lock = threading.Lock()
+        self.calls = 0
+        # Providers a broadcast transaction reaches, even if this one fails
+        self.relay_to = []
+        self.broadcasts = 0
+
+    def _enter(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise DataProviderUnavailableError("%s is down" % self.name)
+
+    def get_utxos(self, address_list):
+        self._enter()
+        return {a: self.name for a in address_list}
+
+    def get_transactions_by_id(self, ids):
+        self._enter()
+        return {txid: dict(metadata={}, transaction=self.name)
+                for txid in ids if txid in self.txids}
+
+    def get_block_height(self):
+        self._enter()
+        return self.height
+
+    def broadcast_transaction(self, transaction):
+        txid = str(Transaction.from_hex(transaction).hash)
+        with self.lock:
+            self.broadcasts += 1
+        for p in self.relay_to:
+            p.txids.add(txid)
+        self._enter()
+        self.txids.add(txid)
+        return txid
+
+
+def test_failover():
+    a = _Provider("a", fail=True)
+    b = _Provider("b")
+    p = MultiProvider([a, b], max_failures=2, retry_after=0.2)
+
+    assert p.get_utxos(["addr"]) == {"addr": "b"}
+    assert p.get_utxos(["addr"]) == {"addr": "b"}
+    assert a.calls == 2
+    stats = p.provider_stats()
+    assert [s['up'] for s in stats] == [False, True]
+    assert stats[0]['failures'] == 2 and stats[0]['errors'] == 2
+    assert stats[1]['calls'] == 2 and stats[1]['latency'] is not None
+
+    # a is down so it isn't called any more ...
+    assert p.get_utxos(["addr"]) == {"addr": "b"}
+    assert a.calls == 2
+
+    # ... until retry_after has passed
+    a.fail = False
+    time.sleep(0.2)
+    assert p.get_utxos(["addr"]) == {"addr": "a"}
+    assert p.provider_stats()[0]['up']
+    assert p.provider_stats()[0]['failures'] == 0
+
+
+def test_all_down():
+    a = _Provider("a", fail=True)
+    b = _Provider("b", fail=True)
+    p = MultiProvider([a, b], max_failures=1)
+
+    with pytest.raises(DataProviderUnavailableError):
+        p.get_utxos(["addr"])
+
+    # Down providers are still tried as a last resort
+    b.fail = False
+    assert p.get_utxos(["addr"]) == {"addr": "b"}
+
+
+def test_hedging():
+    a = _Provider("a", delay=0.01)
+    b = _Provider("b", delay=0.05)
+    p = MultiProvider([a, b], hedge_percentile=0.9, min_hedge_samples=5)
+
+    # No hedging until there are enough samples
+    for _ in range(5):
+        assert p.get_utxos(["addr"]) == {"addr": "a"}
+    assert b.calls == 0
+
+    # a gets slow: the call is hedged with b after ~10 ms
+    a.delay = 1
+    start = time.time()
+    assert p.get_utxos(["addr"]) == {"addr": "b"}
+    assert time.time() - start < 0.5
+    assert b.calls == 1
+
+    # No hedging without a percentile
+    a.delay = 0.2
+    p = MultiProvider([a, b])
+    for _ in range(10):
+        p.get_block_height()
+    assert p.get_utxos(["addr"]) == {"addr": "a"}
+    assert b.calls == 1
+
+
+def test_reconcile():
+    a = _Provider("a", txids=["t1"], height=400001)
+    b = _Provider("b", txids=["t1", "t2"], height=400000)
+    c = _Provider("c", fail=True)
+    p = MultiProvider([a, b, c])
+
+    # Transactions a doesn't know about are looked up with b
+    txns = p.get_transactions_by_id(["t2", "t1", "t3"])
+    assert list(txns.keys()) == ["t2", "t1"]
+    assert txns["t1"]["transaction"] == "a"
+    assert txns["t2"]["transaction"] == "b"
+    assert c.calls == 1
+
+    # The block height doesn't go backwards when b answers
+    assert p.get_block_height() == 400001
+    a.fail = True
+    assert p.get_block_height() == 400001
+    b.height = 400002
+    assert p.get_block_height() == 400002
+
+    a.fail = b.fail = True
+    with pytest.raises(DataProviderUnavailableError):
+        p.get_transactions_by_id(["t1"])
+
+
+def test_properties():
+    a = _Provider("a")
+    b = _Provider("b")
+    p = MultiProvider([a, b])
+    assert p.can_limit_by_height
+    b.can_limit_by_height = False
+    assert not p.can_limit_by_height
+
+    p.testnet = True
+    assert a.testnet and b.testnet and p.testnet
+
+    with pytest.raises(ValueError):
+        MultiProvider([])
+
+
+def test_broadcast():
+    txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                      [TransactionInput(Hash(bytes(32)), 0, Script(), 0xffffffff)],
+                      [TransactionOutput(10000, Script())],
+                      0)
+    txid = str(txn.hash)
+
+    # Broadcasts aren't hedged
+    a = _Provider("a")
+    b = _Provider("b")
+    p = MultiProvider([a, b], hedge_percentile=0.5, min_hedge_samples=1)
+    assert p.broadcast_transaction(txn.to_hex()) == txid
+    a.delay = 0.2
+    assert p.broadcast_transaction(txn.to_hex()) == txid
+    assert p.get_utxos(["addr"]) == {"addr": "b"}
+    assert a.broadcasts == 2
+    assert b.broadcasts == 0
+
+    # A failed broadcast is sent to the next provider ...
+    a = _Provider("a", fail=True)
+    b = _Provider("b")
+    p = MultiProvider([a, b])
+    assert p.broadcast_transaction(txn.to_hex()) == txid
+    assert (a.broadcasts, b.broadcasts) == (1, 1)
+    assert txid in b.txids
+
+    # ... unless it already has the transaction
+    a = _Provider("a", fail=True)
+    b = _Provider("b")
+    a.relay_to = [b]
+    p = MultiProvider([a, b])
+    assert p.broadcast_transaction(txn.to_hex()) == txid
+    assert (a.broadcasts, b.broadcasts) == (1, 0)
+
+    a = _Provider("a", fail=True)
+    b = _Provider("b", fail=True)
+    p = MultiProvider([a, b])
+    with pytest.raises(DataProviderUnavailableError):
+        p.broadcast_transaction(txn.to_hex())
@@ -0,0 +1,156 @@
+import time
+
+import pytest
+
+from crypto_two1.bitcoin.crypto import HDPrivateKey
+from crypto_two1.bitcoin.crypto import HDPublicKey
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import TransactionInput
+from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.bitcoin.utils import address_to_key_hash
+from crypto_two1.blockchain.exceptions import DataProviderError
+from crypto_two1.blockchain.exceptions import DataProviderUnavailableError
+from crypto_two1.blockchain.synthetic_provider import SyntheticBlockchain
+from crypto_two1.blockchain.synthetic_provider import SyntheticProvider
+from crypto_two1.blockchain.synthetic_provider import hd_addresses
+
+master_seed = "tuna object element cancel hard nose faculty noble swear net subway offer"
+master = HDPrivateKey.master_key_from_mnemonic(master_seed, "test_wallet")
+addresses = hd_addresses(master, num_accounts=2, num_addresses=5)
+
+
+def test_hd_addresses():
+    assert len(addresses) == 20
+    acct_key = HDPublicKey.from_b58check(
+        "xpub6CNX3TRAXGpoV1a3ai3Hs9R85t63V3k6BGsTaxZZMJJ4DL6kRY8riYA1r6"
+        "hxyeuxgeb33FfBgrJrV6wxv6VXEVHAfPGJNw8ZzbEJHgsbmpz")
+    for chain in (0, 1):
+        chain_key = HDPublicKey.from_parent(acct_key, chain)
+        assert addresses[5 * chain:5 * chain + 5] == \
+            [HDPublicKey.from_parent(chain_key, i).address() for i in range(5)]
+
+
+def test_chain():
+    p = SyntheticProvider(addresses, txns_per_address=4, utxos_per_address=3,
+                          value=10000, block_height=1000, blocks_per_chain=100)
+    assert p.get_block_height() == 1000
+
+    txns = p.get_transactions(addresses)
+    assert sorted(txns.keys()) == sorted(addresses)
+    for addr, txn_list in txns.items():
+        # 4 received, 1 spent
+        assert len(txn_list) == 5
+        blocks = [t['metadata']['block'] for t in txn_list]
+        assert blocks == sorted(blocks, reverse=True)
+        assert all(901 <= b <= 1000 for b in blocks)
+        for t in txn_list:
+            assert t['metadata']['confirmations'] == 1001 - t['metadata']['block']
+
+    limited = p.get_transactions(addresses[:1], limit=2, min_block=950)
+    assert len(limited[addresses[0]]) <= 2
+    assert all(t['metadata']['block'] >= 950 for t in limited[addresses[0]])
+
+    utxos = p.get_utxos(addresses)
+    assert all(len(u) == 3 for u in utxos.values())
+    assert p.get_balance(addresses[:1]) == {addresses[0]: dict(confirmed=30000, total=30000)}
+
+    u = utxos[addresses[0]][0]
+    txid = str(u.transaction_hash)
+    assert u.script.get_addresses()[0] == addresses[0]
+    assert list(p.get_transactions_by_id([txid, "00" * 32]).keys()) == [txid]
+    assert p.get_spending_txids([(txid, u.outpoint_index)]) == {}
+
+    # The chain only depends on the addresses and seed
+    txids = lambda p: {a: [str(t['transaction'].hash) for t in ts]  # noqa: E731
+                       for a, ts in p.get_transactions(addresses).items()}
+    p2 = SyntheticProvider(addresses, txns_per_address=4, utxos_per_address=3,
+                           value=10000, block_height=1000, blocks_per_chain=100)
+    assert txids(p2) == txids(p)
+    assert txids(SyntheticProvider(addresses, txns_per_address=4, utxos_per_address=3, seed=1)) != txids(p)
+
+    assert p.call_counts == {"get_block_height": 1,
+                             "get_transactions": 4,
+                             "get_utxos": 1,
+                             "get_balance": 1,
+                             "get_transactions_by_id": 1,
+                             "get_spending_txids": 1}
+    p.reset_counts()
+    assert not p.call_counts
+
+    with pytest.raises(ValueError):
+        SyntheticProvider(addresses, txns_per_address=1, utxos_per_address=2)
+
+
+def test_latency_and_errors():
+    p = SyntheticProvider(addresses[:2], latency=0.05, jitter=0.05,
+                          error_rate={"get_utxos": 1, "get_balance": 0.5})
+
+    start = time.time()
+    p.get_transactions(addresses[:2])
+    elapsed = time.time() - start
+    assert 0.05 <= elapsed < 0.2
+
+    with pytest.raises(DataProviderUnavailableError):
+        p.get_utxos(addresses[:2])
+
+    for _ in range(20):
+        try:
+            p.get_balance(addresses[:2])
+        except DataProviderUnavailableError:
+            pass
+    assert p.call_counts["get_balance"] == 20
+    assert 0 < p.error_counts["get_balance"] < 20
+    assert p.error_counts["get_utxos"] == 1
+    assert p.error_counts["get_transactions"] == 0
+
+    p = SyntheticProvider(addresses[:2], error_rate=1, error_class=DataProviderError)
+    with pytest.raises(DataProviderError):
+        p.get_block_height()
+
+
+def test_broadcast():
+    p = SyntheticProvider(addresses[:2], utxos_per_address=1)
+    u = p.get_utxos(addresses[:1])[addresses[0]][0]
+
+    txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                      [TransactionInput(u.transaction_hash, u.outpoint_index, Script(), 0xffffffff)],
+                      [TransactionOutput(u.value - 1000, Script.build_p2pkh(address_to_key_hash(addresses[1])[1]))],
+                      0)
+    txid = p.broadcast_transaction(txn.to_hex())
+    assert txid == str(txn.hash)
+
+    assert addresses[0] not in p.get_utxos(addresses[:1])
+    assert p.get_balance(addresses[1:2])[addresses[1]] == dict(confirmed=100000, total=199000)
+    assert p.get_transactions(addresses[1:2])[addresses[1]][0]['metadata']['confirmations'] == 0
+
+    assert p.mine_block() == SyntheticProvider.DEFAULT_BLOCK_HEIGHT + 1
+    assert p.get_transactions_by_id([txid])[txid]['metadata']['confirmations'] == 1
+    assert p.get_balance(addresses[1:2])[addresses[1]]['confirmed'] == 199000
+
+
+def test_blockchain():
+    p = SyntheticProvider(addresses[:1], txns_per_address=2, utxos_per_address=1, latency=0.05)
+    bc = SyntheticBlockchain(p)
+    txns = p.get_transactions(addresses[:1])[addresses[0]]
+    txids = [str(t['transaction'].hash) for t in txns]
+    spent = [(str(i.outpoint), i.outpoint_index) for t in txns for i in t['transaction'].inputs
+             if str(i.outpoint) in txids]
+    assert len(spent) == 1
+
+    p.reset_counts()
+    start = time.time()
+    assert bc.check_confirmed_many(txids + ["00" * 32]) == dict({txid: True for txid in txids}, **{"00" * 32: False})
+    assert not bc.check_confirmed(txids[0], num_confirmations=10 ** 6)
+    outpoints = [(txid, 0) for txid in txids]
+    spends = bc.lookup_spend_txids(outpoints)
+    assert time.time() - start < 0.5
+    assert p.call_counts["get_transactions_by_id"] == 3
+
+    assert [o for o, spend_txid in spends.items() if spend_txid] == spent
+    assert bc.lookup_spend_txid(*spent[0]) in txids
+    with pytest.raises(IndexError):
+        bc.lookup_spend_txid(txids[0], 5)
+
+    assert bc.lookup_tx(txids[0]) == txns[0]['transaction'].to_hex()
+    assert bc.lookup_tx("00" * 32) is None
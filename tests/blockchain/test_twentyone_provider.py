@@ -0,0 +1,360 @@
+from calendar import timegm
+import json
+import urllib.parse
+
+import arrow
+import pytest
+
+from crypto_two1.bitcoin import crypto
+from crypto_two1.bitcoin import utils
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import CoinbaseInput
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import TransactionInput
+from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.bitcoin.utils import pack_var_str
+from crypto_two1.blockchain.exceptions import DataProviderError
+from crypto_two1.blockchain.exceptions import DataProviderUnavailableError
+from crypto_two1.blockchain.twentyone_provider import TwentyOneProvider
+
+DELAY = 0.2
+
+
+def _txn_json(i, address):
+    _, key_hash = utils.address_to_key_hash(address)
+    data = {"block_hash": None,
+            "block_height": None,
+            "chain_received_at": "2015-08-13T10:52:21.718Z",
+            "confirmations": 0,
+            "lock_time": 0,
+            "inputs": [{"output_hash": "%064x" % (i + 1),
+                        "output_index": 0,
+                        "script_signature_hex": "51",
+                        "sequence": 0xffffffff}],
+            "outputs": [{"value": 10000 + i,
+                         "script_hex": utils.bytes_to_str(bytes(Script.build_p2pkh(key_hash))),
+                         "addresses": [address]}]}
+    txn, _ = TwentyOneProvider.txn_from_json(data)
+    data["hash"] = str(txn.hash)
+    return data
+
+
+def _handle_get(request):
+    server = request.server
+    path = urllib.parse.urlparse(request.path).path.split("/")[3:]
+    with server.lock:
+        fail = server.failures.get(path[0], 0)
+        if fail:
+            server.failures[path[0]] = fail - 1
+        truncate = server.truncations > 0
+        if truncate:
+            server.truncations -= 1
+
+    if fail:
+        request.send_response(503)
+        request.end_headers()
+        return
+
+    if path[0] == "addresses":
+        body = [t
+                for a in path[1].split(",")
+                for t in server.txns_by_addr.get(a, [])]
+    elif path[0] == "transactions" and path[1] in server.txns_by_id:
+        body = server.txns_by_id[path[1]]
+    else:
+        request.send_json({"message": "Not found"}, status=404)
+        return
+
+    if not truncate:
+        request.send_json(body)
+        return
+
+    body = json.dumps(body).encode()
+    request.send_response(200)
+    request.send_header("Content-Type", "application/json")
+    request.send_header("Content-Length", str(len(body)))
+    request.end_headers()
+    request.wfile.write(body[:len(body) // 2])
+
+
+def _handle_post(request):
+    server = request.server
+    body = request.rfile.read(int(request.headers["Content-Length"]))
+    signed_hex = urllib.parse.parse_qs(body.decode())["signed_hex"][0]
+    txid = str(Transaction.from_hex(signed_hex).hash)
+    with server.lock:
+        server.broadcasts += 1
+        fail = server.failures.get("send", 0)
+        if fail:
+            server.failures["send"] = fail - 1
+        lose = server.lost_responses > 0
+        if lose:
+            server.lost_responses -= 1
+
+    if not fail:
+        server.txns_by_id[txid] = {"hash": txid}
+    if fail or lose:
+        request.send_response(503)
+        request.end_headers()
+        return
+
+    request.send_json({"transaction_hash": txid})
+
+
+def _handle(request):
+    if request.command == "POST":
+        _handle_post(request)
+    else:
+        _handle_get(request)
+
+
+@pytest.fixture
+def server(mock_http_server):
+    addresses = [crypto.PrivateKey(i + 1).public_key.address() for i in range(600)]
+    s = mock_http_server(_handle, DELAY)
+    s.txns_by_addr = {a: [_txn_json(i, a)] for i, a in enumerate(addresses)}
+    s.txns_by_id = {t["hash"]: t
+                    for txns in s.txns_by_addr.values()
+                    for t in txns}
+    s.failures = {}
+    # Number of responses to cut off halfway through
+    s.truncations = 0
+    # Number of broadcast transactions to accept without responding
+    s.lost_responses = 0
+    s.broadcasts = 0
+    return s
+
+
+def _provider(server, **kwargs):
+    kwargs.setdefault("retry_backoff", 0.01)
+    return TwentyOneProvider(server.url, **kwargs)
+
+
+def test_get_transactions(server):
+    addresses = list(server.txns_by_addr.keys())
+    provider = _provider(server)
+
+    data = provider.get_transactions(addresses)
+
+    # 4 chunks, several at a time
+    assert server.num_requests == 4
+    assert 1 < server.max_active <= provider.max_workers
+
+    assert set(data.keys()) == set(addresses)
+    for a in addresses:
+        assert len(data[a]) == 1
+        assert str(data[a][0]['transaction'].hash) == server.txns_by_addr[a][0]["hash"]
+
+
+def test_iter_wallet_transactions(server):
+    addresses = list(server.txns_by_addr.keys())
+    provider = _provider(server, max_workers=2)
+
+    expected = provider.get_transactions(addresses)
+    server.num_requests = 0
+    server.max_active = 0
+
+    found = {}
+    for wt, addrs in provider.iter_wallet_transactions(addresses):
+        assert wt.confirmations == 0
+        assert wt.network_time == timegm((2015, 8, 13, 10, 52, 21))
+        for a in addrs:
+            found.setdefault(a, []).append(wt)
+
+    assert server.num_requests == 4
+    assert 1 < server.max_active <= 2
+    assert set(found.keys()) == set(addresses)
+    for a in addresses:
+        assert [bytes(wt) for wt in found[a]] == \
+            [bytes(t['transaction']) for t in expected[a]]
+
+    # Stopping early doesn't request the remaining chunks
+    server.num_requests = 0
+    it = provider.iter_wallet_transactions(addresses)
+    next(it)
+    it.close()
+    assert server.num_requests <= 3
+
+    assert list(provider.iter_wallet_transactions([])) == []
+
+
+def test_truncated_response(server):
+    addresses = list(server.txns_by_addr.keys())[:10]
+
+    # Responses cut off while they are read are requested again
+    server.truncations = 1
+    data = _provider(server).get_transactions(addresses)
+    assert set(data.keys()) == set(addresses)
+    assert server.num_requests == 2
+
+    server.truncations = 100
+    with pytest.raises(DataProviderUnavailableError):
+        _provider(server, max_retries=1).get_transactions(addresses)
+
+    # ... also once transactions of the response have been yielded,
+    # without yielding them twice
+    server.truncations = 1
+    server.num_requests = 0
+    found = [(str(wt.hash), addrs) for wt, addrs in
+             _provider(server).iter_wallet_transactions(addresses)]
+    assert server.num_requests == 2
+    assert sorted(found) == sorted((t["hash"], {a})
+                                   for a in addresses
+                                   for t in server.txns_by_addr[a])
+
+    server.truncations = 100
+    with pytest.raises(DataProviderUnavailableError):
+        list(_provider(server, max_retries=1).iter_wallet_transactions(addresses))
+    server.truncations = 0
+
+
+def test_get_transactions_by_id(server):
+    txids = [t["hash"] for a in list(server.txns_by_addr.keys())[:20]
+             for t in server.txns_by_addr[a]]
+    provider = _provider(server, max_workers=5)
+
+    data = provider.get_transactions_by_id(txids)
+
+    assert server.num_requests == len(txids)
+    assert 1 < server.max_active <= 5
+    # Results come back in the requested order
+    assert list(data.keys()) == txids
+    for txid in txids:
+        assert str(data[txid]['transaction'].hash) == txid
+
+    sequential = _provider(server, max_workers=1).get_transactions_by_id(txids[:5])
+    assert list(sequential.keys()) == txids[:5]
+
+
+def test_retries(server):
+    txids = [t["hash"] for a in list(server.txns_by_addr.keys())[:3]
+             for t in server.txns_by_addr[a]]
+
+    # Temporary failures are retried
+    server.failures["transactions"] = 2
+    data = _provider(server).get_transactions_by_id(txids)
+    assert list(data.keys()) == txids
+    assert server.num_requests == 5
+
+    # ... but not forever
+    server.failures["transactions"] = 100
+    with pytest.raises(DataProviderError) as e:
+        _provider(server, max_retries=1).get_transactions_by_id(txids[:1])
+    assert e.value.status_code == 503
+
+    # Other errors aren't retried
+    server.failures = {}
+    server.num_requests = 0
+    with pytest.raises(DataProviderError) as e:
+        _provider(server).get_transactions_by_id(["00" * 32])
+    assert str(e.value) == "Not found"
+    assert server.num_requests == 1
+
+
+def test_broadcast_retries(server):
+    address = crypto.PrivateKey(1000).public_key.address()
+    txns = [TwentyOneProvider.txn_from_json(_txn_json(1000 + i, address))[0]
+            for i in range(4)]
+    provider = _provider(server)
+
+    assert provider.broadcast_transaction(txns[0]) == str(txns[0].hash)
+    assert server.broadcasts == 1
+
+    # A transaction the server didn't get is sent again
+    server.failures["send"] = 1
+    assert provider.broadcast_transaction(txns[1]) == str(txns[1].hash)
+    assert server.broadcasts == 3
+
+    # ... but not one it got when the response was lost
+    server.lost_responses = 1
+    assert provider.broadcast_transaction(txns[2]) == str(txns[2].hash)
+    assert server.broadcasts == 4
+
+    server.failures["send"] = 100
+    with pytest.raises(DataProviderError) as e:
+        _provider(server, max_retries=1).broadcast_transaction(txns[3])
+    assert e.value.status_code == 503
+    assert server.broadcasts == 6
+    server.failures = {}
+
+
+def test_timeout(server):
+    provider = _provider(server, timeout=DELAY / 4, max_retries=2)
+    txid = next(iter(server.txns_by_id))
+    with pytest.raises(DataProviderUnavailableError):
+        provider.get_transactions_by_id([txid])
+    assert server.num_requests == 3
+
+
+def _reference_txn_from_json(data):
+    # The byte round trip and arrow parsing txn_from_json used to do
+    inputs = []
+    for i in data["inputs"]:
+        if 'coinbase' in i:
+            inputs.append(CoinbaseInput(data["block_height"] or 0, bytes.fromhex(i['coinbase']),
+                                        i['sequence'], block_version=1))
+        else:
+            script, _ = Script.from_bytes(pack_var_str(bytes.fromhex(i["script_signature_hex"])))
+            inputs.append(TransactionInput(Hash(i["output_hash"]), i["output_index"], script, i["sequence"]))
+    outputs = [TransactionOutput(o["value"], Script.from_bytes(pack_var_str(bytes.fromhex(o["script_hex"])))[0])
+               for o in data["outputs"]]
+    txn = Transaction(Transaction.DEFAULT_TRANSACTION_VERSION, inputs, outputs, data["lock_time"])
+    network_time = timegm(arrow.get(data['chain_received_at']).datetime.timetuple())
+    return txn, network_time
+
+
+@pytest.mark.parametrize("received_at", ["2015-08-13T10:52:21.718Z",
+                                         "2014-05-30T23:54:55Z",
+                                         "2016-02-29T00:00:00.123456+02:00"])
+def test_txn_from_json(received_at):
+    key = crypto.PrivateKey(1)
+    sig_script = Script([bytes(71), bytes(key.public_key)])
+    data = {"block_hash": "%064x" % 7,
+            "block_height": 303404,
+            "chain_received_at": received_at,
+            "confirmations": 69389,
+            "lock_time": 12,
+            "inputs": [{"coinbase": "03ec7e04",
+                        "sequence": 4294967295},
+                       {"output_hash": "%064x" % 1,
+                        "output_index": 3,
+                        "script_signature_hex": utils.bytes_to_str(bytes(sig_script)),
+                        "sequence": 5,
+                        "addresses": [key.public_key.address()]}],
+            "outputs": [{"value": 290000,
+                         "script_hex": utils.bytes_to_str(bytes(Script.build_p2pkh(key.public_key.hash160()))),
+                         "addresses": ["1K4nPxBMy6sv7jssTvDLJWk1ADHBZEoUVb"]},
+                        {"value": 0,
+                         "script_hex": "6a0568656c6c6f"}]}
+
+    ref_txn, ref_time = _reference_txn_from_json(data)
+    txn, addr_keys = TwentyOneProvider.txn_from_json(data)
+    wt, wt_addr_keys = TwentyOneProvider.wallet_txn_from_json(data)
+    assert addr_keys == wt_addr_keys == {key.public_key.address(), "1K4nPxBMy6sv7jssTvDLJWk1ADHBZEoUVb"}
+
+    for t in (txn, wt):
+        assert bytes(t) == bytes(ref_txn)
+        assert t.hash == ref_txn.hash
+        assert t.lock_time == ref_txn.lock_time
+        for i, ref_i in zip(t.inputs, ref_txn.inputs):
+            assert type(i) == type(ref_i)
+            assert vars(i).keys() == vars(ref_i).keys()
+            assert bytes(i.script) == bytes(ref_i.script)
+            assert str(i.script) == str(ref_i.script)
+        for o, ref_o in zip(t.outputs, ref_txn.outputs):
+            assert o.value == ref_o.value
+            assert str(o.script) == str(ref_o.script)
+
+    assert TwentyOneProvider._metadata_from_json(data) == dict(block=303404,
+                                                               block_hash=Hash("%064x" % 7),
+                                                               network_time=ref_time,
+                                                               confirmations=69389)
+    assert (wt.block, wt.block_hash, wt.confirmations, wt.network_time) == \
+        (303404, Hash("%064x" % 7), 69389, ref_time)
+
+    # Unconfirmed, numeric timestamp
+    data.update(block_hash=None, block_height=None, confirmations=0, chain_received_at=1439463141)
+    wt, _ = TwentyOneProvider.wallet_txn_from_json(data)
+    assert (wt.block, wt.block_hash, wt.confirmations, wt.network_time) == (None, None, 0, 1439463141)
+    assert wt.inputs[0].height == 0
@@ -31,3 +31,116 @@ def test_blockchain(bc):
     # Check broadcast_tx()
     # Broadcast existing transaction
     assert bc.broadcast_tx("0100000001d1e245f26f2354672d653122893d8e7a84f77515bbc6c29c457711f3b67fe90e010000006a47304402204fee33aed5c30e2546b0c3e211a99aeadae75c5cb8d2257eceabef6b190a6ed002205023d17c28c81db58c44213cf6687a4790528c4d123f8c13d6395f0c5ab9c1b20121039176bfb795e10d793dbfd68a11e5577296ad591154e15d9a39b26f5dca84ed69ffffffff02b0ad01000000000017a914d7b04112a5e0314ae378c8038205edf1fa98a76087952d8400000000001976a91473170178389cf8ce3570a7a4624a96ac924b999588ac00000000") == "25e0f083c7508d8f52a12f80669a54007dc989a752974c6660f09dac7017d810"  # nopep8
+
+
+DELAY = 0.1
+
+
+def _handle(request):
+    server = request.server
+    txid = request.path.split("/")[-1]
+    with server.lock:
+        server.requests.append(txid)
+
+    if server.fail:
+        request.send_response(500)
+        request.end_headers()
+    elif txid not in server.txns:
+        request.send_response(404)
+        request.end_headers()
+    else:
+        request.send_json(server.txns[txid])
+
+
+@pytest.fixture
+def server(mock_http_server):
+    # Every other transaction is confirmed and has its first output spent
+    s = mock_http_server(_handle, DELAY)
+    s.txns = {}
+    for i in range(20):
+        s.txns["%064x" % i] = {"hash": "%064x" % i,
+                               "confirmations": i % 2,
+                               "outputs": [{"spending_transaction": "%064x" % (100 + i) if i % 2 else None},
+                                           {"spending_transaction": None}]}
+    s.requests = []
+    s.fail = False
+    return s
+
+
+def _blockchain(server, **kwargs):
+    return blockchain.TwentyOneBlockchain(server.url, **kwargs)
+
+
+def test_check_confirmed_many(server):
+    bc = _blockchain(server, max_workers=10)
+    txids = sorted(server.txns) + ["%064x" % 99]
+
+    confirmed = bc.check_confirmed_many(txids)
+    # One request per transaction, several at a time
+    assert sorted(server.requests) == txids
+    assert 1 < server.max_active <= 10
+    assert list(confirmed.keys()) == txids
+    for txid in txids:
+        assert confirmed[txid] == (txid in server.txns and int(txid, 16) % 2 == 1)
+
+    # Confirmed transactions aren't looked up again
+    server.requests = []
+    assert bc.check_confirmed_many(txids) == confirmed
+    assert sorted(server.requests) == sorted(txid for txid in txids if not confirmed[txid])
+    server.requests = []
+    assert bc.check_confirmed("%064x" % 1)
+    assert server.requests == []
+
+    # ... unless they need more confirmations
+    assert not bc.check_confirmed("%064x" % 1, num_confirmations=2)
+    assert server.requests == ["%064x" % 1]
+
+
+def test_lookup_spend_txids(server):
+    bc = _blockchain(server)
+    outpoints = [(txid, i) for txid in sorted(server.txns) for i in range(2)] + [("%064x" % 99, 0)]
+
+    spends = bc.lookup_spend_txids(outpoints)
+    assert list(spends.keys()) == outpoints
+    for (txid, i), spend_txid in spends.items():
+        if i == 0 and txid in server.txns and int(txid, 16) % 2:
+            assert spend_txid == "%064x" % (100 + int(txid, 16))
+        else:
+            assert spend_txid is None
+    # One request per transaction
+    assert len(server.requests) == len(server.txns) + 1
+
+    # Spends by unconfirmed transactions are looked up again ...
+    spent = [o for o, spend_txid in spends.items() if spend_txid]
+    server.requests = []
+    assert bc.lookup_spend_txids(spent) == {o: spends[o] for o in spent}
+    assert sorted(server.requests) == sorted(txid for txid, _ in spent)
+
+    # ... until the spend is confirmed, which makes it final
+    for j, o in enumerate(spent):
+        server.txns[spends[o]] = {"hash": spends[o], "confirmations": j % 2, "outputs": []}
+    bc.check_confirmed_many([spends[o] for o in spent])
+    bc.lookup_spend_txids(spent)
+    server.requests = []
+    assert bc.lookup_spend_txids(spent) == {o: spends[o] for o in spent}
+    assert sorted(server.requests) == sorted(txid for j, (txid, _) in enumerate(spent) if j % 2 == 0)
+    server.requests = []
+    assert bc.lookup_spend_txid(*spent[1]) == spends[spent[1]]
+    assert server.requests == []
+
+    # An unconfirmed spend may be dropped
+    server.txns[spent[0][0]]["outputs"][0]["spending_transaction"] = None
+    assert bc.lookup_spend_txid(*spent[0]) is None
+
+    with pytest.raises(IndexError):
+        bc.lookup_spend_txids([("%064x" % 0, 2)])
+
+
+def test_server_errors(server):
+    server.fail = True
+    with pytest.raises(blockchain.BlockchainServerError):
+        _blockchain(server).check_confirmed_many(sorted(server.txns))
+
+    server.fail = False
+    with pytest.raises(blockchain.BlockchainServerError):
+        _blockchain(server, timeout=DELAY / 4).lookup_spend_txids([("%064x" % 0, 0)])
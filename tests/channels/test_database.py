@@ -107,3 +107,39 @@ def test_database_sqlite3_create(db):
             if models[i].spend_tx is not None else model.spend_tx is None
         assert model.spend_txid == models[i].spend_txid
         assert model.min_output_amount == models[i].min_output_amount
+
+
+def test_database_sqlite3_version(tmpdir):
+    db_path = str(tmpdir.join("channels.sqlite3"))
+    open(db_path, "w").close()
+    db = database.Sqlite3Database(db_path)
+    # Another process sharing the database
+    other_db = database.Sqlite3Database(db_path)
+
+    model = statemachine.PaymentChannelModel(url='test0', state=statemachine.PaymentChannelState.OPENING)
+    assert db.read_version('test0') is None
+    with db:
+        db.create(model)
+    assert db.read_version('test0') == other_db.read_version('test0') == 0
+
+    # Updates through either connection bump the version
+    model.creation_time = 42
+    with db:
+        db.update(model)
+    assert db.read_version('test0') == other_db.read_version('test0') == 1
+    with other_db:
+        other_db.update(model)
+    assert db.read_version('test0') == other_db.read_version('test0') == 2
+
+    # Rolled back updates don't
+    with pytest.raises(ValueError):
+        with db:
+            db.update(model)
+            assert db.read_version('test0') == 3
+            raise ValueError()
+    assert db.read_version('test0') == other_db.read_version('test0') == 2
+
+    # Channels created before versions were kept get one
+    with other_db._conn:
+        other_db._conn.execute("DELETE FROM channel_versions")
+    assert database.Sqlite3Database(db_path).read_version('test0') == 0
@@ -348,3 +348,59 @@ def test_paymentchannel_serverside_close():
     expected_state['state'] = statemachine.PaymentChannelState.CLOSED
     expected_state['spend_tx'] = lambda pc: pc.spend_tx
     assert_paymentchannel_state(expected_state, pc)
+
+
+def test_paymentchannel_cache(tmpdir):
+    # Create mocked dependencies
+    bc = mock.MockBlockchain()
+    wallet = walletwrapper.Two1WalletWrapper(mock.MockTwo1Wallet(), bc)
+    db_path = str(tmpdir.join("channels.sqlite3"))
+    open(db_path, "w").close()
+    db = database.Sqlite3Database(db_path)
+
+    mock.MockPaymentChannelServer.blockchain = bc
+    mock.MockPaymentChannelServer.channels = {}
+
+    pc = paymentchannel.PaymentChannel.open(db, wallet, bc, 'mock://test', 100000, DEFAULT_EXPIRATION, 125000, False)
+    bc.mock_confirm(pc.deposit_txid)
+    pc.sync()
+
+    # Count model reads
+    reads = []
+    read = db.read
+    db.read = lambda url: reads.append(url) or read(url)
+
+    # Properties are read from the model written by sync()
+    assert pc.ready
+    assert pc.balance == 100000
+    assert pc.deposit == 100000
+    assert pc.fee == 125000
+    assert reads == []
+
+    # ... and pay()
+    pc.pay(1500)
+    reads.clear()
+    assert pc.balance == 97000
+    assert pc.payment_tx
+    assert reads == []
+
+    # Another instance of the channel is read once, then cached
+    other_pc = paymentchannel.PaymentChannel(pc.url, db, wallet, bc)
+    assert other_pc.balance == 97000
+    assert other_pc.ready
+    assert reads == [pc.url]
+
+    # Updates through another instance invalidate the cache
+    other_pc.pay(1000)
+    assert pc.balance == 96000
+    assert reads == [pc.url, pc.url, pc.url]
+
+    # ... and so do updates from another process
+    other_db = database.Sqlite3Database(db_path)
+    with other_db:
+        model = other_db.read(pc.url)
+        model.state = statemachine.PaymentChannelState.CLOSED
+        other_db.update(model)
+    assert not pc.ready
+    assert pc.state == statemachine.PaymentChannelState.CLOSED
+    assert reads == [pc.url] * 4
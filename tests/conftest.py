@@ -1,5 +1,6 @@
 # standard python imports
 import os
+import threading
 import unittest.mock as mock
 
 # 3rd party imports
@@ -244,6 +245,31 @@ def mock_rest_client(monkeypatch, mock_config, mock_wallet):
     return _mock_rest_client
 
 
+@pytest.yield_fixture()
+def mock_http_server():
+    """ Fixture that injects a factory of running MockHttpServers
+
+        Call it with a handler(request) function, and optionally a delay
+        in seconds, to start a MockHttpServer in a background thread.
+        The servers are shut down after the test.
+
+    Returns:
+        callable: starts a MockHttpServer and returns it
+    """
+    servers = []
+
+    def start(handler, delay=0):
+        s = mock_objects.MockHttpServer(handler, delay)
+        threading.Thread(target=s.serve_forever, daemon=True).start()
+        servers.append(s)
+        return s
+
+    yield start
+    for s in servers:
+        s.shutdown()
+        s.server_close()
+
+
 @pytest.fixture()
 def patch_click(monkeypatch):
     """ Fixture that monkeypatches click printing functions
@@ -2,6 +2,9 @@
 import json
 import codecs
 import collections
+import http.server
+import threading
+import time
 import unittest.mock
 
 import crypto_two1.bitcoin as bitcoin
@@ -124,6 +127,68 @@ class MockHttpResponse:
         return json.loads(self.data)
 
 
+class _MockHttpRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.serve(self)
+
+    def do_POST(self):
+        self.server.serve(self)
+
+    def send_json(self, body, status=200):
+        """Send a JSON response."""
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockHttpServer(http.server.ThreadingHTTPServer):
+
+    """Local HTTP server for testing blockchain clients.
+
+    Each GET or POST request is answered by calling handler(request)
+    after waiting delay seconds. The server counts the requests it
+    got in num_requests, and the most it handled at once in
+    max_active.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, handler, delay=0):
+        """Return a new MockHttpServer listening on a free local port."""
+        super().__init__(("127.0.0.1", 0), _MockHttpRequestHandler)
+        self.handler = handler
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.active = 0
+        self.max_active = 0
+
+    @property
+    def url(self):
+        """Base URL of the server."""
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def serve(self, request):
+        """Count and answer a request."""
+        with self.lock:
+            self.num_requests += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            self.handler(request)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
 class MockTwentyOneRestClient:
 
     """Mock TwentyOneRestClient behavior."""
@@ -2,8 +2,11 @@ import inspect
 import os.path
 import time
 
+import pytest
+
 from crypto_two1.blockchain.twentyone_provider import TwentyOneProvider
 from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.txn import Transaction
 from crypto_two1.wallet.cache_manager import CacheManager
 from crypto_two1.wallet.wallet_txn import WalletTransaction
 
@@ -227,6 +230,7 @@ def test_txns():
     time.sleep(1.5)
     cm.prune_provisional_txns()
     assert txid not in cm._txn_cache
+    assert cm.check_consistency()
 
     # Now do default expiration
     cm.insert_txn(txn, mark_provisional=True)
@@ -372,6 +376,8 @@ def test_txns():
         assert out['spend_txid'] is None
         assert out['spend_index'] is None
 
+    assert cm.check_consistency()
+
 
 def test_whole(cache, exp_conf_balance, exp_unconf_balance):
     cm = CacheManager()
@@ -389,3 +395,271 @@ def test_whole(cache, exp_conf_balance, exp_unconf_balance):
 
     assert conf_balance == exp_conf_balance
     assert unconf_balance == exp_unconf_balance
+
+    assert cm.check_consistency()
+    assert cm.get_account_balances(0x80000000) == \
+        dict(confirmed=exp_conf_balance, total=exp_unconf_balance)
+
+    # Removing transactions keeps the materialized UTXOs and balances
+    # consistent.
+    leaves = [txid for txid in sorted(cm._txn_cache.keys())
+              if all(o['spend_txid'] is None
+                     for o in cm._outputs_cache[txid].values())]
+    for txid in leaves[::7]:
+        cm._delete_txn(txid)
+    assert cm.check_consistency()
+
+
+def test_db_round_trip(cache, exp_conf_balance, exp_unconf_balance, tmpdir):
+    db_path = str(tmpdir.join("cache.db"))
+
+    # Migrate a JSON cache into the database
+    cm = CacheManager()
+    cm.load_from_dict(cache, prune_provisional=False)
+    cm.to_db(db_path)
+
+    cm2 = CacheManager()
+    cm2.load_from_db(db_path, prune_provisional=False)
+    assert not cm2._dirty
+
+    assert cm2._address_cache == cm._address_cache
+    assert cm2.last_block == cm.last_block
+    assert set(cm2._txn_cache.keys()) == set(cm._txn_cache.keys())
+    for txid, txn in cm._txn_cache.items():
+        assert cm2._txn_cache[txid] == txn
+
+    addrs = cm2.get_addresses_for_chain(0x80000000, 0) + \
+        cm2.get_addresses_for_chain(0x80000000, 1)
+
+    assert sum(cm2.get_balances(addrs).values()) == exp_conf_balance
+    assert sum(cm2.get_balances(addrs, True).values()) == exp_unconf_balance
+
+    # Only changes should be written out
+    txid = sorted(cm2._txn_cache.keys())[0]
+    cm2._delete_txn(txid)
+    cm2.insert_address(0x80000000, 0, 10000, "1EbnoKrmUEe3hsK9gTVfgYAming6BuqM3L")
+    assert cm2._deleted_txids == {txid}
+    assert not cm2._dirty_txids
+    cm2.to_db(db_path)
+    assert not cm2._deleted_txids
+    assert not cm2._dirty_addresses
+
+    cm3 = CacheManager()
+    cm3.load_from_db(db_path, prune_provisional=False)
+    assert txid not in cm3._txn_cache
+    assert len(cm3._txn_cache) == len(cm._txn_cache) - 1
+    assert cm3.get_address(0x80000000, 0, 10000) == "1EbnoKrmUEe3hsK9gTVfgYAming6BuqM3L"
+
+    # load_from_file should detect the database
+    cm4 = CacheManager()
+    cm4.load_from_file(db_path)
+    assert cm4._address_cache == cm3._address_cache
+
+
+def test_db_lazy_load(cache, exp_conf_balance, exp_unconf_balance, tmpdir):
+    db_path = str(tmpdir.join("cache.db"))
+
+    cm = CacheManager()
+    cm.load_from_dict(cache, prune_provisional=False)
+    cm.to_db(db_path)
+
+    addrs = cm.get_addresses_for_chain(0x80000000, 0) + \
+        cm.get_addresses_for_chain(0x80000000, 1)
+
+    lazy = CacheManager()
+    lazy.load_from_db(db_path, prune_provisional=False, lazy=True)
+    assert lazy._lazy
+    assert not lazy._txn_cache
+
+    # Balances and UTXOs come from the snapshot
+    assert sum(lazy.get_balances(addrs).values()) == exp_conf_balance
+    assert sum(lazy.get_balances(addrs, True).values()) == exp_unconf_balance
+    for include_unconfirmed in [False, True]:
+        exp = cm.get_utxos(addrs, include_unconfirmed)
+        utxos = lazy.get_utxos(addrs, include_unconfirmed)
+        assert set(utxos.keys()) == set(exp.keys())
+        for addr in exp:
+            assert [(str(u.transaction_hash), u.outpoint_index, u.value,
+                     bytes(u.script), u.num_confirmations) for u in utxos[addr]] == \
+                [(str(u.transaction_hash), u.outpoint_index, u.value,
+                  bytes(u.script), u.num_confirmations) for u in exp[addr]]
+
+    for addr in addrs:
+        assert lazy.address_has_txns(addr) == cm.address_has_txns(addr)
+        assert set(lazy.get_txns_for_address(addr)) == \
+            set(cm.get_txns_for_address(addr))
+
+    txid = sorted(cm._txn_cache.keys())[0]
+    assert lazy.get_transaction(txid) == cm.get_transaction(txid)
+    assert lazy._lazy
+
+    # Re-inserting a txn with more confirmations doesn't load everything
+    txn = cm.get_transaction(txid)
+    if txn.confirmations > 0 and not txn.provisional:
+        txn.confirmations += 1
+        lazy.insert_txn(txn)
+        assert lazy._lazy
+        assert lazy.get_transaction(txid).confirmations == txn.confirmations
+        lazy.to_db(db_path)
+
+        lazy2 = CacheManager()
+        lazy2.load_from_db(db_path, prune_provisional=False, lazy=True)
+        assert lazy2.get_transaction(txid).confirmations == txn.confirmations
+
+    # Anything else loads the transactions
+    lazy._delete_txn(txid)
+    assert not lazy._lazy
+    assert len(lazy._txn_cache) == len(cm._txn_cache) - 1
+
+
+def test_insert_txns(cache, exp_conf_balance, exp_unconf_balance):
+    ref = CacheManager()
+    ref.load_from_dict(cache, prune_provisional=False)
+    txns = [t for t in ref._txn_cache.values() if not t.provisional]
+
+    cm = CacheManager()
+    cm._address_cache = ref._address_cache
+    cm._reindex_accounts()
+    assert cm.insert_txns(txns) == len(txns)
+    assert cm._dirty
+    assert cm.check_consistency()
+
+    for txid in cm._txn_cache:
+        assert cm._txn_cache[txid] == ref._txn_cache[txid]
+
+    # Nothing changed, so nothing should be inserted
+    cm._dirty = False
+    assert cm.insert_txns(txns) == 0
+    assert not cm._dirty
+
+    # Only the transaction with new metadata is updated
+    t = WalletTransaction._deserialize(txns[0]._serialize())
+    t.confirmations += 1
+    assert cm.insert_txns([t] + txns[1:]) == 1
+    assert cm._dirty
+    assert cm.get_transaction(t.hash).confirmations == t.confirmations
+    assert cm.check_consistency()
+
+
+def test_history_index(cache, exp_conf_balance, exp_unconf_balance):
+    cm = CacheManager()
+    cm.load_from_dict(cache, prune_provisional=False)
+
+    txids = list(cm.iter_history())
+    assert sorted(txids) == sorted(cm._txn_cache.keys())
+    times = [cm._txn_cache[txid].network_time for txid in txids]
+    assert times == sorted(times)
+    assert list(cm.iter_history(reverse=True)) == txids[::-1]
+
+    # Cursors
+    mid = len(txids) // 2
+    assert list(cm.iter_history(after=txids[mid])) == txids[mid + 1:]
+    assert list(cm.iter_history(reverse=True, after=txids[mid])) == \
+        txids[:mid][::-1]
+    with pytest.raises(ValueError):
+        list(cm.iter_history(after="00" * 32))
+
+    # The index is maintained on deletion
+    cm._delete_txn(txids[-1])
+    assert list(cm.iter_history()) == txids[:-1]
+
+    # Expired provisional txns are pruned from the heap
+    leaves = [txid for txid in txids[:-1]
+              if all(o['spend_txid'] is None
+                     for o in cm._outputs_cache[txid].values())][:5]
+    for txid in leaves:
+        t = cm._txn_cache[txid]
+        cm._delete_txn(txid)
+        t.provisional = False
+        cm.insert_txn(t, mark_provisional=True, expiration=1)
+        assert cm._txn_cache[txid].provisional == 1
+    cm.prune_provisional_txns()
+    for txid in leaves:
+        assert txid not in cm._txn_cache
+    assert cm.check_consistency()
+
+
+def test_compact(cache, exp_conf_balance, exp_unconf_balance, tmpdir):
+    ref = CacheManager()
+    ref.load_from_dict(cache, prune_provisional=False)
+
+    cm = CacheManager(compact=True)
+    cm.load_from_dict(cache, prune_provisional=False)
+    assert cm._compact_txns
+    assert len(cm._txn_cache) + len(cm._compact_txns) == len(ref._txn_cache)
+
+    addrs = cm.get_addresses_for_chain(0x80000000, 0) + \
+        cm.get_addresses_for_chain(0x80000000, 1)
+    assert sum(cm.get_balances(addrs).values()) == exp_conf_balance
+    assert sum(cm.get_balances(addrs, True).values()) == exp_unconf_balance
+    assert cm.check_consistency()
+    assert list(cm.iter_history()) == list(ref.iter_history())
+
+    # Compacted txns are rehydrated on demand
+    def _spender_is_leaf(txid):
+        spend_txid = ref._outputs_cache[txid][0]['spend_txid']
+        return all(o['spend_txid'] is None
+                   for o in ref._outputs_cache[spend_txid].values())
+
+    compacted = sorted(k.hex() for k in cm._compact_txns.keys())
+    txid = ([t for t in compacted if _spender_is_leaf(t)] + compacted)[0]
+    assert cm.have_transaction(txid)
+    assert cm.get_transaction(txid) == ref.get_transaction(txid)
+    assert txid not in cm._txn_cache
+    assert cm.get_output(txid, 0).value == ref.get_output(txid, 0).value
+
+    # Writing the cache out includes compacted txns
+    db_path = str(tmpdir.join("cache.db"))
+    cm.to_db(db_path)
+    cm2 = CacheManager()
+    cm2.load_from_db(db_path, prune_provisional=False)
+    assert set(cm2._txn_cache.keys()) == set(ref._txn_cache.keys())
+
+    # Removing a spender rehydrates the txn it spends from. Whatever
+    # spends from the spender is removed first, leaves first, so that it
+    # can be removed.
+    def _delete_with_descendants(t):
+        for s in set(o['spend_txid'] for o in ref._outputs_cache[t].values()) - {None}:
+            if s in ref._txn_cache:
+                _delete_with_descendants(s)
+        cm._delete_txn(t)
+        ref._delete_txn(t)
+
+    spend_txid = ref._outputs_cache[txid][0]['spend_txid']
+    for s in set(o['spend_txid'] for o in ref._outputs_cache[spend_txid].values()) - {None}:
+        _delete_with_descendants(s)
+    assert _spender_is_leaf(txid)
+    assert txid not in cm._txn_cache
+
+    cm._delete_txn(spend_txid)
+    ref._delete_txn(spend_txid)
+    assert txid in cm._txn_cache
+    for i, o in ref._outputs_cache[txid].items():
+        x = cm._outputs_cache[txid][i]
+        assert bytes(x['output']) == bytes(o['output'])
+        assert (x['status'], x['spend_txid']) == (o['status'], o['spend_txid'])
+    assert cm.check_consistency()
+
+
+def test_address_record(cache, exp_conf_balance, exp_unconf_balance, tmpdir):
+    cm = CacheManager()
+    cm.load_from_dict(cache, prune_provisional=False)
+
+    for txid, txn in cm._txn_cache.items():
+        rec = txn.address_record()
+        assert rec is txn.address_record()
+        assert rec['values'] == [o.value for o in txn.outputs]
+        assert txn.get_addresses() == Transaction.get_addresses(txn)
+        for addrs in rec['outputs']:
+            for a in addrs:
+                assert txn.output_index_for_address(a) == \
+                    Transaction.output_index_for_address(txn, a)
+
+    # Records are persisted with the transactions
+    db_path = str(tmpdir.join("cache.db"))
+    cm.to_db(db_path)
+    cm2 = CacheManager()
+    cm2.load_from_db(db_path, prune_provisional=False)
+    for txid, txn in cm2._txn_cache.items():
+        assert False in txn._address_records
+        assert txn.address_record() == cm._txn_cache[txid].address_record()
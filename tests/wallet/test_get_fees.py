@@ -1,3 +1,5 @@
+import threading
+import time
 from unittest import TestCase
 from unittest import mock
 
@@ -24,3 +26,102 @@ def test_get_fees_unreasonable_fee():
         }
         with TestCase().assertRaises(exceptions.UnreasonableFeeError):
             fees.get_fees()
+
+
+class _CountingSource(fees.FeeSource):
+    def __init__(self, values):
+        self.values = list(values)
+        self.calls = 0
+
+    def get_fee_per_kb(self):
+        self.calls += 1
+        v = self.values.pop(0)
+        if isinstance(v, Exception):
+            raise v
+        return v
+
+
+def test_fee_estimator_ttl():
+    src = _CountingSource([100000, 200000])
+    est = fees.FeeEstimator(source=src, ttl=60, background=False)
+
+    f = est.get_fees()
+    assert f['per_kb'] == 100000
+    assert f['per_input'] == int(fees.DEFAULT_INPUT_SIZE_KB * 100000)
+    assert est.get_fee_per_kb() == 100000
+    assert src.calls == 1
+
+    # Expire the quote
+    est._updated -= 61
+    assert est.get_fee_per_kb() == 200000
+    assert src.calls == 2
+
+
+def test_fee_estimator_fallback():
+    src = _CountingSource([ValueError("down"), 100000, ValueError("down"),
+                           fees.DEFAULT_FEE_PER_KB * 10])
+    est = fees.FeeEstimator(source=src, ttl=60, background=False,
+                            fallback_fee_per_kb=12345, retry_interval=30)
+
+    assert est.get_fee_per_kb() == 12345
+    # Failures are not retried until the retry interval has passed
+    assert est.get_fee_per_kb() == 12345
+    assert src.calls == 1
+
+    est._next_attempt = 0
+    assert est.get_fee_per_kb() == 100000
+
+    # Failed and unreasonable quotes keep the last good one
+    est._updated -= 61
+    assert est.get_fee_per_kb() == 100000
+    est._updated -= 61
+    est._next_attempt = 0
+    assert est.get_fee_per_kb() == 100000
+    assert src.calls == 4
+
+
+def test_fee_estimator_background():
+    started = threading.Event()
+    release = threading.Event()
+
+    class SlowSource(fees.FeeSource):
+        def get_fee_per_kb(self):
+            started.set()
+            release.wait(5)
+            return 200000
+
+    est = fees.FeeEstimator(source=SlowSource(), ttl=60, timeout=0.05)
+
+    # Lookups don't wait longer than the timeout for the first quote
+    t = time.time()
+    assert est.get_fee_per_kb() == fees.DEFAULT_FEE_PER_KB
+    assert time.time() - t < 1
+    assert started.wait(5)
+
+    release.set()
+    for _ in range(500):
+        if est._refreshing is None:
+            break
+        time.sleep(0.01)
+    assert est.get_fee_per_kb() == 200000
+
+    # A stale quote is returned immediately while refreshing
+    started.clear()
+    release.clear()
+    est._updated -= 61
+    assert est.get_fee_per_kb() == 200000
+    assert started.wait(5)
+    assert est.get_fee_per_kb() == 200000
+    release.set()
+
+
+def test_fee_estimator_default():
+    est = fees.FeeEstimator(source=fees.StaticFeeSource(50000))
+    fees.set_fee_estimator(est)
+    try:
+        assert fees.get_fee_estimator() is est
+        assert fees.get_fee_estimator().get_fees()['per_kb'] == 50000
+    finally:
+        fees.set_fee_estimator(None)
+    assert isinstance(fees.get_fee_estimator(), fees.FeeEstimator)
+    assert fees.get_fee_estimator() is not est
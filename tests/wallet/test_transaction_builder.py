@@ -0,0 +1,125 @@
+import pytest
+
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import UnspentTransactionOutput
+from crypto_two1.wallet import exceptions
+from crypto_two1.wallet import fees
+from crypto_two1.wallet.transaction_builder import pack_wallets
+from crypto_two1.wallet.transaction_builder import TransactionBuilder
+from crypto_two1.wallet.utxo_selectors import UtxoIndex
+from crypto_two1.wallet.utxo_selectors import utxo_selector_smallest_first
+
+
+class _Wallet(object):
+    def __init__(self, values, seed):
+        self.calls = 0
+        self.full_calls = 0
+        self.index = UtxoIndex()
+        for i, v in enumerate(values):
+            self.index.add("1addr%d" % seed,
+                           UnspentTransactionOutput(transaction_hash=Hash(bytes([seed, i]) + bytes(30)),
+                                                    outpoint_index=i,
+                                                    value=v,
+                                                    scr=Script.build_p2pkh(bytes(20)),
+                                                    confirmations=10))
+
+    def get_utxo_index(self, include_unconfirmed=False):
+        return self.index
+
+    def utxo_selector(self, utxos_by_addr, amount, num_outputs, fees=None):
+        self.calls += 1
+        if utxos_by_addr is self.index:
+            self.full_calls += 1
+        return utxo_selector_smallest_first(utxos_by_addr, amount, num_outputs, fees)
+
+
+@pytest.fixture(autouse=True)
+def static_fees():
+    fees.set_fee_estimator(fees.FeeEstimator(source=fees.StaticFeeSource(10000)))
+    yield
+    fees.set_fee_estimator(None)
+
+
+def test_incremental_builder():
+    wallet = _Wallet([10 ** 7] * 20, 1)
+    builder = TransactionBuilder(wallet)
+
+    for i in range(100):
+        builder.add("1payee%d" % i, 100000)
+    assert len(builder) == 100
+    assert builder.subtotal == 100 * 100000
+    assert sum(u.value for utxos in builder.selected_utxos.values() for u in utxos) >= \
+        builder.total
+    # The full UTXO set is only consulted when the inputs run out
+    assert wallet.full_calls <= 3
+
+    with pytest.raises(exceptions.DustLimitError):
+        builder.add("1dust", 10)
+    with pytest.raises(exceptions.OverfullTransactionException) as e:
+        builder.add("1big", 10 ** 9)
+    assert e.value.args[0]['spendable_balance'] == 20 * 10 ** 7
+    assert len(builder) == 100
+    assert builder.subtotal == 100 * 100000
+
+    builder.remove("1payee0")
+    builder.remove("1payee1", 50000)
+    assert len(builder) == 99
+    assert builder.subtotal == 98 * 100000 + 50000
+    assert "1payee0" not in builder.addresses_and_amounts
+
+    for i in range(100):
+        builder.remove("1payee%d" % i)
+    assert len(builder) == 0
+    assert builder.total == 0
+    assert not builder.selected_utxos
+
+
+def test_pack_wallets():
+    small = _Wallet([10 ** 6] * 2, 1)
+    large = _Wallet([10 ** 7] * 2, 2)
+    payouts = [("1a", 500000), ("1b", 5 * 10 ** 6), ("1c", 300000), ("1d", 10 ** 7)]
+
+    builders, leftover = pack_wallets([small, large], payouts)
+    assert not leftover
+    # Everything fits in the large wallet, so the small one is unused
+    assert len(builders[0]) == 0
+    assert builders[1].subtotal == sum(a for _, a in payouts)
+    # ... and the payouts keep their order
+    assert list(builders[1].addresses_and_amounts.items()) == payouts
+
+    # Payouts that don't fit anywhere whole are split
+    builders, leftover = pack_wallets([small, large], [("1a", 20500000)])
+    assert not leftover
+    assert len(builders[0]) == 1 and len(builders[1]) == 1
+    assert builders[0].subtotal + builders[1].subtotal == 20500000
+
+    builders, leftover = pack_wallets([small], [("1a", 10 ** 8)])
+    assert leftover[0][0] == "1a"
+    assert builders[0].subtotal + leftover[0][1] == 10 ** 8
+
+    with pytest.raises(Exception):
+        pack_wallets([small, small], payouts)
+
+
+class _LegacyWallet(object):
+    """ A wallet with only get_utxos(), as BaseWallet implementations may be.
+    """
+    def __init__(self, values, seed):
+        self._wallet = _Wallet(values, seed)
+
+    def get_utxos(self, include_unconfirmed=False):
+        return {a: list(u) for a, u in self._wallet.index.items()}
+
+    def utxo_selector(self, *args, **kwargs):
+        return self._wallet.utxo_selector(*args, **kwargs)
+
+
+def test_wallet_without_utxo_index():
+    builder = TransactionBuilder(_LegacyWallet([10 ** 6] * 3, 1))
+    assert builder.spendable_balance == 3 * 10 ** 6
+
+    builder.add("1a", 2 * 10 ** 6)
+    assert builder.subtotal == 2 * 10 ** 6
+    with pytest.raises(exceptions.OverfullTransactionException):
+        builder.add("1b", 10 ** 6)
@@ -4,6 +4,7 @@ from pbkdf2 import PBKDF2
 import random
 import string
 import tempfile
+import time
 
 from crypto_two1.bitcoin.crypto import HDKey, HDPrivateKey
 from crypto_two1.bitcoin.utils import bytes_to_str
@@ -11,6 +12,7 @@ from crypto_two1.bitcoin.utils import rand_bytes
 from crypto_two1.blockchain.mock_provider import MockProvider
 from crypto_two1.wallet import exceptions
 from crypto_two1.wallet.two1_wallet import Two1Wallet
+from crypto_two1.wallet.wallet_txn import WalletTransaction
 
 enc_key_salt = b'\xaa\xbb\xcc\xdd'
 passphrase = "test_wallet"
@@ -306,3 +308,96 @@ def test_rest():
         acct = w2.accounts[0]
         assert acct.last_indices[0] == 0
         assert acct.last_indices[1] == 1
+
+
+def test_split_payouts():
+    m = mock_provider
+    m.hd_master_key = master
+    m.reset_mocks()
+
+    m.set_num_used_accounts(1)
+    m.set_num_used_addresses(account_index=0, n=1, change=0)
+    m.set_num_used_addresses(account_index=0, n=2, change=1)
+
+    m.set_txn_side_effect_for_hd_discovery()
+
+    # Only room for one input, one payout and change
+    wallet = Two1Wallet(params_or_file=config,
+                        data_provider=m,
+                        passphrase=passphrase,
+                        max_txn_size=250)
+
+    payouts = [("14ocdLGpBp7Yv3gsPDszishSJUv3cpLqUM", 7000),
+               ("1CEDwjjtYjCQUoRZQW9RUXHH5Ao7PWYKf", 8000),
+               ("14ocdLGpBp7Yv3gsPDszishSJUv3cpLqUM", 9000)]
+    txns = wallet.build_signed_transaction(payouts, use_unconfirmed=True, fees=1000)
+
+    assert len(txns) == 3
+    for txn, (_, amount) in zip(txns, payouts):
+        assert len(txn.inputs) == 1
+        assert amount in [o.value for o in txn.outputs]
+        assert txn.fees == 1000
+
+    # Later transactions spend the change of earlier ones
+    assert txns[1].inputs[0].outpoint == txns[0].hash
+    assert txns[2].inputs[0].outpoint == txns[1].hash
+
+    # The wallet's own UTXOs are reserved until broadcast
+    reserved = wallet.utxo_reservations.reserved()
+    assert (str(txns[0].inputs[0].outpoint), txns[0].inputs[0].outpoint_index) in reserved
+
+    # A payout that can't fit on its own
+    wallet.max_txn_size = 150
+    with pytest.raises(exceptions.TransactionTooLargeError):
+        wallet.build_signed_transaction(payouts[:1], use_unconfirmed=True)
+
+
+def test_broadcast_keeps_reservations(monkeypatch):
+    m = mock_provider
+    m.hd_master_key = master
+    m.reset_mocks()
+
+    m.set_num_used_accounts(1)
+    m.set_num_used_addresses(account_index=0, n=1, change=0)
+    m.set_num_used_addresses(account_index=0, n=2, change=1)
+
+    m.set_txn_side_effect_for_hd_discovery()
+
+    wallet = Two1Wallet(params_or_file=config,
+                        data_provider=m,
+                        passphrase=passphrase,
+                        max_txn_size=250)
+
+    payouts = [("14ocdLGpBp7Yv3gsPDszishSJUv3cpLqUM", 7000),
+               ("1CEDwjjtYjCQUoRZQW9RUXHH5Ao7PWYKf", 8000)]
+    txns = wallet.build_signed_transaction(payouts, use_unconfirmed=True, fees=1000)
+    assert len(txns) == 2
+
+    def broadcast(tx):
+        if tx is txns[1]:
+            raise exceptions.WalletError("rejected")
+        return str(tx.hash)
+
+    monkeypatch.setattr(m, "broadcast_transaction", broadcast, raising=False)
+    assert wallet.broadcast_transactions(txns) == [str(txns[0].hash)]
+
+    # The inputs of the broadcast transaction stay reserved until a
+    # sync shows them spent, those of the failed one are released.
+    outpoints = [(str(i.outpoint), i.outpoint_index) for i in txns[0].inputs]
+    assert wallet.utxo_reservations.reserved() == set(outpoints)
+
+    wallet._release_broadcast_reservations()
+    assert wallet.utxo_reservations.reserved() == set(outpoints)
+
+    wallet._cache_manager.insert_txn(WalletTransaction.from_transaction(txns[0]))
+    wallet._release_broadcast_reservations()
+    assert wallet.utxo_reservations.reserved() == set()
+
+    # Reservations of transactions that are never broadcast are
+    # forgotten once they expire
+    wallet.reservation_ttl = 0.05
+    txns = wallet.build_signed_transaction(payouts[:1], use_unconfirmed=True, fees=1000)
+    assert list(wallet._txn_reservations) == [str(txns[0].hash)]
+    time.sleep(0.1)
+    wallet._prune_reservations()
+    assert wallet._txn_reservations == {}
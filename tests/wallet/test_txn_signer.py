@@ -0,0 +1,85 @@
+import copy
+
+import pytest
+
+from crypto_two1.bitcoin import crypto
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import Transaction
+from crypto_two1.bitcoin.txn import TransactionInput
+from crypto_two1.bitcoin.txn import TransactionOutput
+from crypto_two1.wallet import txn_signer
+from crypto_two1.wallet.wallet_txn import WalletTransaction
+
+
+keys = [crypto.PrivateKey((i + 1) * 0x1234567890abcdef) for i in range(3)]
+hd_key = crypto.HDPrivateKey.master_key_from_entropy()[0]
+
+
+def _make_txn(num_inputs):
+    all_keys = keys + [hd_key]
+    inputs = []
+    to_sign = []
+    for i in range(num_inputs):
+        k = all_keys[i % len(all_keys)]
+        inputs.append(TransactionInput(Hash(bytes([i % 256, i // 256]) + bytes(30)),
+                                       i % 3, Script(""), 0xffffffff))
+        to_sign.append((i, k, Script.build_p2pkh(k.public_key.hash160(i % 2 == 0))))
+
+    outputs = [TransactionOutput(10000, Script.build_p2pkh(keys[0].public_key.hash160()))]
+    return WalletTransaction(Transaction.DEFAULT_TRANSACTION_VERSION,
+                             inputs, outputs, 0), to_sign
+
+
+@pytest.mark.parametrize("num_inputs, processes", [
+    (5, 1),
+    (txn_signer.PARALLEL_MIN_INPUTS + 3, 2),
+    ])
+def test_sign_inputs(num_inputs, processes):
+    txn, to_sign = _make_txn(num_inputs)
+    serial = copy.deepcopy(txn)
+    for i, k, s in to_sign:
+        serial.sign_input(i, Transaction.SIG_HASH_ALL, k, s)
+
+    assert txn_signer.sign_inputs(txn, to_sign, processes=processes)
+    assert bytes(txn) == bytes(serial)
+    assert txn.get_addresses() == Transaction.get_addresses(serial)
+
+    for i, _, s in to_sign:
+        assert txn.verify_input_signature(i, s)
+
+
+def test_sign_inputs_pool():
+    txn_signer.shutdown()
+    txn, to_sign = _make_txn(txn_signer.PARALLEL_MIN_INPUTS)
+    serial = copy.deepcopy(txn)
+    assert txn_signer.sign_inputs(serial, to_sign)
+    assert txn_signer._executor is None
+
+    # The pool is created once and kept until shut down
+    assert txn_signer.sign_inputs(txn, to_sign, processes=2)
+    executor = txn_signer._executor
+    assert executor is not None
+    assert txn_signer.sign_inputs(copy.deepcopy(txn), to_sign, processes=2)
+    assert txn_signer._executor is executor
+    assert bytes(txn) == bytes(serial)
+
+    txn_signer.shutdown()
+    assert txn_signer._executor is None
+
+
+def test_sign_inputs_wrong_key():
+    txn, to_sign = _make_txn(2)
+    i, _, s = to_sign[0]
+    with pytest.raises(ValueError):
+        txn_signer.sign_inputs(txn, [(i, keys[1], s)])
+    with pytest.raises(ValueError):
+        txn_signer.sign_inputs(txn, [(5, keys[0], s)])
+
+
+def test_sign_inputs_failure():
+    txn, to_sign = _make_txn(1)
+    redeem_script = Script.build_multisig_redeem(1, [bytes(keys[0].public_key), bytes(keys[1].public_key)])
+    txn.sign_input = lambda *args: False
+    with pytest.raises(ValueError):
+        txn_signer.sign_inputs(txn, [(0, keys[0], redeem_script)])
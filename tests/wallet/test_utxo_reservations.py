@@ -0,0 +1,155 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from crypto_two1.bitcoin.hash import Hash
+from crypto_two1.bitcoin.script import Script
+from crypto_two1.bitcoin.txn import UnspentTransactionOutput
+from crypto_two1.wallet import exceptions
+from crypto_two1.wallet.utxo_reservations import UtxoReservations
+from crypto_two1.wallet.utxo_selectors import UtxoIndex
+
+TXID = "a2972893f1be1f54d68a9228d9706ff8f202bb80f488f4dd46c0fe37c1e42415"
+
+
+def _reserve_in_child(db_path, outpoints, q):
+    r = UtxoReservations(db_path)
+    try:
+        r.reserve(outpoints)
+        q.put("reserved")
+    except exceptions.UtxoReservedError:
+        q.put("conflict")
+    finally:
+        r.close()
+
+
+def test_reserve_release():
+    r = UtxoReservations()
+    assert r.reserved() == set()
+
+    token = r.reserve([(TXID, 0), (TXID, 1)])
+    assert r.reserved() == {(TXID, 0), (TXID, 1)}
+
+    # Reserving is all or nothing
+    with pytest.raises(exceptions.UtxoReservedError):
+        r.reserve([(TXID, 2), (TXID, 1)])
+    assert r.reserved() == {(TXID, 0), (TXID, 1)}
+
+    token2 = r.reserve([(TXID, 2)])
+    r.release(token)
+    assert r.reserved() == {(TXID, 2)}
+    r.release(token)
+    r.release(token2)
+    assert r.reserved() == set()
+
+    r.reserve([(TXID, 0), (TXID, 1)])
+
+
+def test_reserve_duplicates():
+    r = UtxoReservations()
+    token = r.reserve([(TXID, 0), (TXID, 1), (TXID, 0)])
+    assert r.reserved() == {(TXID, 0), (TXID, 1)}
+    r.release(token)
+    assert r.reserved() == set()
+
+
+def test_expiry():
+    r = UtxoReservations()
+    r.reserve([(TXID, 0)], ttl=0.05)
+    with pytest.raises(exceptions.UtxoReservedError):
+        r.reserve([(TXID, 0)])
+
+    time.sleep(0.1)
+    assert r.reserved() == set()
+    r.reserve([(TXID, 0)])
+    assert r.reserved() == {(TXID, 0)}
+
+
+def test_reservation_context():
+    r = UtxoReservations()
+    with pytest.raises(ValueError):
+        with r.reservation([(TXID, 0)]):
+            assert r.reserved() == {(TXID, 0)}
+            raise ValueError()
+    assert r.reserved() == set()
+
+    with r.reservation([(TXID, 0)]) as token:
+        pass
+    assert r.reserved() == {(TXID, 0)}
+    r.release(token)
+    assert r.reserved() == set()
+
+
+def test_threads():
+    r = UtxoReservations()
+    results = []
+
+    def reserve():
+        try:
+            r.reserve([(TXID, i) for i in range(10)])
+            results.append(True)
+        except exceptions.UtxoReservedError:
+            results.append(False)
+
+    threads = [threading.Thread(target=reserve) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(results) == [False] * 7 + [True]
+
+
+def test_shared_file(tmpdir):
+    db_path = str(tmpdir.join("reservations.db"))
+    r1 = UtxoReservations(db_path)
+    r2 = UtxoReservations(db_path)
+
+    token = r1.reserve([(TXID, 0)])
+    assert r2.reserved() == {(TXID, 0)}
+    with pytest.raises(exceptions.UtxoReservedError):
+        r2.reserve([(TXID, 0)])
+
+    q = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_reserve_in_child,
+                                args=(db_path, [(TXID, 1), (TXID, 0)], q))
+    p.start()
+    p.join()
+    assert q.get() == "conflict"
+
+    r2.release(token)
+    p = multiprocessing.Process(target=_reserve_in_child,
+                                args=(db_path, [(TXID, 1), (TXID, 0)], q))
+    p.start()
+    p.join()
+    assert q.get() == "reserved"
+    assert r1.reserved() == {(TXID, 0), (TXID, 1)}
+
+    r1.close()
+    r2.close()
+
+
+def test_utxo_index_without():
+    utxos_by_addr = {}
+    for i in range(5):
+        utxos_by_addr["addr%d" % i] = [
+            UnspentTransactionOutput(transaction_hash=Hash(TXID),
+                                     outpoint_index=2 * i + j,
+                                     value=1000 * (2 * i + j + 1),
+                                     scr=Script(""),
+                                     confirmations=10)
+            for j in range(2)]
+    index = UtxoIndex.from_utxos_by_addr(utxos_by_addr)
+
+    assert index.without(set()) is index
+    assert index.without({(TXID, 100)}) is index
+
+    smaller = index.without({(TXID, 0), (TXID, 1), (TXID, 3)})
+    assert smaller.num_utxos == 7
+    assert smaller.total_value == index.total_value - 1000 - 2000 - 4000
+    assert "addr0" not in smaller
+    assert [u.outpoint_index for u in smaller["addr1"]] == [2]
+    # The original index is untouched
+    assert index.num_utxos == 10
@@ -3,6 +3,22 @@ import random
 from crypto_two1.bitcoin.txn import UnspentTransactionOutput
 from crypto_two1.bitcoin.hash import Hash
 from crypto_two1.bitcoin.script import Script
+from crypto_two1.wallet.fees import DUST_LIMIT
+from crypto_two1.wallet.fees import get_fee_estimator
+from crypto_two1.wallet.utxo_selectors import estimate_input_size
+from crypto_two1.wallet.utxo_selectors import estimate_output_size
+from crypto_two1.wallet.utxo_selectors import estimate_txn_size
+from crypto_two1.wallet.utxo_selectors import fee_for_size
+from crypto_two1.wallet.utxo_selectors import P2PKH_INPUT_SIZE
+from crypto_two1.wallet.utxo_selectors import P2PKH_OUTPUT_SIZE
+from crypto_two1.wallet.utxo_selectors import P2SH_MULTISIG_INPUT_SIZE
+from crypto_two1.wallet.utxo_selectors import P2SH_OUTPUT_SIZE
+from crypto_two1.wallet.utxo_selectors import TXN_OVERHEAD_SIZE
+from crypto_two1.wallet.utxo_selectors import UtxoIndex
+from crypto_two1.wallet.utxo_selectors import utxo_selector_best
+from crypto_two1.wallet.utxo_selectors import utxo_selector_branch_and_bound
+from crypto_two1.wallet.utxo_selectors import utxo_selector_knapsack
+from crypto_two1.wallet.utxo_selectors import utxo_selector_largest_first
 from crypto_two1.wallet.utxo_selectors import utxo_selector_smallest_first
 
 
@@ -53,3 +69,109 @@ def test_smallest_first():
 
     # Make sure that the largest of the selected is <= min(remaining)
     assert largest_selected <= min([u.value for u in remaining])
+
+
+def _make_utxos(values, scr=None):
+    scr = scr or Script.build_p2pkh(bytes(20))
+    utxos_by_addr = {}
+    for i, v in enumerate(values):
+        h = Hash(bytes([i % 256, i // 256]) + bytes(30))
+        addr = "addr%d" % (i % 7)
+        utxos_by_addr.setdefault(addr, []).append(
+            UnspentTransactionOutput(transaction_hash=h,
+                                     outpoint_index=i,
+                                     value=v,
+                                     scr=scr,
+                                     confirmations=10))
+    return utxos_by_addr
+
+
+def _selected_sum(selected):
+    return sum(u.value for utxos in selected.values() for u in utxos)
+
+
+def test_utxo_index():
+    random.seed(1)
+    values = [random.randint(1, 10 ** 8) for _ in range(2000)]
+    utxos_by_addr = _make_utxos(values)
+    index = UtxoIndex.from_utxos_by_addr(utxos_by_addr)
+
+    assert index.num_utxos == len(values)
+    assert index.total_value == sum(values)
+    assert set(index.keys()) == set(utxos_by_addr.keys())
+    assert [u.value for _, u in index.iter_utxos()] == sorted(values)
+    assert [u.value for _, u in index.iter_utxos(reverse=True)] == \
+        sorted(values, reverse=True)
+    assert [u.value for _, u in index.iter_utxos(min_value=10 ** 6, max_value=10 ** 7)] == \
+        sorted(v for v in values if 10 ** 6 <= v <= 10 ** 7)
+    assert [u.value for _, u in index.iter_utxos(True, 10 ** 6, 10 ** 7)] == \
+        sorted((v for v in values if 10 ** 6 <= v <= 10 ** 7), reverse=True)
+
+    for addr, utxos in list(utxos_by_addr.items()):
+        for u in utxos[::2]:
+            assert index.remove(addr, str(u.transaction_hash), u.outpoint_index) is u
+            values.remove(u.value)
+    assert index.remove("addr0", "00" * 32, 0) is None
+    assert [u.value for _, u in index.iter_utxos()] == sorted(values)
+    assert index.total_value == sum(values)
+
+
+def test_size_estimates():
+    p2pkh = Script.build_p2pkh(bytes(20))
+    p2sh = Script.build_p2sh(bytes(20))
+    assert estimate_input_size(p2pkh) == P2PKH_INPUT_SIZE
+    assert estimate_input_size(p2sh) == P2SH_MULTISIG_INPUT_SIZE
+    assert estimate_output_size(p2pkh) == P2PKH_OUTPUT_SIZE
+    assert estimate_output_size(p2sh) == P2SH_OUTPUT_SIZE
+    assert estimate_txn_size([p2pkh, p2sh], 1, [p2sh]) == \
+        TXN_OVERHEAD_SIZE + P2PKH_INPUT_SIZE + P2SH_MULTISIG_INPUT_SIZE + \
+        P2PKH_OUTPUT_SIZE + P2SH_OUTPUT_SIZE
+
+
+def test_size_based_selectors():
+    random.seed(2)
+    values = [random.randint(10000, 10 ** 7) for _ in range(5000)]
+    utxos_by_addr = _make_utxos(values)
+    index = UtxoIndex.from_utxos_by_addr(utxos_by_addr)
+
+    # An exact match needs no change
+    amount = 5 * 10 ** 6
+    selected, fee = utxo_selector_branch_and_bound(index, amount, 1, fees=10000)
+    assert selected
+    assert 0 <= _selected_sum(selected) - amount - fee <= DUST_LIMIT
+
+    for selector in [utxo_selector_branch_and_bound, utxo_selector_knapsack,
+                     utxo_selector_largest_first, utxo_selector_best]:
+        for amount in [50000, 3 * 10 ** 6, 2 * 10 ** 8]:
+            selected, fee = selector(utxos_by_addr, amount, 2)
+            if selected:
+                assert _selected_sum(selected) >= amount + fee
+                num_inputs = sum(len(u) for u in selected.values())
+                # The wallet adds change if more than DUST_LIMIT is left
+                num_outputs = 3 if _selected_sum(selected) - amount - fee > DUST_LIMIT else 2
+                assert fee >= fee_for_size(TXN_OVERHEAD_SIZE + num_outputs * P2PKH_OUTPUT_SIZE +
+                                           num_inputs * P2PKH_INPUT_SIZE,
+                                           get_fee_estimator().get_fee_per_kb())
+            elif selector is not utxo_selector_branch_and_bound:
+                assert amount > sum(values)
+
+    # Change too small to pay for its own output goes to the fee
+    fee_per_kb = get_fee_estimator().get_fee_per_kb()
+    base_fee = fee_for_size(TXN_OVERHEAD_SIZE + P2PKH_OUTPUT_SIZE, fee_per_kb) + \
+        fee_for_size(P2PKH_INPUT_SIZE, fee_per_kb)
+    change_fee = fee_for_size(P2PKH_OUTPUT_SIZE, fee_per_kb)
+    for leftover, expected_fee in [(DUST_LIMIT + change_fee // 2, base_fee + DUST_LIMIT + change_fee // 2),
+                                   (DUST_LIMIT + 2 * change_fee, base_fee + change_fee)]:
+        value = 100000 + base_fee + leftover
+        selected, fee = utxo_selector_largest_first(_make_utxos([value]), 100000, 1)
+        assert _selected_sum(selected) == value
+        assert fee == expected_fee
+
+    # Largest first uses as few inputs as possible
+    selected, fee = utxo_selector_largest_first(index, 25 * 10 ** 6, 1, fees=0)
+    assert sum(len(u) for u in selected.values()) == 3
+    assert not utxo_selector_largest_first(index, sum(values) + 1, 1, fees=0)[0]
+
+    # Legacy selectors accept an index too
+    selected, fee = utxo_selector_smallest_first(index, 100000, 1)
+    assert _selected_sum(selected) >= 100000 + fee